@@ -0,0 +1,29 @@
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from services.metrics_service import mongo_metrics_listener
+from services.tracing import mongo_trace_listener
+from services.slow_query_log import slow_query_listener
+import os
+
+# Shared Motor client for the whole process. Command listeners can only be attached
+# when the client is created, so every instrumentation hook is registered here.
+_client = None
+
+EVENT_LISTENERS = [mongo_metrics_listener, mongo_trace_listener, slow_query_listener]
+
+
+def get_client() -> AsyncIOMotorClient:
+    global _client
+    if _client is None:
+        _client = AsyncIOMotorClient(os.environ['MONGO_URL'], event_listeners=EVENT_LISTENERS)
+    return _client
+
+
+def get_db() -> AsyncIOMotorDatabase:
+    return get_client()[os.environ['DB_NAME']]
+
+
+def close_client():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
@@ -0,0 +1,28 @@
+from dotenv import load_dotenv
+from pathlib import Path
+import argparse
+import asyncio
+import json
+
+ROOT_DIR = Path(__file__).parent
+# Load before importing service modules, which read their settings at import time
+load_dotenv(ROOT_DIR / '.env')
+
+from database import get_db, close_client
+from services.snapshot_service import export_snapshot, SNAPSHOT_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the catalog to a snapshot file for read-only serving")
+    parser.add_argument("--out", default=SNAPSHOT_PATH, help="Snapshot path (default: SNAPSHOT_PATH)")
+    parser.add_argument("--top-k", type=int, default=20, help="Similar titles kept per title")
+    args = parser.parse_args()
+    try:
+        summary = asyncio.run(export_snapshot(get_db(), args.out, args.top_k))
+    finally:
+        close_client()
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+from typing import List, Optional, Tuple
+from services.cache import TTLCache, MISSING
+import gzip
+import hashlib
+import os
+
+try:
+    import brotli
+except ImportError:  # brotli is optional: without it only gzip is offered
+    brotli = None
+
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "true").lower() == "true"
+# Bodies smaller than this cost more to compress than they save on the wire
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", 5))
+COMPRESSIBLE_TYPES = (b"application/json", b"text/", b"application/javascript", b"image/svg+xml")
+
+# Compressed bodies keyed by (encoding, body digest): identical payloads from the row
+# caches are compressed once rather than once per request. ETags aren't used as keys:
+# they are only unique per resource, not across paths
+compressed_bodies = TTLCache(
+    "compressed_bodies",
+    maxsize=int(os.environ.get("COMPRESSED_BODY_CACHE_SIZE", 256)),
+    ttl=float(os.environ.get("COMPRESSED_BODY_CACHE_TTL", 600))
+)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Preferred encoding we support from an Accept-Encoding header (q=0 excludes)"""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        name, _, value = params.strip().partition("=")
+        try:
+            if name.strip() == "q" and float(value) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compressed_body(body: bytes, encoding: str) -> bytes:
+    key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+    cached = compressed_bodies.get(key)
+    if cached is not MISSING:
+        return cached
+    data = compress(body, encoding)
+    compressed_bodies.set(key, data)
+    return data
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware compressing JSON/text responses with brotli or gzip.
+
+    Only single-message bodies of at least COMPRESSION_MIN_SIZE bytes are compressed;
+    streamed responses (image files) and already encoded ones pass through untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = negotiate_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        state = {"start": None, "passthrough": False}
+
+        async def send_wrapper(message):
+            if state["passthrough"]:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                state["start"] = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            start = state["start"]
+            headers: List[Tuple[bytes, bytes]] = list(start.get("headers", []))
+            body = message.get("body", b"")
+            if message.get("more_body", False) or not self._compressible(headers, body):
+                state["passthrough"] = True
+                await send(start)
+                await send(message)
+                return
+
+            data = compressed_body(body, encoding)
+            vary = [value for name, value in headers if name == b"vary"] + [b"Accept-Encoding"]
+            headers = [(name, value) for name, value in headers if name not in (b"content-length", b"vary")]
+            headers += [
+                (b"content-encoding", encoding.encode("latin-1")),
+                (b"content-length", str(len(data)).encode("latin-1")),
+                (b"vary", b", ".join(vary)),
+            ]
+            await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": data})
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _compressible(headers: List[Tuple[bytes, bytes]], body: bytes) -> bool:
+        if len(body) < COMPRESSION_MIN_SIZE:
+            return False
+        content_type = b""
+        for name, value in headers:
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type":
+                content_type = value
+        return content_type.startswith(COMPRESSIBLE_TYPES)
@@ -0,0 +1,34 @@
+from services.metrics_service import http_request_duration, http_requests_in_flight
+import time
+
+
+class PrometheusMiddleware:
+    """Pure ASGI middleware recording request latency by route template and status"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc(method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec(method)
+            # The router stores the matched route on the scope, giving a bounded label set
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "<unmatched>"
+            http_request_duration.observe(method, route_label, str(status_holder["status"]),
+                                          value=time.perf_counter() - started)
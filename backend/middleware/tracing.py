@@ -0,0 +1,88 @@
+from fastapi.routing import APIRoute
+from services.tracing import current_trace, start_trace, end_trace, trace_sampler
+import functools
+import hmac
+import os
+import time
+
+SERVER_TIMING_ENABLED = os.environ.get("SERVER_TIMING_ENABLED", "true").lower() == "true"
+
+
+def _forced_sample(headers) -> bool:
+    """X-Trace-Sample: 1 together with the debug token (never without a DEBUG_TOKEN)"""
+    expected = os.environ.get("DEBUG_TOKEN")
+    if not expected:
+        return False
+    values = {name: value for name, value in headers}
+    token = values.get(b"x-debug-token", b"")
+    return values.get(b"x-trace-sample") == b"1" and hmac.compare_digest(token, expected.encode("latin-1"))
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware opening a request trace and emitting a Server-Timing header.
+
+    Sending `X-Trace-Sample: 1` with a valid `X-Debug-Token` forces the trace to be
+    written to the JSON lines log; without the token the header is ignored, so clients
+    can't make every request write to disk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SERVER_TIMING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        forced = _forced_sample(scope.get("headers", []))
+        trace, token = start_trace(scope["method"], scope["path"], trace_sampler.should_sample(forced))
+        state = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                total = time.perf_counter() - trace.start
+                # Whatever remains after the endpoint returned is response validation and encoding
+                endpoint_end = trace.endpoint_end
+                if endpoint_end is not None:
+                    trace.add("serialize", "response", endpoint_end, time.perf_counter() - endpoint_end)
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing(total).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end_trace(token)
+            if trace.sampled:
+                route = scope.get("route")
+                trace.route = getattr(route, "path", None)
+                trace_sampler.submit(trace.to_dict(state["status"], time.perf_counter() - trace.start))
+
+
+def _traced_endpoint(endpoint):
+    # include_router rebuilds routes from the already wrapped endpoint
+    if getattr(endpoint, "__traced__", False):
+        return endpoint
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        trace = current_trace()
+        if trace is None:
+            return await endpoint(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            trace.endpoint_end = time.perf_counter()
+            trace.add("endpoint", endpoint.__name__, started, trace.endpoint_end - started)
+    wrapper.__traced__ = True
+    return wrapper
+
+
+class TracedRoute(APIRoute):
+    """APIRoute recording the endpoint call as a span, separating it from serialisation"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _traced_endpoint(endpoint), **kwargs)
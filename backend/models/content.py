@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional, Union
 from datetime import datetime
 import uuid
 
@@ -22,9 +22,13 @@ class ContentBase(BaseModel):
     trailer_url: Optional[str] = None
     rating: Optional[str] = None
     seasons: Optional[str] = None
+    certification: Optional[str] = None
+    kids_safe: bool = False
 
 class Content(ContentBase):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    # Lowercased title, for the indexed prefix match of search-as-you-type
+    title_lower: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -56,4 +60,34 @@ class ContentResponse(BaseModel):
     trailerUrl: Optional[str] = None
     tmdb_id: int
     vote_average: float
-    popularity: float
\ No newline at end of file
+    popularity: float
+
+class ContentRef(BaseModel):
+    type: Literal["movie", "tv", "series"] = Field(..., description="movie, tv or series")
+    tmdb_id: int
+
+# Upper bound on ids per batch lookup, keeping the $in query and response bounded
+CONTENT_BATCH_MAX = 500
+
+class ContentBatchRequest(BaseModel):
+    ids: List[Union[str, ContentRef]] = Field(..., max_length=CONTENT_BATCH_MAX, description="Content UUIDs or (type, tmdb_id) pairs")
+
+class ContentBatchItem(BaseModel):
+    ref: Union[str, ContentRef]
+    found: bool
+    content: Optional[ContentResponse] = None
+
+class ContentBatchResponse(BaseModel):
+    results: List[ContentBatchItem]
+    missing: int = 0
+
+class ContentFacetCount(BaseModel):
+    value: Union[int, str]
+    count: int
+
+class ContentBrowseResponse(BaseModel):
+    total: int
+    page: int
+    page_size: int
+    results: List[ContentResponse]
+    facets: Dict[str, List[ContentFacetCount]] = {}
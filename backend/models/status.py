@@ -0,0 +1,26 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime
+import uuid
+
+class StatusCheck(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    client_name: str
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+
+class StatusCheckCreate(BaseModel):
+    client_name: str
+
+class StatusRollup(BaseModel):
+    client_name: str
+    minute: datetime
+    count: int
+
+class StatusRollupResponse(BaseModel):
+    since: datetime
+    until: datetime
+    buckets: List[StatusRollup]
+
+class StatusCheckPage(BaseModel):
+    items: List[StatusCheck]
+    next_cursor: Optional[str] = None
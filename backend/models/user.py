@@ -61,4 +61,24 @@ class ViewingProgressUpdate(BaseModel):
     current_episode: Optional[str] = None
     season_number: Optional[int] = None
     episode_number: Optional[int] = None
-    time_left: Optional[str] = None
\ No newline at end of file
+    time_left: Optional[str] = None
+
+class WatchEvent(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    profile_id: str
+    content_id: str
+    tmdb_id: int
+    content_type: str
+    progress: Optional[float] = None
+    current_episode: Optional[str] = None
+    season_number: Optional[int] = None
+    episode_number: Optional[int] = None
+    time_left: Optional[str] = None
+    # Wall-clock seconds credited to this event for the daily watch-time rollup
+    watch_seconds: float = 0
+    watched_at: datetime = Field(default_factory=datetime.utcnow)
+
+class WatchTimeDay(BaseModel):
+    date: str
+    watch_seconds: float
+    events: int
@@ -1,68 +1,159 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
-from typing import List, Optional, Dict
-from services.content_service import ContentService
+from fastapi import APIRouter, HTTPException, Depends, Query, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from typing import Any, List, Optional, Dict
+from services.content_service import ContentService, DEFAULT_GENRE_ROWS, GENRE_ROW_IDS
+from services.catalog_index import catalog_index, SORT_FIELDS
 from services.tmdb_service import tmdb_service
-from models.content import ContentResponse
+from services.fieldsets import resolve_fields, select_fields
+from services.live_search import LiveSearchSession
+from services.snapshot_service import catalog_snapshot, SnapshotContentService, SNAPSHOT_MODE
+from models.content import ContentResponse, ContentBatchRequest, ContentBatchResponse, ContentBatchItem, ContentBrowseResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
-import os
-from motor.motor_asyncio import AsyncIOMotorClient
+from database import get_db
+from middleware.tracing import TracedRoute
 
-router = APIRouter(prefix="/content", tags=["content"])
+router = APIRouter(prefix="/content", tags=["content"], route_class=TracedRoute)
 
 # Database dependency
 async def get_database() -> AsyncIOMotorDatabase:
-    mongo_url = os.environ['MONGO_URL']
-    client = AsyncIOMotorClient(mongo_url)
-    return client[os.environ['DB_NAME']]
+    return get_db()
 
 async def get_content_service() -> ContentService:
+    if SNAPSHOT_MODE:
+        return SnapshotContentService(catalog_snapshot)
     db = await get_database()
     return ContentService(db)
 
+# Sparse fieldset dependency shared by every content-returning endpoint
+async def get_fields(
+    fields: Optional[str] = Query(None, description="Comma-separated response fields, e.g. id,title,image,type"),
+    view: Optional[str] = Query(None, description="Named projection: card, hero or full")
+) -> Optional[List[str]]:
+    try:
+        return resolve_fields(fields, view)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def parse_genres(value: Optional[str]) -> Optional[List[int]]:
+    """Comma-separated TMDB genre ids and/or genre row names (e.g. 28,comedy)"""
+    if not value:
+        return None
+    genre_ids = []
+    for token in (token.strip().lower() for token in value.split(",")):
+        if token.isdigit():
+            genre_ids.append(int(token))
+        elif token in GENRE_ROW_IDS:
+            genre_ids.append(GENRE_ROW_IDS[token])
+        elif token:
+            raise HTTPException(status_code=400, detail=f"Unknown genre: {token}")
+    return genre_ids
+
+# Browse filter dependency: validated keyword arguments for CatalogIndex.browse
+async def get_browse_filters(
+    type: Optional[str] = Query(None, description="movie, tv or series"),
+    genres: Optional[str] = Query(None, description="Comma-separated genre ids or names"),
+    genre_mode: str = Query("all", description="all: every listed genre, any: at least one"),
+    exclude_genres: Optional[str] = Query(None, description="Comma-separated genre ids or names to leave out"),
+    year_min: Optional[int] = Query(None, ge=1800, le=2200),
+    year_max: Optional[int] = Query(None, ge=1800, le=2200),
+    rating_min: Optional[float] = Query(None, ge=0, le=10, description="Minimum TMDB vote average"),
+    language: Optional[str] = Query(None, description="Comma-separated original language codes, e.g. en,ja"),
+    sort: str = Query("popularity", description="popularity, rating or year"),
+    order: str = Query("desc", description="asc or desc")
+) -> Dict[str, Any]:
+    if type not in (None, "movie", "tv", "series"):
+        raise HTTPException(status_code=400, detail=f"Unknown type: {type}")
+    if genre_mode not in ("all", "any"):
+        raise HTTPException(status_code=400, detail=f"Unknown genre_mode: {genre_mode}")
+    if sort not in SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort: {sort}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail=f"Unknown order: {order}")
+    return dict(
+        content_type="tv" if type == "series" else type,
+        genres=parse_genres(genres),
+        genre_mode=genre_mode,
+        exclude_genres=parse_genres(exclude_genres),
+        year_min=year_min,
+        year_max=year_max,
+        rating_min=rating_min,
+        languages=[code.strip() for code in language.split(",") if code.strip()] if language else None,
+        sort=sort,
+        descending=order == "desc",
+    )
+
+def content_response(content: Any, fields: Optional[List[str]]) -> Any:
+    """Full content goes through response_model; partial content is serialised as-is"""
+    if fields is None:
+        return content
+    return JSONResponse(jsonable_encoder(select_fields(content, fields)))
+
 @router.get("/featured", response_model=Optional[ContentResponse])
-async def get_featured_content(content_service: ContentService = Depends(get_content_service)):
+async def get_featured_content(
+    profile_id: Optional[str] = Query(None, description="Pick a kids-safe title for kids profiles"),
+    fields: Optional[List[str]] = Depends(get_fields),
+    content_service: ContentService = Depends(get_content_service)
+):
     """Get featured content for hero section"""
     try:
         content = await content_service.get_featured_content()
+        if content and profile_id:
+            content = next(iter(await content_service.apply_profile_row(profile_id, [content], rerank=False)), None)
         if not content:
             raise HTTPException(status_code=404, detail="No featured content found")
-        return content
+        return content_response(content, fields)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting featured content: {str(e)}")
 
 @router.get("/trending", response_model=List[ContentResponse])
-async def get_trending_content(content_service: ContentService = Depends(get_content_service)):
+async def get_trending_content(
+    profile_id: Optional[str] = Query(None, description="Personalize the row for this profile"),
+    fields: Optional[List[str]] = Depends(get_fields),
+    content_service: ContentService = Depends(get_content_service)
+):
     """Get trending movies and TV shows"""
     try:
         content = await content_service.get_trending_content()
-        return content
+        content = await content_service.apply_profile_row(profile_id, content)
+        return content_response(content, fields)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting trending content: {str(e)}")
 
 @router.get("/popular", response_model=List[ContentResponse])
-async def get_popular_content(content_service: ContentService = Depends(get_content_service)):
+async def get_popular_content(
+    profile_id: Optional[str] = Query(None, description="Personalize the row for this profile"),
+    fields: Optional[List[str]] = Depends(get_fields),
+    content_service: ContentService = Depends(get_content_service)
+):
     """Get popular movies and TV shows"""
     try:
         content = await content_service.get_popular_content()
-        return content
+        content = await content_service.apply_profile_row(profile_id, content)
+        return content_response(content, fields)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting popular content: {str(e)}")
 
 @router.get("/genre/{genre_name}", response_model=List[ContentResponse])
 async def get_content_by_genre(
     genre_name: str,
+    profile_id: Optional[str] = Query(None, description="Personalize the row for this profile"),
+    fields: Optional[List[str]] = Depends(get_fields),
     content_service: ContentService = Depends(get_content_service)
 ):
     """Get content by genre"""
     try:
         content = await content_service.get_content_by_genre(genre_name)
-        return content
+        content = await content_service.apply_profile_row(profile_id, content)
+        return content_response(content, fields)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting content by genre: {str(e)}")
 
 @router.get("/search", response_model=List[ContentResponse])
 async def search_content(
     q: str = Query(..., description="Search query"),
+    profile_id: Optional[str] = Query(None, description="Only kids-safe results for kids profiles"),
+    fields: Optional[List[str]] = Depends(get_fields),
     content_service: ContentService = Depends(get_content_service)
 ):
     """Search for movies and TV shows"""
@@ -71,26 +162,117 @@ async def search_content(
             return []
         
         content = await content_service.search_content(q)
-        return content
+        content = await content_service.apply_profile_row(profile_id, content, rerank=False, fill=False)
+        return content_response(content, fields)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error searching content: {str(e)}")
 
+@router.websocket("/search/live")
+async def live_search(websocket: WebSocket, content_service: ContentService = Depends(get_content_service)):
+    """Search-as-you-type: send {"q", "profile_id"?, "fields"?, "view"?} per change, receive local then TMDB results"""
+    await websocket.accept()
+    session = LiveSearchSession(content_service, websocket.send_json)
+    try:
+        while True:
+            try:
+                message = await websocket.receive_json()
+            except ValueError:
+                message = None
+            if not isinstance(message, dict) or not isinstance(message.get("q"), str):
+                await websocket.send_json({"stage": "error", "detail": "Expected a JSON object with a string 'q'"})
+                continue
+            try:
+                fields = resolve_fields(message.get("fields"), message.get("view"))
+            except ValueError as e:
+                await websocket.send_json({"q": message["q"], "stage": "error", "detail": str(e)})
+                continue
+            session.update(message["q"], message.get("profile_id"), fields)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await session.close()
+
+@router.post("/batch", response_model=ContentBatchResponse)
+async def get_content_batch(
+    request: ContentBatchRequest,
+    fields: Optional[List[str]] = Depends(get_fields),
+    content_service: ContentService = Depends(get_content_service)
+):
+    """Get many content items by id or (type, tmdb_id) in one lookup"""
+    try:
+        contents = await content_service.get_content_batch(request.ids, fields=fields)
+        if fields is not None:
+            results = [
+                {"ref": ref, "found": content is not None, "content": content}
+                for ref, content in zip(request.ids, contents)
+            ]
+            return JSONResponse(jsonable_encoder({"results": results, "missing": contents.count(None)}))
+        results = [
+            ContentBatchItem(ref=ref, found=content is not None, content=content)
+            for ref, content in zip(request.ids, contents)
+        ]
+        return ContentBatchResponse(results=results, missing=sum(not item.found for item in results))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting content batch: {str(e)}")
+
+@router.get("/browse", response_model=ContentBrowseResponse)
+async def browse_content(
+    filters: Dict[str, Any] = Depends(get_browse_filters),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    facets: bool = Query(True, description="Include genre, type, language and decade counts"),
+    profile_id: Optional[str] = Query(None, description="Only kids-safe results for kids profiles"),
+    fields: Optional[List[str]] = Depends(get_fields),
+    content_service: ContentService = Depends(get_content_service)
+):
+    """Filter, sort and page the stored catalog, with facet counts over all matches"""
+    if not catalog_index.loaded:
+        # Before the first sync every filter would match nothing
+        raise HTTPException(status_code=503, detail="Catalog index is still loading")
+    try:
+        result = await content_service.browse(page, page_size, profile_id, fields, facets, **filters)
+        if fields is not None:
+            return JSONResponse(jsonable_encoder(result))
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error browsing content: {str(e)}")
+
 @router.get("/{content_id}", response_model=Optional[ContentResponse])
 async def get_content_details(
     content_id: str,
+    fields: Optional[List[str]] = Depends(get_fields),
     content_service: ContentService = Depends(get_content_service)
 ):
     """Get detailed content information"""
     try:
-        content = await content_service.get_content_details(content_id)
+        content = await content_service.get_content_details(content_id, fields)
         if not content:
             raise HTTPException(status_code=404, detail="Content not found")
-        return content
+        return content_response(content, fields)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting content details: {str(e)}")
 
+@router.get("/{content_id}/similar", response_model=List[ContentResponse])
+async def get_similar_content(
+    content_id: str,
+    limit: int = Query(20, ge=1, le=50),
+    profile_id: Optional[str] = Query(None, description="Only kids-safe results for kids profiles"),
+    fields: Optional[List[str]] = Depends(get_fields),
+    content_service: ContentService = Depends(get_content_service)
+):
+    """Get content similar to a title ("More like this")"""
+    try:
+        content = await content_service.get_similar_content(content_id, limit, profile_id, fields)
+        return content_response(content, fields)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting similar content: {str(e)}")
+
 @router.get("/categories/all", response_model=Dict[str, List[ContentResponse]])
-async def get_all_categories(content_service: ContentService = Depends(get_content_service)):
+async def get_all_categories(
+    profile_id: Optional[str] = Query(None, description="Personalize every row for this profile"),
+    fields: Optional[List[str]] = Depends(get_fields),
+    content_service: ContentService = Depends(get_content_service)
+):
     """Get all content categories"""
     try:
         categories = {}
@@ -98,11 +280,12 @@ async def get_all_categories(content_service: ContentService = Depends(get_conte
         # Get different categories
         categories["trending"] = await content_service.get_trending_content()
         categories["popular"] = await content_service.get_popular_content()
-        categories["action"] = await content_service.get_content_by_genre("action")
-        categories["horror"] = await content_service.get_content_by_genre("horror")
-        categories["comedy"] = await content_service.get_content_by_genre("comedy")
-        categories["drama"] = await content_service.get_content_by_genre("drama")
+        for genre_name in DEFAULT_GENRE_ROWS:
+            categories[genre_name] = await content_service.get_content_by_genre(genre_name)
+        categories = await content_service.apply_profile(profile_id, categories)
         
+        if fields is not None:
+            return JSONResponse(jsonable_encoder({name: select_fields(row, fields) for name, row in categories.items()}))
         return categories
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting categories: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,76 @@
+from fastapi import APIRouter, HTTPException, Depends, Header, Query
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from services.slow_query_log import slow_query_listener
+from services.profiler import event_loop_profiler, ProfilerBusyError, MAX_PROFILE_SECONDS
+from services.task_queue import task_queue
+from database import get_db
+import hmac
+import os
+
+# Only mounted when DEBUG_ENDPOINTS_ENABLED=true, and every request needs an
+# X-Debug-Token header matching DEBUG_TOKEN; without a DEBUG_TOKEN they all get 403.
+DEBUG_ENDPOINTS_ENABLED = os.environ.get("DEBUG_ENDPOINTS_ENABLED", "false").lower() == "true"
+
+async def require_debug_token(x_debug_token: Optional[str] = Header(None)):
+    expected = os.environ.get("DEBUG_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=403, detail="Debug endpoints need DEBUG_TOKEN to be configured")
+    if not x_debug_token or not hmac.compare_digest(x_debug_token.encode(), expected.encode()):
+        raise HTTPException(status_code=403, detail="Invalid debug token")
+
+router = APIRouter(prefix="/debug", tags=["debug"], dependencies=[Depends(require_debug_token)])
+
+SLOW_QUERY_SORT_FIELDS = {"total_ms", "max_ms", "avg_ms", "count", "slow_count", "max_per_request"}
+
+@router.get("/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(20, ge=1, le=500),
+    sort_by: str = Query("total_ms", description="total_ms, max_ms, avg_ms, count, slow_count or max_per_request")
+):
+    """Top Mongo query shapes by cumulative or worst-case latency"""
+    if sort_by not in SLOW_QUERY_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"sort_by must be one of {sorted(SLOW_QUERY_SORT_FIELDS)}")
+    return {
+        "threshold_ms": slow_query_listener.threshold_ms,
+        "shapes": slow_query_listener.top(limit, sort_by),
+    }
+
+@router.delete("/slow-queries")
+async def reset_slow_queries():
+    """Clear the aggregated query shape statistics"""
+    slow_query_listener.reset()
+    return {"message": "Slow query statistics reset"}
+
+PSTATS_SORT_FIELDS = {"cumulative", "tottime", "ncalls", "pcalls", "filename", "name"}
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile_worker(
+    seconds: float = Query(10, gt=0, le=MAX_PROFILE_SECONDS),
+    format: str = Query("pstats", description="pstats or collapsed"),
+    sort: str = Query("cumulative", description="pstats sort key"),
+    limit: int = Query(50, ge=1, le=1000),
+    interval_ms: float = Query(5, ge=1, le=1000, description="Sampling interval for collapsed stacks"),
+    all_threads: bool = Query(False, description="Also sample executor threads (collapsed only)")
+):
+    """Profile this worker's event loop for a fixed window"""
+    if format not in ("pstats", "collapsed"):
+        raise HTTPException(status_code=400, detail="format must be pstats or collapsed")
+    if sort not in PSTATS_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {sorted(PSTATS_SORT_FIELDS)}")
+    try:
+        if format == "collapsed":
+            output = await event_loop_profiler.profile_collapsed(seconds, interval_ms, all_threads)
+        else:
+            output = await event_loop_profiler.profile_pstats(seconds, sort, limit)
+        return PlainTextResponse(output)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/tasks")
+async def get_task_queues():
+    """Task queue depth by status, oldest due task and this worker's wait/run latencies"""
+    try:
+        return await task_queue.stats(get_db())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching task queue stats: {str(e)}")
@@ -0,0 +1,36 @@
+from email.utils import formatdate
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from services.image_service import image_service, ImageNotFoundError
+from middleware.tracing import TracedRoute
+import mimetypes
+
+router = APIRouter(prefix="/images", tags=["images"], route_class=TracedRoute)
+
+# Variant files never change for a given URL, so clients and CDNs may keep them forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+CHUNK_SIZE = 64 * 1024
+
+@router.get("/{size}/{path}")
+async def get_image(size: str, path: str):
+    """Serve a locally cached (and resized) TMDB image"""
+    try:
+        # Streamed from the open file: cache pruning may unlink the path meanwhile
+        file, stat_result = await image_service.open_variant(size, path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ImageNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found")
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Error fetching image: {str(e)}")
+    return StreamingResponse(
+        iter(lambda: file.read(CHUNK_SIZE), b""),
+        media_type=mimetypes.guess_type(path)[0] or "application/octet-stream",
+        headers={
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+            "Content-Length": str(stat_result.st_size),
+            "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        },
+        background=BackgroundTask(file.close)
+    )
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from services.metrics_service import registry
+
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text exposition of request, TMDB, Mongo and cache metrics"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
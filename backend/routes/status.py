@@ -0,0 +1,40 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+from models.status import StatusCheck, StatusCheckCreate, StatusRollupResponse, StatusCheckPage
+from services.status_service import status_service
+from database import get_db
+from middleware.tracing import TracedRoute
+
+router = APIRouter(prefix="/status", tags=["status"], route_class=TracedRoute)
+
+@router.post("", response_model=StatusCheck)
+async def create_status_check(input: StatusCheckCreate):
+    """Record a status check (written in the next batch)"""
+    status_obj = StatusCheck(**input.dict())
+    await status_service.record(get_db(), status_obj)
+    return status_obj
+
+@router.get("", response_model=StatusRollupResponse)
+async def get_status_rollups(
+    minutes: int = Query(60, ge=1, le=1440, description="Window ending now"),
+    client_name: Optional[str] = Query(None)
+):
+    """Status checks per client per minute"""
+    try:
+        return await status_service.get_rollups(get_db(), minutes, client_name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting status rollups: {str(e)}")
+
+@router.get("/raw", response_model=StatusCheckPage)
+async def get_status_checks(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    client_name: Optional[str] = Query(None)
+):
+    """Raw status checks, newest first, cursor-paginated"""
+    try:
+        return await status_service.get_page(get_db(), limit, cursor, client_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting status checks: {str(e)}")
@@ -1,20 +1,19 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import List, Optional
 from services.user_service import UserService
 from services.content_service import ContentService
-from models.user import UserProfile, UserProfileCreate, MyListItemCreate, ViewingProgressCreate, ViewingProgressUpdate
+from models.user import UserProfile, UserProfileCreate, MyListItemCreate, ViewingProgressCreate, ViewingProgressUpdate, WatchTimeDay
 from models.content import ContentResponse
+from routes.content import get_fields, content_response
 from motor.motor_asyncio import AsyncIOMotorDatabase
-import os
-from motor.motor_asyncio import AsyncIOMotorClient
+from database import get_db
+from middleware.tracing import TracedRoute
 
-router = APIRouter(prefix="/users", tags=["users"])
+router = APIRouter(prefix="/users", tags=["users"], route_class=TracedRoute)
 
 # Database dependency
 async def get_database() -> AsyncIOMotorDatabase:
-    mongo_url = os.environ['MONGO_URL']
-    client = AsyncIOMotorClient(mongo_url)
-    return client[os.environ['DB_NAME']]
+    return get_db()
 
 async def get_user_service() -> UserService:
     db = await get_database()
@@ -50,12 +49,13 @@ async def create_user_profile(
 @router.get("/{profile_id}/my-list", response_model=List[ContentResponse])
 async def get_my_list(
     profile_id: str,
+    fields: Optional[List[str]] = Depends(get_fields),
     user_service: UserService = Depends(get_user_service)
 ):
     """Get user's my list"""
     try:
-        my_list = await user_service.get_my_list(profile_id)
-        return my_list
+        my_list = await user_service.get_my_list(profile_id, fields)
+        return content_response(my_list, fields)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting my list: {str(e)}")
 
@@ -92,15 +92,30 @@ async def remove_from_my_list(
 @router.get("/{profile_id}/continue-watching", response_model=List[ContentResponse])
 async def get_continue_watching(
     profile_id: str,
+    fields: Optional[List[str]] = Depends(get_fields),
     user_service: UserService = Depends(get_user_service)
 ):
     """Get continue watching list with progress"""
     try:
-        continue_watching = await user_service.get_continue_watching(profile_id)
-        return continue_watching
+        continue_watching = await user_service.get_continue_watching(profile_id, fields)
+        return content_response(continue_watching, fields)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting continue watching: {str(e)}")
 
+@router.get("/{profile_id}/recommendations", response_model=List[ContentResponse])
+async def get_recommendations(
+    profile_id: str,
+    limit: int = Query(20, ge=1, le=100),
+    fields: Optional[List[str]] = Depends(get_fields),
+    user_service: UserService = Depends(get_user_service)
+):
+    """Get "because you watched" recommendations"""
+    try:
+        recommendations = await user_service.get_recommendations(profile_id, limit, fields)
+        return content_response(recommendations, fields)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting recommendations: {str(e)}")
+
 @router.post("/{profile_id}/progress")
 async def create_viewing_progress(
     profile_id: str,
@@ -130,4 +145,16 @@ async def update_viewing_progress(
             raise HTTPException(status_code=400, detail="Failed to update viewing progress")
         return {"message": "Viewing progress updated successfully"}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error updating viewing progress: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error updating viewing progress: {str(e)}")
+
+@router.get("/{profile_id}/watch-time", response_model=List[WatchTimeDay])
+async def get_watch_time(
+    profile_id: str,
+    days: int = Query(30, ge=1, le=366),
+    user_service: UserService = Depends(get_user_service)
+):
+    """Get daily watch time"""
+    try:
+        return await user_service.get_watch_time(profile_id, days)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting watch time: {str(e)}")
\ No newline at end of file
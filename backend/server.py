@@ -1,26 +1,47 @@
 from fastapi import FastAPI, APIRouter
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List
-import uuid
-from datetime import datetime
-
-# Import route modules
-from routes.content import router as content_router
-from routes.users import router as users_router
 
 ROOT_DIR = Path(__file__).parent
+# Load before importing route/service modules, which read their settings at import time
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Import route modules
+from routes.content import router as content_router
+from routes.users import router as users_router
+from routes.metrics import router as metrics_router
+from routes.images import router as images_router
+from routes.status import router as status_router
+from routes.debug import router as debug_router, DEBUG_ENDPOINTS_ENABLED
+from middleware.metrics import PrometheusMiddleware
+from middleware.tracing import TracingMiddleware
+from middleware.compression import CompressionMiddleware
+from database import get_client, get_db, close_client
+from services.tmdb_service import tmdb_service
+from services.warmup_service import warmup_service
+from services.content_service import ContentService
+from services.cache import configure_l2_cache
+from services.recommendation_service import recommendation_service
+from services.similarity_service import similarity_service
+from services.kids_service import kids_service
+from services.image_service import image_service
+from services.invalidation_service import invalidation_service
+from services.refresh_service import refresh_service
+from services.status_service import status_service
+from services.watch_event_service import watch_event_service
+from services.task_queue import task_queue
+from services.catalog_index import catalog_index
+from services.snapshot_service import catalog_snapshot, SNAPSHOT_MODE, SNAPSHOT_PATH
+
+# MongoDB connection (shared, instrumented client); none when serving a snapshot
+client = None if SNAPSHOT_MODE else get_client()
+db = None if SNAPSHOT_MODE else get_db()
 
 # Create the main app without a prefix
 app = FastAPI(title="Netflix Clone API", version="1.0.0")
@@ -29,15 +50,6 @@ app = FastAPI(title="Netflix Clone API", version="1.0.0")
 api_router = APIRouter(prefix="/api")
 
 
-# Define Models
-class StatusCheck(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    client_name: str
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
-
-class StatusCheckCreate(BaseModel):
-    client_name: str
-
 # Health check routes
 @api_router.get("/")
 async def root():
@@ -47,21 +59,50 @@ async def root():
 async def health_check():
     return {"status": "healthy", "message": "Netflix Clone API is operational"}
 
-@api_router.post("/status", response_model=StatusCheck)
-async def create_status_check(input: StatusCheckCreate):
-    status_dict = input.dict()
-    status_obj = StatusCheck(**status_dict)
-    _ = await db.status_checks.insert_one(status_obj.dict())
-    return status_obj
-
-@api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+@api_router.get("/health/live")
+async def liveness_check():
+    """Process is up and serving; says nothing about dependencies"""
+    return {"status": "alive"}
+
+@api_router.get("/health/ready")
+async def readiness_check():
+    """Ready for traffic: Mongo answers, warm-up finished and the TMDB breaker isn't open"""
+    if SNAPSHOT_MODE:
+        ready = catalog_snapshot.loaded
+        return JSONResponse(
+            status_code=200 if ready else 503,
+            content={"status": "ready" if ready else "not_ready",
+                     "checks": {"snapshot": {"ok": ready, "path": catalog_snapshot.path, **catalog_snapshot.meta}}}
+        )
+    checks = {}
+    try:
+        await asyncio.wait_for(db.command("ping"), timeout=float(os.environ.get("READINESS_PING_TIMEOUT", 2)))
+        checks["mongo"] = {"ok": True}
+    except Exception as e:
+        checks["mongo"] = {"ok": False, "error": str(e) or type(e).__name__}
+
+    warmup = warmup_service.status()
+    checks["warmup"] = {"ok": warmup["completed"], **warmup}
+
+    breaker = tmdb_service.breaker.to_dict()
+    checks["tmdb"] = {"ok": breaker["state"] != "open", **breaker}
+
+    ready = all(check["ok"] for check in checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content=jsonable_encoder({"status": "ready" if ready else "not_ready", "checks": checks})
+    )
 
 # Include content and user routes
 api_router.include_router(content_router)
-api_router.include_router(users_router)
+api_router.include_router(metrics_router)
+api_router.include_router(images_router)
+# Profiles and status checks live in Mongo: not served from a snapshot
+if not SNAPSHOT_MODE:
+    api_router.include_router(users_router)
+    api_router.include_router(status_router)
+if DEBUG_ENDPOINTS_ENABLED:
+    api_router.include_router(debug_router)
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -74,6 +115,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip/brotli for large JSON rows; inside tracing so Server-Timing covers it
+app.add_middleware(CompressionMiddleware)
+
+# Request-scoped tracing and Server-Timing summary
+app.add_middleware(TracingMiddleware)
+
+# Outermost so latency covers every other middleware
+app.add_middleware(PrometheusMiddleware)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -81,6 +131,48 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def warm_caches():
+    if SNAPSHOT_MODE:
+        # Read-only replica: no Mongo, no background jobs; fail fast without a snapshot
+        catalog_snapshot.load(SNAPSHOT_PATH)
+        catalog_index.load_snapshot(catalog_snapshot)
+        return
+    try:
+        await configure_l2_cache(db)
+    except Exception as e:
+        # Workers still serve from their own L1 caches without the shared tier
+        logger.error(f"Error configuring shared cache: {str(e)}")
+    try:
+        await ContentService(db).ensure_indexes()
+    except Exception as e:
+        logger.error(f"Error creating content indexes: {str(e)}")
+    warmup_service.start(db)
+    recommendation_service.start(db)
+    similarity_service.start(db)
+    kids_service.start(db)
+    invalidation_service.start(db)
+    refresh_service.start(db)
+    status_service.start(db)
+    watch_event_service.start(db)
+    catalog_index.start(db)
+    # Started last: the services above register their task handlers
+    task_queue.start(db)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    if SNAPSHOT_MODE:
+        catalog_snapshot.close()
+        image_service.shutdown()
+        return
+    # Drain first, while the services running tasks still have their resources
+    await task_queue.stop()
+    await warmup_service.stop()
+    await recommendation_service.stop()
+    await kids_service.stop()
+    await invalidation_service.stop()
+    await status_service.stop()
+    await watch_event_service.stop()
+    await catalog_index.stop()
+    image_service.shutdown()
+    close_client()
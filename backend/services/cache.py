@@ -0,0 +1,311 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from services.metrics_service import record_cache
+import asyncio
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Distinguishes "not cached" from a cached None
+MISSING = object()
+
+
+class TTLCache:
+    """Per-process LRU cache with a per-entry time-to-live"""
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 300.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                record_cache(self.name, True)
+                return value
+            del self._entries[key]
+        record_cache(self.name, False)
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self._entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> bool:
+        return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        self._entries.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[1] > time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "size": len(self._entries), "maxsize": self.maxsize, "ttl": self.ttl}
+
+
+# Bump to invalidate every shared (L2) entry written by older deployments
+CACHE_VERSION = os.environ.get("CACHE_VERSION", "1")
+L2_CACHE_ENABLED = os.environ.get("L2_CACHE_ENABLED", "true").lower() == "true"
+# How long a worker may hold the "I'm fetching this key" lease, and how long
+# other workers wait for it to publish before fetching themselves
+LEASE_SECONDS = float(os.environ.get("CACHE_LEASE_SECONDS", 10))
+LEASE_WAIT_SECONDS = float(os.environ.get("CACHE_LEASE_WAIT_SECONDS", 2))
+LEASE_POLL_SECONDS = 0.05
+
+_l2_collection = None
+_versions_collection = None
+
+# Namespace -> snapshot version, part of every L2 key; bumped when the data behind a
+# namespace changes so all workers stop reading (and writing) the previous entries
+_namespace_versions: Dict[str, int] = {}
+_caches: Dict[str, "TwoTierCache"] = {}
+
+
+async def configure_l2_cache(db: AsyncIOMotorDatabase):
+    """Point every TwoTierCache at the shared Mongo collection (called on startup)"""
+    global _l2_collection, _versions_collection
+    _versions_collection = db.cache_versions
+    try:
+        async for doc in _versions_collection.find({}):
+            _namespace_versions[doc["_id"]] = max(_namespace_versions.get(doc["_id"], 0), doc["version"])
+    except Exception as e:
+        logger.error(f"Error loading cache namespace versions: {str(e)}")
+    if not L2_CACHE_ENABLED:
+        return
+    collection = db.cache_entries
+    # Mongo's TTL monitor removes entries once expires_at has passed
+    await collection.create_index("expires_at", expireAfterSeconds=0)
+    await collection.create_index("namespace")
+    _l2_collection = collection
+
+
+def namespace_version(namespace: str) -> int:
+    return _namespace_versions.get(namespace, 0)
+
+
+async def bump_namespace_version(namespace: str, version: int):
+    """Move a namespace to a newer snapshot version and drop this worker's L1 entries.
+
+    Versions come from change event cluster times, so every worker seeing the same
+    event computes the same version and the shared `$max` write is idempotent.
+    """
+    if version <= namespace_version(namespace):
+        return
+    _namespace_versions[namespace] = version
+    cache = _caches.get(namespace)
+    if cache is not None:
+        cache.l1.clear()
+    if _versions_collection is None:
+        return
+    try:
+        await _versions_collection.update_one({"_id": namespace}, {"$max": {"version": version}}, upsert=True)
+    except DuplicateKeyError:
+        # Another worker upserted the same namespace first
+        await _versions_collection.update_one({"_id": namespace}, {"$max": {"version": version}})
+    except Exception as e:
+        logger.error(f"Error publishing {namespace} cache version: {str(e)}")
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+class TwoTierCache:
+    """Per-process L1 LRU in front of a Mongo TTL collection shared by every worker.
+
+    Keys are versioned as `<CACHE_VERSION>:<namespace>:<namespace version>:<key>`, so
+    bumping CACHE_VERSION or the namespace version orphans old entries (they expire
+    through the TTL index). `get_or_load`
+    coalesces concurrent misses inside the process and takes a short Mongo lease so only
+    one worker in the fleet calls the loader for a key per TTL.
+    """
+
+    def __init__(self, namespace: str, maxsize: int = 1024, ttl: float = 300.0,
+                 encode: Callable[[Any], Any] = _identity, decode: Callable[[Any], Any] = _identity,
+                 l1_ttl: Optional[float] = None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.l1 = TTLCache(namespace, maxsize=maxsize, ttl=l1_ttl if l1_ttl is not None else ttl)
+        self.encode = encode
+        self.decode = decode
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        _caches[namespace] = self
+
+    @property
+    def l2(self):
+        return _l2_collection
+
+    @property
+    def version(self) -> int:
+        return namespace_version(self.namespace)
+
+    def l2_key(self, key: Hashable) -> str:
+        return f"{CACHE_VERSION}:{self.namespace}:{self.version}:{key}"
+
+    def _remember(self, key: Hashable, value: Any, expires_at: datetime):
+        remaining = (expires_at - datetime.utcnow()).total_seconds()
+        if remaining > 0:
+            self.l1.set(key, value, ttl=min(self.l1.ttl, remaining))
+
+    async def get(self, key: Hashable) -> Any:
+        value = self.l1.get(key)
+        if value is not MISSING or self.l2 is None:
+            return value
+        return (await self.get_many([key])).get(key, MISSING)
+
+    async def get_many(self, keys: List[Hashable]) -> Dict[Hashable, Any]:
+        """Resolve keys from L1, then the remaining ones with a single L2 query"""
+        found: Dict[Hashable, Any] = {}
+        missing: Dict[str, Hashable] = {}
+        for key in keys:
+            value = self.l1.get(key)
+            if value is not MISSING:
+                found[key] = value
+            else:
+                missing[self.l2_key(key)] = key
+        if not missing or self.l2 is None:
+            return found
+
+        try:
+            docs = await self.l2.find(
+                {"_id": {"$in": list(missing)}, "expires_at": {"$gt": datetime.utcnow()}}
+            ).to_list(len(missing))
+        except Exception as e:
+            logger.error(f"Error reading {self.namespace} L2 cache: {str(e)}")
+            return found
+
+        for doc in docs:
+            key = missing[doc["_id"]]
+            value = self.decode(doc["value"])
+            self._remember(key, value, doc["expires_at"])
+            found[key] = value
+        for _ in docs:
+            record_cache(f"{self.namespace}_l2", True)
+        for _ in range(len(missing) - len(docs)):
+            record_cache(f"{self.namespace}_l2", False)
+        return found
+
+    async def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        await self.set_many({key: value}, ttl=ttl)
+
+    async def set_many(self, items: Dict[Hashable, Any], ttl: Optional[float] = None):
+        """Write entries to L1 and upsert them into L2 with one bulk write"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+        for key, value in items.items():
+            self.l1.set(key, value, ttl=min(self.l1.ttl, ttl))
+        if self.l2 is None or not items:
+            return
+        try:
+            await self.l2.bulk_write([
+                UpdateOne(
+                    {"_id": self.l2_key(key)},
+                    {"$set": {"value": self.encode(value), "expires_at": expires_at, "namespace": self.namespace}},
+                    upsert=True
+                )
+                for key, value in items.items()
+            ], ordered=False)
+        except Exception as e:
+            logger.error(f"Error writing {self.namespace} L2 cache: {str(e)}")
+
+    def invalidate(self, key: Hashable) -> bool:
+        """Drop a key from this worker's L1 only"""
+        return self.l1.invalidate(key)
+
+    async def delete(self, key: Hashable):
+        """Drop a key from L1 and the shared L2"""
+        self.l1.invalidate(key)
+        if self.l2 is not None:
+            await self.l2.delete_one({"_id": self.l2_key(key)})
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value or run `loader` once (per process and, via a lease, per fleet).
+
+        `None` results are returned but not cached.
+        """
+        value = await self.get(key)
+        if value is not MISSING:
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._inflight.get(key) is done and self._inflight.pop(key))
+        # Shielded so one cancelled caller doesn't cancel the load for the others
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # The last caller gave up (e.g. a superseded live search): stop the load too
+            if self._waiters[key] == 1:
+                task.cancel()
+                # Later callers start a fresh load instead of awaiting the cancelled one
+                if self._inflight.get(key) is task:
+                    del self._inflight[key]
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        lease_id = None
+        if self.l2 is not None:
+            lease_id = f"lease:{self.l2_key(key)}"
+            if not await self._acquire_lease(lease_id):
+                lease_id = None
+                deadline = time.monotonic() + LEASE_WAIT_SECONDS
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(LEASE_POLL_SECONDS)
+                    value = (await self.get_many([key])).get(key, MISSING)
+                    if value is not MISSING:
+                        return value
+                # The lease holder is slow or gone; fetch ourselves
+
+        try:
+            version = self.version
+            value = await loader()
+            # A value loaded across a version bump may predate the change; serve it once
+            if value is not None and self.version == version:
+                await self.set(key, value)
+            return value
+        finally:
+            if lease_id is not None:
+                try:
+                    await self.l2.delete_one({"_id": lease_id})
+                except Exception as e:
+                    logger.error(f"Error releasing cache lease: {str(e)}")
+
+    async def _acquire_lease(self, lease_id: str) -> bool:
+        now = datetime.utcnow()
+        try:
+            await self.l2.insert_one({"_id": lease_id, "expires_at": now + timedelta(seconds=LEASE_SECONDS)})
+            return True
+        except DuplicateKeyError:
+            # The TTL monitor only runs every minute, so clear a lapsed lease ourselves
+            result = await self.l2.delete_one({"_id": lease_id, "expires_at": {"$lte": now}})
+            if result.deleted_count:
+                return await self._acquire_lease(lease_id)
+            return False
+        except Exception as e:
+            logger.error(f"Error acquiring cache lease: {str(e)}")
+            return True
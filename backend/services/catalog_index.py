@@ -0,0 +1,349 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import numpy as np
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+CATALOG_INDEX_ENABLED = os.environ.get("CATALOG_INDEX_ENABLED", "true").lower() == "true"
+# Poll for content changed by other workers (or without a change stream) this often
+CATALOG_SYNC_INTERVAL = float(os.environ.get("CATALOG_SYNC_INTERVAL", 5))
+# Each poll re-reads this much history: updated_at comes from each worker's clock, and
+# a write can commit after a poll has already passed its timestamp
+CATALOG_SYNC_OVERLAP_SECONDS = float(os.environ.get("CATALOG_SYNC_OVERLAP_SECONDS", 30))
+# Deletes only reach the index through change streams; this often it also drops every
+# title whose id is gone from `content`
+CATALOG_RECONCILE_SECONDS = float(os.environ.get("CATALOG_RECONCILE_SECONDS", 300))
+CATALOG_SYNC_BATCH = 5000
+INITIAL_CAPACITY = 1024
+# Genre ids get a bit each in order of first appearance; TMDB has fewer than 30
+MAX_GENRE_BITS = 64
+
+CONTENT_TYPES = ["movie", "tv"]
+SORT_FIELDS = {"popularity", "rating", "year"}
+INDEX_PROJECTION = {
+    "_id": 1, "id": 1, "title": 1, "overview": 1, "poster_path": 1, "backdrop_path": 1, "logo_path": 1,
+    "content_type": 1, "tmdb_id": 1, "genre_ids": 1, "genre_names": 1, "release_date": 1,
+    "first_air_date": 1, "vote_average": 1, "popularity": 1, "original_language": 1, "rating": 1,
+    "seasons": 1, "trailer_url": 1, "kids_safe": 1, "updated_at": 1,
+}
+
+
+class CatalogRecord:
+    """String and list fields of one title, for building responses"""
+
+    __slots__ = ("id", "title", "overview", "poster_path", "backdrop_path", "logo_path", "content_type",
+                 "tmdb_id", "genre_names", "release_date", "first_air_date", "vote_average", "popularity",
+                 "rating", "seasons", "trailer_url")
+
+    def __init__(self, doc: Dict[str, Any]):
+        for field in self.__slots__:
+            setattr(self, field, doc.get(field))
+
+    def document(self) -> Dict[str, Any]:
+        doc = {field: getattr(self, field) for field in self.__slots__}
+        if doc["genre_names"] is None:
+            del doc["genre_names"]
+        return doc
+
+
+def content_year(doc: Dict[str, Any]) -> int:
+    date = doc.get("release_date") or doc.get("first_air_date")
+    if date and len(date) >= 4 and date[:4].isdigit():
+        return int(date[:4])
+    return 0
+
+
+class CatalogIndex:
+    """Every `content` row in columns for filtered, sorted and faceted browsing.
+
+    Numerics live in NumPy arrays (grown by doubling), genres in one uint64 bitset per
+    title, and strings in `__slots__` records that are only read for the page being
+    returned. Filters are evaluated as boolean masks over the whole catalog. Loaded at
+    startup, then kept current by a poll on `updated_at` plus upserts from local
+    inserts and change-stream events. Deleted titles stay in place as tombstones
+    (`alive` False), found by change-stream delete events and a periodic id reconcile.
+    From a snapshot, columns are built from its record arrays and records are decoded
+    from it only when a page needs them.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.records: Dict[int, CatalogRecord] = {}
+        self.languages: List[str] = []
+        self.genre_bits: Dict[int, int] = {}
+        self.watermark: Optional[datetime] = None
+        self.reconciled_at: Optional[datetime] = None
+        self.loaded = False
+        self._rows: Dict[str, int] = {}
+        self._object_ids: Dict[Any, str] = {}
+        self._language_codes: Dict[str, int] = {}
+        self._snapshot: Any = None
+        self._task: Optional[asyncio.Task] = None
+        self._allocate(INITIAL_CAPACITY)
+
+    def _allocate(self, capacity: int):
+        size = self.size
+
+        def grow(name: str, dtype: Any) -> np.ndarray:
+            array = np.zeros(capacity, dtype=dtype)
+            if hasattr(self, name):
+                array[:size] = getattr(self, name)[:size]
+            return array
+
+        self.year = grow("year", np.int16)
+        self.vote_average = grow("vote_average", np.float32)
+        self.popularity = grow("popularity", np.float32)
+        self.content_type = grow("content_type", np.uint8)
+        self.language = grow("language", np.uint16)
+        self.kids_safe = grow("kids_safe", np.bool_)
+        self.genres = grow("genres", np.uint64)
+        self.alive = grow("alive", np.bool_)
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.alive[:self.size]))
+
+    def _row_of(self, content_id: str) -> Optional[int]:
+        row = self._rows.get(content_id)
+        if row is None and self._snapshot is not None:
+            row = self._snapshot.rows_by_id([content_id])[0]
+        return row
+
+    def record(self, row: int) -> CatalogRecord:
+        record = self.records.get(row)
+        if record is None:
+            record = self.records[row] = CatalogRecord(self._snapshot.document(row))
+        return record
+
+    def _language_code(self, language: Optional[str]) -> int:
+        language = language or "unknown"
+        if language not in self._language_codes:
+            self._language_codes[language] = len(self.languages)
+            self.languages.append(language)
+        return self._language_codes[language]
+
+    def genre_mask(self, genre_ids: Iterable[int]) -> int:
+        mask = 0
+        for genre_id in genre_ids or []:
+            bit = self.genre_bits.get(genre_id)
+            if bit is None:
+                if len(self.genre_bits) >= MAX_GENRE_BITS:
+                    continue
+                bit = self.genre_bits[genre_id] = len(self.genre_bits)
+            mask |= 1 << bit
+        return mask
+
+    def upsert(self, doc: Dict[str, Any]):
+        """Add or replace one content document (missing fields keep their defaults)"""
+        if not doc.get("id"):
+            return
+        row = self._row_of(doc["id"])
+        if row is None:
+            row = self.size
+            if row == len(self.year):
+                self._allocate(len(self.year) * 2)
+            self.size += 1
+            self._rows[doc["id"]] = row
+        if doc.get("_id") is not None:
+            self._object_ids[doc["_id"]] = doc["id"]
+        self.records[row] = CatalogRecord(doc)
+        self.alive[row] = True
+        self.year[row] = content_year(doc)
+        self.vote_average[row] = doc.get("vote_average") or 0
+        self.popularity[row] = doc.get("popularity") or 0
+        self.content_type[row] = CONTENT_TYPES.index(doc.get("content_type") or "movie")
+        self.language[row] = self._language_code(doc.get("original_language"))
+        self.kids_safe[row] = bool(doc.get("kids_safe"))
+        self.genres[row] = self.genre_mask(doc.get("genre_ids"))
+
+    def remove(self, content_id: str) -> bool:
+        """Tombstone a deleted title; False if it isn't in the index"""
+        row = self._row_of(content_id)
+        if row is None or not self.alive[row]:
+            return False
+        self.alive[row] = False
+        self.records.pop(row, None)
+        return True
+
+    def remove_object(self, object_id: Any) -> bool:
+        """Tombstone a title by its Mongo `_id` (all a delete event carries)"""
+        content_id = self._object_ids.pop(object_id, None)
+        return self.remove(content_id) if content_id else False
+
+    def load(self, docs: Iterable[Dict[str, Any]]):
+        for doc in docs:
+            self.upsert(doc)
+
+    def load_snapshot(self, snapshot: Any):
+        """Build the columns of an empty index from a CatalogSnapshot's record arrays,
+        without decoding its documents (they are decoded per page, see `record`)"""
+        records = snapshot.records
+        size = len(records)
+        self._allocate(max(size, INITIAL_CAPACITY))
+        self.size = size
+        self._snapshot = snapshot
+        self.year[:size] = snapshot.years()
+        self.vote_average[:size] = records["vote_average"]
+        self.popularity[:size] = records["popularity"]
+        self.content_type[:size] = records["content_type"]
+        self.kids_safe[:size] = records["kids_safe"]
+        self.alive[:size] = True
+
+        codes, languages = snapshot.dictionary("original_language")
+        mapping = np.array([self._language_code(language) for language in languages], dtype=np.uint16)
+        self.language[:size] = mapping[codes] if len(mapping) else 0
+
+        rows, genre_ids = snapshot.id_lists("genre_ids")
+        # Bits in order of first appearance, as upsert assigns them
+        unique, first = np.unique(genre_ids, return_index=True)
+        for genre_id in unique[np.argsort(first, kind="stable")]:
+            self.genre_mask([int(genre_id)])
+        bits = np.array([1 << self.genre_bits[int(genre_id)] if int(genre_id) in self.genre_bits else 0
+                         for genre_id in unique], dtype=np.uint64)
+        if len(rows):
+            np.bitwise_or.at(self.genres, rows, bits[np.searchsorted(unique, genre_ids)])
+        self.loaded = True
+
+    def start(self, db: AsyncIOMotorDatabase):
+        if not CATALOG_INDEX_ENABLED or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run_forever(db))
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run_forever(self, db: AsyncIOMotorDatabase):
+        try:
+            await db.content.create_index([("updated_at", 1)])
+        except Exception as e:
+            logger.error(f"Error creating catalog index indexes: {str(e)}")
+        while True:
+            try:
+                synced = await self.sync(db)
+                if synced and not self.loaded:
+                    logger.info(f"Catalog index loaded {len(self)} titles")
+                self.loaded = True
+                if self.reconciled_at is None or datetime.utcnow() - self.reconciled_at >= timedelta(seconds=CATALOG_RECONCILE_SECONDS):
+                    removed = await self.reconcile(db)
+                    if removed:
+                        logger.info(f"Catalog index removed {removed} deleted titles")
+            except Exception as e:
+                logger.error(f"Error syncing catalog index: {str(e)}")
+            await asyncio.sleep(CATALOG_SYNC_INTERVAL)
+
+    async def reconcile(self, db: AsyncIOMotorDatabase) -> int:
+        """Tombstone titles no longer in `content` (deletes a poll on updated_at can't see)"""
+        # Set first so a failing scan waits for the next interval instead of the next poll
+        self.reconciled_at = datetime.utcnow()
+        # A cursor rather than distinct(): the id list of a large catalog exceeds 16MB
+        stored = set()
+        async for doc in db.content.find({}, {"_id": 0, "id": 1}).batch_size(CATALOG_SYNC_BATCH):
+            stored.add(doc.get("id"))
+        removed = [content_id for content_id, row in self._rows.items() if self.alive[row] and content_id not in stored]
+        for content_id in removed:
+            self.remove(content_id)
+        return len(removed)
+
+    async def sync(self, db: AsyncIOMotorDatabase) -> int:
+        """Apply content changed since the last poll (everything on the first call)"""
+        synced = 0
+        since = self.watermark - timedelta(seconds=CATALOG_SYNC_OVERLAP_SECONDS) if self.watermark else None
+        query: Dict[str, Any] = {"updated_at": {"$gte": since}} if since else {}
+        while True:
+            docs = await db.content.find(query, INDEX_PROJECTION).sort([("updated_at", 1), ("id", 1)]).to_list(CATALOG_SYNC_BATCH)
+            self.load(docs)
+            synced += len(docs)
+            if not docs:
+                break
+            last = docs[-1]
+            if last.get("updated_at") and (self.watermark is None or last["updated_at"] > self.watermark):
+                self.watermark = last["updated_at"]
+            if len(docs) < CATALOG_SYNC_BATCH:
+                break
+            # Keyset paging on (updated_at, id): many documents can share one timestamp
+            query = {"$or": [
+                {"updated_at": {"$gt": last.get("updated_at")}},
+                {"updated_at": last.get("updated_at"), "id": {"$gt": last["id"]}},
+            ]}
+        return synced
+
+    def browse(self, content_type: Optional[str] = None, genres: Optional[List[int]] = None,
+               genre_mode: str = "all", exclude_genres: Optional[List[int]] = None,
+               year_min: Optional[int] = None, year_max: Optional[int] = None,
+               rating_min: Optional[float] = None, languages: Optional[List[str]] = None,
+               kids_only: bool = False, sort: str = "popularity", descending: bool = True,
+               offset: int = 0, limit: int = 20, facets: bool = True) -> Dict[str, Any]:
+        """Matching records for one page, the total and facet counts over all matches"""
+        size = self.size
+        mask = self.alive[:size].copy()
+        if content_type:
+            mask &= self.content_type[:size] == CONTENT_TYPES.index(content_type)
+        if genres:
+            if any(genre_id not in self.genre_bits for genre_id in genres) and genre_mode == "all":
+                mask[:] = False
+            wanted = np.uint64(self.genre_mask([genre_id for genre_id in genres if genre_id in self.genre_bits]))
+            matched = self.genres[:size] & wanted
+            mask &= (matched == wanted) if genre_mode == "all" else (matched != 0)
+        if exclude_genres:
+            excluded = np.uint64(self.genre_mask([genre_id for genre_id in exclude_genres if genre_id in self.genre_bits]))
+            mask &= (self.genres[:size] & excluded) == 0
+        if year_min is not None:
+            mask &= self.year[:size] >= year_min
+        if year_max is not None:
+            mask &= (self.year[:size] <= year_max) & (self.year[:size] > 0)
+        if rating_min is not None:
+            mask &= self.vote_average[:size] >= rating_min
+        if languages:
+            codes = [self._language_codes[language] for language in languages if language in self._language_codes]
+            mask &= np.isin(self.language[:size], codes)
+        if kids_only:
+            mask &= self.kids_safe[:size]
+
+        rows = np.flatnonzero(mask)
+        column = {"popularity": self.popularity, "rating": self.vote_average, "year": self.year}[sort][rows]
+        keys = -column.astype(np.float64) if descending else column.astype(np.float64)
+        end = min(offset + limit, len(rows))
+        if end <= offset:
+            page = rows[:0]
+        elif end < len(rows):
+            # Only the rows up to the page end need ordering
+            top = np.argpartition(keys, end - 1)[:end]
+            page = rows[top[np.argsort(keys[top], kind="stable")]][offset:end]
+        else:
+            page = rows[np.argsort(keys, kind="stable")][offset:end]
+
+        result = {"total": int(len(rows)), "records": [self.record(int(row)) for row in page]}
+        if facets:
+            result["facets"] = self._facets(rows)
+        return result
+
+    def _facets(self, rows: np.ndarray) -> Dict[str, List[Tuple[Any, int]]]:
+        # One AND + count per known genre bit beats unpacking all 64 bits of every row
+        genres = self.genres[rows]
+        genre_counts = {bit: np.count_nonzero(genres & np.uint64(1 << bit)) for bit in self.genre_bits.values()}
+        type_counts = np.bincount(self.content_type[rows], minlength=len(CONTENT_TYPES))
+        language_counts = np.bincount(self.language[rows], minlength=len(self.languages))
+        years = self.year[rows]
+        decades = np.bincount(years[years > 0] // 10)
+
+        def ranked(pairs: Iterable[Tuple[Any, int]]) -> List[Tuple[Any, int]]:
+            return sorted(((value, int(count)) for value, count in pairs if count), key=lambda pair: -pair[1])
+
+        return {
+            "genres": ranked((genre_id, genre_counts[bit]) for genre_id, bit in self.genre_bits.items()),
+            "type": ranked(("series" if name == "tv" else name, type_counts[code]) for code, name in enumerate(CONTENT_TYPES)),
+            "language": ranked((language, language_counts[code]) for code, language in enumerate(self.languages)),
+            "decade": sorted((decade * 10, int(count)) for decade, count in enumerate(decades) if count),
+        }
+
+
+# Global instance
+catalog_index = CatalogIndex()
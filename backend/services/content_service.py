@@ -1,17 +1,139 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set, Union
+from datetime import datetime
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from services.tmdb_service import tmdb_service
-from models.content import Content, ContentCreate, ContentResponse
+from models.content import Content, ContentCreate, ContentResponse, ContentRef
+from pymongo import UpdateOne
+from services.tracing import traced
+from services.cache import TwoTierCache, MISSING
+from services.similarity_service import similarity_service
+from services.personalization_service import personalization_service
+from services.kids_service import kids_service, is_kids_safe
+from services.image_service import image_service, IMAGE_PROXY_ENABLED, TMDB_SIZES
+from services.fieldsets import mongo_projection
+from services.task_queue import task_queue
+from services.catalog_index import catalog_index
 import logging
-import asyncio
+import os
+import re
+import uuid
 
 logger = logging.getLogger(__name__)
 
+# Genre rows shown on the home page (and prefetched by the startup warm-up)
+DEFAULT_GENRE_ROWS = ["action", "horror", "comedy", "drama"]
+
+# TMDB genre ids of the genre rows served by name (common genres)
+GENRE_ROW_IDS = {
+    "action": 28,
+    "adventure": 12,
+    "comedy": 35,
+    "drama": 18,
+    "horror": 27,
+    "thriller": 53,
+    "sci-fi": 878,
+    "fantasy": 14,
+    "crime": 80,
+    "mystery": 9648,
+    "romance": 10749,
+    "family": 10751
+}
+
+# Rows for kids profiles are filtered to kids-safe content and topped up to this size
+KIDS_MIN_ROW_SIZE = int(os.environ.get("KIDS_MIN_ROW_SIZE", 10))
+KIDS_ROW_SIZE = 40
+TITLE_BACKFILL_BATCH = 1000
+# Content ids are derived from (type, tmdb_id), so a TMDB hit shown before it is
+# stored keeps its id once it is
+CONTENT_ID_NAMESPACE = uuid.UUID("5b6c1f1e-8f4a-4d1e-9a8e-3c0a7d2f6b41")
+
+def content_id(content_type: str, tmdb_id: int) -> str:
+    return str(uuid.uuid5(CONTENT_ID_NAMESPACE, f"{content_type}:{tmdb_id}"))
+
+def _encode_row(value: Any) -> Any:
+    if isinstance(value, list):
+        return [item.dict() for item in value]
+    return value.dict()
+
+def _decode_row(value: Any) -> Any:
+    if isinstance(value, list):
+        return [ContentResponse(**item) for item in value]
+    return ContentResponse(**value)
+
+# Built rows shared by every request and, through the L2 tier, every worker
+row_cache = TwoTierCache(
+    "rows",
+    maxsize=int(os.environ.get("ROW_CACHE_SIZE", 256)),
+    ttl=float(os.environ.get("ROW_CACHE_TTL", 300)),
+    encode=_encode_row,
+    decode=_decode_row
+)
+
+async def enrich_content(db: AsyncIOMotorDatabase, payload: Dict[str, Any]):
+    """Task: fill in certification, seasons, logo and trailer of content stored without them"""
+    details = await tmdb_service.get_enriched_details(payload["tmdb_id"], payload["content_type"])
+    if not details:
+        # Retried with backoff by the task queue
+        raise LookupError(f"No TMDB details for {payload['content_type']} {payload['tmdb_id']}")
+    enrichment = tmdb_service.parse_enrichment(details, payload["content_type"])
+    enrichment["kids_safe"] = is_kids_safe(
+        payload["content_type"], payload["adult"], enrichment["certification"], payload["genre_ids"]
+    )
+    await db.content.update_one(
+        {"id": payload["content_id"]},
+        {"$set": {**enrichment, "updated_at": datetime.utcnow()}}
+    )
+
+task_queue.register("content.enrich", enrich_content, queue="tmdb")
+
 class ContentService:
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
         self.content_collection = db.content
         
+    async def ensure_indexes(self):
+        """Indexes for id lookups (details, batch), the (tmdb_id, type) lookups of row
+        builds and the title prefix match of local search"""
+        await self.content_collection.create_index([("id", 1)])
+        await self.content_collection.create_index([("tmdb_id", 1), ("content_type", 1)])
+        await self.content_collection.create_index([("title_lower", 1)])
+        await self._backfill_title_lower()
+
+    async def _backfill_title_lower(self):
+        """Set title_lower on content stored before the field existed"""
+        while True:
+            docs = await self.content_collection.find(
+                {"title_lower": {"$exists": False}}, {"_id": 0, "id": 1, "title": 1}
+            ).to_list(TITLE_BACKFILL_BATCH)
+            if not docs:
+                return
+            await self.content_collection.bulk_write([
+                UpdateOne({"id": doc["id"]}, {"$set": {"title_lower": (doc.get("title") or "").lower()}})
+                for doc in docs
+            ], ordered=False)
+            if len(docs) < TITLE_BACKFILL_BATCH:
+                return
+
+    def _tmdb_fields(self, tmdb_data: Dict[str, Any], content_type: str) -> Dict[str, Any]:
+        """Content fields available from a TMDB list or search result"""
+        return dict(
+            title=tmdb_data.get("title") or tmdb_data.get("name", "Unknown Title"),
+            overview=tmdb_data.get("overview"),
+            poster_path=tmdb_data.get("poster_path"),
+            backdrop_path=tmdb_data.get("backdrop_path"),
+            content_type=content_type,
+            tmdb_id=tmdb_data.get("id"),
+            genre_ids=tmdb_data.get("genre_ids", []),
+            release_date=tmdb_data.get("release_date"),
+            first_air_date=tmdb_data.get("first_air_date"),
+            vote_average=tmdb_data.get("vote_average", 0),
+            popularity=tmdb_data.get("popularity", 0),
+            adult=tmdb_data.get("adult", False),
+            original_language=tmdb_data.get("original_language", "en"),
+            rating=tmdb_service.get_content_rating(tmdb_data, content_type),
+            seasons=tmdb_service.get_content_seasons(tmdb_data, content_type),
+        )
+
     async def get_or_create_content(self, tmdb_data: Dict[str, Any], content_type: str) -> Optional[ContentResponse]:
         """Get content from DB or create from TMDB data"""
         tmdb_id = tmdb_data.get("id")
@@ -26,36 +148,27 @@ class ContentService:
         
         # Create new content from TMDB data
         try:
-            # Get trailer URL
-            if content_type == "movie":
-                videos = await tmdb_service.get_movie_videos(tmdb_id)
-            else:
-                videos = await tmdb_service.get_tv_videos(tmdb_id)
-            
-            trailer_url = tmdb_service.extract_youtube_trailer(videos)
-            
-            # Create content object
-            content_data = ContentCreate(
-                title=tmdb_data.get("title") or tmdb_data.get("name", "Unknown Title"),
-                overview=tmdb_data.get("overview"),
-                poster_path=tmdb_data.get("poster_path"),
-                backdrop_path=tmdb_data.get("backdrop_path"),
-                content_type=content_type,
-                tmdb_id=tmdb_id,
-                genre_ids=tmdb_data.get("genre_ids", []),
-                release_date=tmdb_data.get("release_date"),
-                first_air_date=tmdb_data.get("first_air_date"),
-                vote_average=tmdb_data.get("vote_average", 0),
-                popularity=tmdb_data.get("popularity", 0),
-                adult=tmdb_data.get("adult", False),
-                original_language=tmdb_data.get("original_language", "en"),
-                trailer_url=trailer_url,
-                rating=tmdb_service.get_content_rating(tmdb_data, content_type),
-                seasons=f"{tmdb_data.get('number_of_seasons', 1)} Season{'s' if tmdb_data.get('number_of_seasons', 1) != 1 else ''}" if content_type == "tv" else None
-            )
-            
-            content = Content(**content_data.dict())
+            # Certification (for kids_safe), seasons, logo and trailer in one request
+            details = await tmdb_service.get_enriched_details(tmdb_id, content_type)
+            
+            fields = self._tmdb_fields(tmdb_data, content_type)
+            if details:
+                fields.update(tmdb_service.parse_enrichment(details, content_type))
+            fields["kids_safe"] = is_kids_safe(content_type, fields["adult"], fields.get("certification"), fields["genre_ids"])
+            
+            content = Content(**ContentCreate(**fields).dict(), id=content_id(content_type, tmdb_id),
+                              title_lower=fields["title"].lower())
             await self.content_collection.insert_one(content.dict())
+            catalog_index.upsert(content.dict())
+            similarity_service.notify_inserted()
+            if not details:
+                # Stored from the list data for now; enriched once TMDB answers again
+                task_queue.submit(
+                    "content.enrich",
+                    {"content_id": content.id, "tmdb_id": tmdb_id, "content_type": content_type,
+                     "adult": content.adult, "genre_ids": content.genre_ids},
+                    dedup_key=f"enrich:{content_type}:{tmdb_id}"
+                )
             
             return self._format_content_response(content.dict())
             
@@ -63,8 +176,13 @@ class ContentService:
             logger.error(f"Error creating content: {str(e)}")
             return None
 
+    @traced("row", "trending")
     async def get_trending_content(self) -> List[ContentResponse]:
         """Get trending movies and TV shows"""
+        cached = await row_cache.get("trending")
+        if cached is not MISSING:
+            return cached
+        
         try:
             # Get trending from TMDB
             trending_movies = await tmdb_service.get_trending_movies("week")
@@ -81,14 +199,22 @@ class ContentService:
                 if content:
                     content_list.append(content)
             
-            return content_list[:20]  # Limit to 20 items
+            content_list = content_list[:20]  # Limit to 20 items
+            if content_list:
+                await row_cache.set("trending", content_list)
+            return content_list
             
         except Exception as e:
             logger.error(f"Error getting trending content: {str(e)}")
             return []
 
+    @traced("row", "popular")
     async def get_popular_content(self) -> List[ContentResponse]:
         """Get popular movies and TV shows"""
+        cached = await row_cache.get("popular")
+        if cached is not MISSING:
+            return cached
+        
         try:
             # Get popular from TMDB
             popular_movies = await tmdb_service.get_popular_movies()
@@ -105,35 +231,28 @@ class ContentService:
                 if content:
                     content_list.append(content)
             
-            return content_list[:20]  # Limit to 20 items
+            content_list = content_list[:20]  # Limit to 20 items
+            if content_list:
+                await row_cache.set("popular", content_list)
+            return content_list
             
         except Exception as e:
             logger.error(f"Error getting popular content: {str(e)}")
             return []
 
+    @traced("row", "genre")
     async def get_content_by_genre(self, genre_name: str) -> List[ContentResponse]:
         """Get content by genre"""
         try:
-            # Map genre names to IDs (common genres)
-            genre_map = {
-                "action": 28,
-                "adventure": 12,
-                "comedy": 35,
-                "drama": 18,
-                "horror": 27,
-                "thriller": 53,
-                "sci-fi": 878,
-                "fantasy": 14,
-                "crime": 80,
-                "mystery": 9648,
-                "romance": 10749,
-                "family": 10751
-            }
-            
-            genre_id = genre_map.get(genre_name.lower())
+            genre_id = GENRE_ROW_IDS.get(genre_name.lower())
             if not genre_id:
                 return []
             
+            cache_key = f"genre:{genre_id}"
+            cached = await row_cache.get(cache_key)
+            if cached is not MISSING:
+                return cached
+            
             # Get content from TMDB
             movies = await tmdb_service.discover_movies(genre_id)
             tv_shows = await tmdb_service.discover_tv(genre_id)
@@ -149,12 +268,16 @@ class ContentService:
                 if content:
                     content_list.append(content)
             
-            return content_list[:20]
+            content_list = content_list[:20]
+            if content_list:
+                await row_cache.set(cache_key, content_list)
+            return content_list
             
         except Exception as e:
             logger.error(f"Error getting content by genre: {str(e)}")
             return []
 
+    @traced("row", "search")
     async def search_content(self, query: str) -> List[ContentResponse]:
         """Search for content"""
         try:
@@ -180,8 +303,71 @@ class ContentService:
             logger.error(f"Error searching content: {str(e)}")
             return []
 
+    @traced("row", "search_tmdb")
+    async def search_tmdb(self, query: str) -> List[ContentResponse]:
+        """TMDB search results without storing them (for search-as-you-type).
+
+        Stored titles are read with one query; the others are formatted from the search
+        result under the id they will get when stored. They are not in `content` yet, so
+        kids profiles never see them (filter_kids_safe only keeps stored kids-safe ids).
+        """
+        try:
+            results = [
+                item for item in await tmdb_service.search_multi(query)
+                if item.get("id") and item.get("media_type", "movie") in ("movie", "tv")
+            ]
+            refs = [ContentRef(type=item.get("media_type", "movie"), tmdb_id=item["id"]) for item in results]
+            stored = await self.get_content_batch(refs)
+            content_list = []
+            for item, ref, content in zip(results, refs, stored):
+                if content is None:
+                    # ContentResponse needs an image; titles without a poster are left out
+                    if not item.get("poster_path"):
+                        continue
+                    content = self._format_content_response(
+                        dict(self._tmdb_fields(item, ref.type), id=content_id(ref.type, ref.tmdb_id))
+                    )
+                content_list.append(content)
+            return content_list[:30]
+        except Exception as e:
+            logger.error(f"Error searching TMDB: {str(e)}")
+            return []
+
+    @traced("row", "search_local")
+    async def search_local(self, query: str, limit: int = 30) -> List[ContentResponse]:
+        """Stored content whose title starts with the query, most popular first (no TMDB
+        call). Anchored on the lowercased title so the title_lower index bounds the scan."""
+        pattern = {"$regex": "^" + re.escape(query.strip().lower())}
+        cursor = self.content_collection.find({"title_lower": pattern}, {"_id": 0}).sort("popularity", -1).limit(limit)
+        return [self._format_content_response(doc) async for doc in cursor]
+
+    @traced("row", "browse")
+    async def browse(self, page: int = 1, page_size: int = 20, profile_id: Optional[str] = None,
+                     fields: Optional[List[str]] = None, facets: bool = True, **filters: Any) -> Dict[str, Any]:
+        """One page of stored content matching `filters` (see CatalogIndex.browse), with
+        the total and facet counts over every match; kids profiles only see kids-safe titles"""
+        if profile_id and await kids_service.is_kids_profile(self.db, profile_id):
+            filters["kids_only"] = True
+        found = catalog_index.browse(offset=(page - 1) * page_size, limit=page_size, facets=facets, **filters)
+        docs = [record.document() for record in found["records"]]
+        return {
+            "total": found["total"],
+            "page": page,
+            "page_size": page_size,
+            "results": [self._format_content_fields(doc, fields) if fields else self._format_content_response(doc) for doc in docs],
+            "facets": {
+                name: [{"value": value, "count": count} for value, count in counts]
+                for name, counts in found.get("facets", {}).items()
+            },
+        }
+
+    @traced("row", "featured")
     async def get_featured_content(self) -> Optional[ContentResponse]:
         """Get featured content for hero section"""
+        cached = await row_cache.get("featured")
+        if cached is not MISSING:
+            return cached
+        
         try:
             # Get trending movies and pick the most popular one
             trending = await tmdb_service.get_trending_movies("week")
@@ -191,15 +377,20 @@ class ContentService:
             featured_item = trending[0]  # Most trending
             content = await self.get_or_create_content(featured_item, "movie")
             
+            if content:
+                await row_cache.set("featured", content)
             return content
             
         except Exception as e:
             logger.error(f"Error getting featured content: {str(e)}")
             return None
 
-    async def get_content_details(self, content_id: str) -> Optional[ContentResponse]:
-        """Get detailed content information"""
+    async def get_content_details(self, content_id: str, fields: Optional[List[str]] = None) -> Optional[Union[ContentResponse, Dict[str, Any]]]:
+        """Get detailed content information (only `fields`, as a dict, when given)"""
         try:
+            if fields:
+                content = await self.content_collection.find_one({"id": content_id}, mongo_projection(fields))
+                return self._format_content_fields(content, fields) if content else None
             content = await self.content_collection.find_one({"id": content_id})
             if content:
                 return self._format_content_response(content)
@@ -208,14 +399,140 @@ class ContentService:
             logger.error(f"Error getting content details: {str(e)}")
             return None
 
+    async def get_content_batch(self, refs: List[Union[str, ContentRef]], kids_only: bool = False,
+                                fields: Optional[List[str]] = None) -> List[Optional[Union[ContentResponse, Dict[str, Any]]]]:
+        """Resolve content UUIDs and/or (type, tmdb_id) refs with one query.
+
+        Returns one entry per ref, in request order, with None for misses. With `fields`
+        only those are read from Mongo and entries are dicts of just those fields.
+        """
+        content_ids = [ref for ref in refs if isinstance(ref, str)]
+        tmdb_refs = [ref for ref in refs if not isinstance(ref, str)]
+        clauses = []
+        if content_ids:
+            clauses.append({"id": {"$in": list(set(content_ids))}})
+        if tmdb_refs:
+            clauses.append({"tmdb_id": {"$in": list({ref.tmdb_id for ref in tmdb_refs})}})
+        if not clauses:
+            return []
+
+        query: Dict[str, Any] = clauses[0] if len(clauses) == 1 else {"$or": clauses}
+        if kids_only:
+            query["kids_safe"] = True
+        projection = mongo_projection(fields) if fields else None
+        docs = await self.content_collection.find(query, projection).to_list(None)
+
+        by_id = {doc["id"]: doc for doc in docs}
+        by_tmdb = {(doc["content_type"], doc["tmdb_id"]): doc for doc in docs}
+        formatted: Dict[str, Any] = {}
+        results: List[Optional[Union[ContentResponse, Dict[str, Any]]]] = []
+        for ref in refs:
+            if isinstance(ref, str):
+                doc = by_id.get(ref)
+            else:
+                doc = by_tmdb.get(("tv" if ref.type in ("tv", "series") else "movie", ref.tmdb_id))
+            if doc is None:
+                results.append(None)
+                continue
+            if doc["id"] not in formatted:
+                formatted[doc["id"]] = self._format_content_fields(doc, fields) if fields else self._format_content_response(doc)
+            results.append(formatted[doc["id"]])
+        return results
+
+    async def get_contents_by_ids(self, content_ids: List[str], kids_only: bool = False,
+                                  fields: Optional[List[str]] = None) -> List[Union[ContentResponse, Dict[str, Any]]]:
+        """Get several content items with one query, in the order requested, skipping misses"""
+        try:
+            return [content for content in await self.get_content_batch(content_ids, kids_only, fields) if content]
+        except Exception as e:
+            logger.error(f"Error getting content batch: {str(e)}")
+            return []
+
+    async def get_similar_content(self, content_id: str, limit: int = 20, profile_id: Optional[str] = None,
+                                  fields: Optional[List[str]] = None) -> List[Union[ContentResponse, Dict[str, Any]]]:
+        """Get "More like this" content from the precomputed similarity index"""
+        try:
+            kids_only = await kids_service.is_kids_profile(self.db, profile_id)
+            neighbours = await similarity_service.get_similar(self.db, content_id, limit)
+            return await self.get_contents_by_ids([item["content_id"] for item in neighbours], kids_only, fields)
+        except Exception as e:
+            logger.error(f"Error getting similar content: {str(e)}")
+            return []
+
+    async def get_kids_content(self) -> List[ContentResponse]:
+        """Most popular kids-safe content, used to top up filtered rows for kids profiles"""
+        cached = await row_cache.get("kids")
+        if cached is not MISSING:
+            return cached
+        try:
+            docs = await self.content_collection.find({"kids_safe": True}).sort("popularity", -1).limit(KIDS_ROW_SIZE).to_list(KIDS_ROW_SIZE)
+            content_list = [self._format_content_response(doc) for doc in docs]
+            if content_list:
+                # Short TTL: the pool grows as new content is stored and classified
+                await row_cache.set("kids", content_list, ttl=60)
+            return content_list
+        except Exception as e:
+            logger.error(f"Error getting kids content: {str(e)}")
+            return []
+
+    async def filter_kids_safe(self, rows: Dict[str, List[ContentResponse]], fill: bool = True) -> Dict[str, List[ContentResponse]]:
+        """Keep only kids-safe items in each row (one indexed query for all rows), topping
+        up rows left shorter than KIDS_MIN_ROW_SIZE with popular kids-safe content if `fill`"""
+        content_ids = list({item.id for row in rows.values() for item in row})
+        safe_ids = await self._kids_safe_ids(content_ids) if content_ids else set()
+
+        filtered = {}
+        fallback = None
+        for name, row in rows.items():
+            kept = [item for item in row if item.id in safe_ids]
+            if fill and len(kept) < KIDS_MIN_ROW_SIZE:
+                if fallback is None:
+                    fallback = await self.get_kids_content()
+                kept_ids = {item.id for item in kept}
+                kept += [item for item in fallback if item.id not in kept_ids][:max(len(row), KIDS_MIN_ROW_SIZE) - len(kept)]
+            filtered[name] = kept
+        return filtered
+
+    async def _kids_safe_ids(self, content_ids: List[str]) -> Set[str]:
+        return set(await self.content_collection.distinct("id", {"id": {"$in": content_ids}, "kids_safe": True}))
+
+    async def apply_profile(self, profile_id: Optional[str], rows: Dict[str, List[ContentResponse]],
+                            rerank: bool = True, fill: bool = True) -> Dict[str, List[ContentResponse]]:
+        """Restrict rows to kids-safe content for kids profiles, then re-rank them for the profile"""
+        if not profile_id:
+            return rows
+        if await kids_service.is_kids_profile(self.db, profile_id):
+            rows = await self.filter_kids_safe(rows, fill)
+        if rerank:
+            rows = await personalization_service.rerank_rows(self.db, profile_id, rows)
+        return rows
+
+    async def apply_profile_row(self, profile_id: Optional[str], row: List[ContentResponse],
+                                rerank: bool = True, fill: bool = True) -> List[ContentResponse]:
+        return (await self.apply_profile(profile_id, {"row": row}, rerank, fill))["row"]
+
+    def _image_url(self, path: Optional[str], variant: str) -> Optional[str]:
+        """Local image proxy URL when IMAGE_PROXY_ENABLED, otherwise the TMDB CDN URL"""
+        if IMAGE_PROXY_ENABLED:
+            return image_service.proxy_url(path, variant)
+        return tmdb_service.get_full_image_url(path, TMDB_SIZES[variant])
+
     def _format_content_response(self, content_data: Dict[str, Any]) -> ContentResponse:
         """Format content data for API response"""
-        return ContentResponse(
+        return ContentResponse(**self._content_values(content_data))
+
+    def _format_content_fields(self, content_data: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+        """Format only the requested response fields (from a projected document)"""
+        values = self._content_values(content_data)
+        return {field: values[field] for field in fields}
+
+    def _content_values(self, content_data: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(
             id=content_data.get("id"),
             title=content_data.get("title"),
-            image=tmdb_service.get_full_image_url(content_data.get("poster_path")),
-            backdrop=tmdb_service.get_full_image_url(content_data.get("backdrop_path"), "original"),
-            logo=tmdb_service.get_full_image_url(content_data.get("logo_path"), "original"),
+            image=self._image_url(content_data.get("poster_path"), "card"),
+            backdrop=self._image_url(content_data.get("backdrop_path"), "hero"),
+            logo=self._image_url(content_data.get("logo_path"), "original"),
             type="series" if content_data.get("content_type") == "tv" else "movie",
             rating=content_data.get("rating"),
             year=str(tmdb_service.get_content_year({"release_date": content_data.get("release_date"), "first_air_date": content_data.get("first_air_date")})),
@@ -0,0 +1,73 @@
+from typing import Any, Dict, List, Optional
+from models.content import ContentResponse
+
+CONTENT_FIELDS = [
+    "id", "title", "image", "backdrop", "logo", "type", "rating", "year", "genre",
+    "description", "seasons", "trailerUrl", "tmdb_id", "vote_average", "popularity",
+]
+
+# Named projections: row cards, the hero banner and the full response
+CONTENT_VIEWS = {
+    "card": ["id", "title", "image", "type"],
+    "hero": ["id", "title", "backdrop", "logo", "type", "rating", "year", "genre",
+             "description", "seasons", "trailerUrl"],
+    "full": CONTENT_FIELDS,
+}
+
+# Stored `content` fields each response field is computed from
+FIELD_SOURCES = {
+    "id": ["id"],
+    "title": ["title"],
+    "image": ["poster_path"],
+    "backdrop": ["backdrop_path"],
+    "logo": ["logo_path"],
+    "type": ["content_type"],
+    "rating": ["rating"],
+    "year": ["release_date", "first_air_date"],
+    "genre": ["genre_names"],
+    "description": ["overview"],
+    "seasons": ["seasons"],
+    "trailerUrl": ["trailer_url"],
+    "tmdb_id": ["tmdb_id"],
+    "vote_average": ["vote_average"],
+    "popularity": ["popularity"],
+}
+# Needed to match documents back to the refs that requested them
+ALWAYS_PROJECTED = ["id", "content_type", "tmdb_id"]
+
+
+def resolve_fields(fields: Optional[str], view: Optional[str]) -> Optional[List[str]]:
+    """Requested response fields from `fields=a,b` or `view=`; None means the full response"""
+    if fields:
+        requested = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in requested if field not in FIELD_SOURCES]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        # id is always returned so clients can key the partial items
+        return ["id"] + [field for field in dict.fromkeys(requested) if field != "id"]
+    if view:
+        if view not in CONTENT_VIEWS:
+            raise ValueError(f"view must be one of {sorted(CONTENT_VIEWS)}")
+        return None if view == "full" else CONTENT_VIEWS[view]
+    return None
+
+
+def mongo_projection(fields: List[str]) -> Dict[str, int]:
+    projection = {"_id": 0}
+    for field in fields:
+        for source in FIELD_SOURCES[field]:
+            projection[source] = 1
+    for source in ALWAYS_PROJECTED:
+        projection[source] = 1
+    return projection
+
+
+def select_fields(content: Any, fields: List[str]) -> Any:
+    """Trim a content item (model or dict), or a list of them, to `fields`"""
+    if content is None:
+        return None
+    if isinstance(content, list):
+        return [select_fields(item, fields) for item in content]
+    if isinstance(content, ContentResponse):
+        return content.dict(include=set(fields))
+    return {field: content[field] for field in fields if field in content}
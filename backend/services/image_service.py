@@ -0,0 +1,219 @@
+from typing import BinaryIO, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import asyncio
+import httpx
+import logging
+import os
+import re
+import time
+import uuid
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional: without it every variant is served as the original
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Emit /api/images URLs from _format_content_response instead of image.tmdb.org ones
+IMAGE_PROXY_ENABLED = os.environ.get("IMAGE_PROXY_ENABLED", "false").lower() == "true"
+IMAGE_PROXY_BASE_URL = os.environ.get("IMAGE_PROXY_BASE_URL", "/api/images").rstrip("/")
+IMAGE_ORIGIN_URL = os.environ.get("IMAGE_ORIGIN_URL", "https://image.tmdb.org/t/p").rstrip("/")
+IMAGE_CACHE_DIR = Path(os.environ.get("IMAGE_CACHE_DIR", Path(__file__).parent.parent / "image_cache"))
+IMAGE_RESIZE_WORKERS = int(os.environ.get("IMAGE_RESIZE_WORKERS", 2))
+IMAGE_FETCH_TIMEOUT = float(os.environ.get("IMAGE_FETCH_TIMEOUT", 15))
+# Disk budget for originals and variants; least recently used files are pruned beyond it
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+# Pruning frees space down to this share of the budget, so it doesn't run on every write
+IMAGE_CACHE_PRUNE_TARGET = 0.9
+# Hits refresh a file's mtime (the LRU clock) at most this often
+IMAGE_CACHE_TOUCH_SECONDS = 3600
+# Files written this recently are never pruned: the request that wrote one may still serve it
+IMAGE_CACHE_MIN_AGE_SECONDS = 60
+
+# Variant -> (max width, JPEG quality); "original" is the untouched origin file
+VARIANTS: Dict[str, Optional[Tuple[int, int]]] = {
+    "thumbnail": (185, 70),
+    "card": (342, 80),
+    "hero": (1280, 82),
+    "original": None,
+}
+# TMDB size used for each variant when the proxy is disabled
+TMDB_SIZES = {"thumbnail": "w185", "card": "w500", "hero": "original", "original": "original"}
+
+# TMDB image paths are a single file name; anything else is rejected before touching the disk
+IMAGE_PATH_PATTERN = re.compile(r"^[A-Za-z0-9_\-]+\.(jpg|jpeg|png|webp)$")
+
+
+class ImageNotFoundError(Exception):
+    pass
+
+
+class ImageService:
+    """Caches TMDB images on local disk and serves resized, re-encoded variants.
+
+    Originals are fetched once from IMAGE_ORIGIN_URL; variants are produced from the
+    cached original in a small thread pool. Files are written under a temporary name and
+    renamed into place, so concurrent workers never serve a partial file. File mtimes
+    act as an LRU clock: once the cache grows past IMAGE_CACHE_MAX_BYTES the least
+    recently used files are deleted. Pruning can remove a file between lookup and use,
+    so readers open it (`open_variant`) and treat a vanished file as a miss.
+    """
+
+    def __init__(self):
+        self.cache_dir = IMAGE_CACHE_DIR
+        self.transport: Optional[httpx.AsyncBaseTransport] = None
+        self._executor = ThreadPoolExecutor(max_workers=IMAGE_RESIZE_WORKERS, thread_name_prefix="image-resize")
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.max_bytes = IMAGE_CACHE_MAX_BYTES
+        # Unknown until the first prune scans the cache directory
+        self._cache_bytes: Optional[int] = None
+        self._pruning: Optional[asyncio.Future] = None
+
+    def proxy_url(self, path: Optional[str], variant: str) -> Optional[str]:
+        if not path:
+            return None
+        return f"{IMAGE_PROXY_BASE_URL}/{variant}/{path.lstrip('/')}"
+
+    def variant_path(self, variant: str, name: str) -> Path:
+        return self.cache_dir / variant / name
+
+    async def get_variant(self, variant: str, name: str) -> Path:
+        """Local file for a variant of a TMDB image, fetching/resizing on first use"""
+        if variant not in VARIANTS:
+            raise ValueError(f"Unknown image size '{variant}'")
+        if not IMAGE_PATH_PATTERN.match(name):
+            raise ValueError("Invalid image path")
+
+        target = self.variant_path(variant, name)
+        try:
+            if time.time() - target.stat().st_mtime > IMAGE_CACHE_TOUCH_SECONDS:
+                os.utime(target)
+            return target
+        except FileNotFoundError:
+            pass
+
+        key = (variant, name)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._build_variant(variant, name))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def open_variant(self, variant: str, name: str) -> Tuple[BinaryIO, os.stat_result]:
+        """Open a variant for serving; once open it stays readable even if pruned"""
+        path = await self.get_variant(variant, name)
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            # Pruned after the lookup: build it again
+            path = await self.get_variant(variant, name)
+            file = open(path, "rb")
+        return file, os.fstat(file.fileno())
+
+    async def _build_variant(self, variant: str, name: str) -> Path:
+        original = self.variant_path("original", name)
+        if not original.exists():
+            await self._fetch_original(name, original)
+        if variant == "original" or Image is None:
+            return original
+
+        target = self.variant_path(variant, name)
+        loop = asyncio.get_running_loop()
+        try:
+            size = await loop.run_in_executor(self._executor, self._resize, original, target, *VARIANTS[variant])
+        except FileNotFoundError:
+            # The original was pruned after the exists() check
+            await self._fetch_original(name, original)
+            size = await loop.run_in_executor(self._executor, self._resize, original, target, *VARIANTS[variant])
+        self._added(size)
+        return target
+
+    async def _fetch_original(self, name: str, destination: Path):
+        async with httpx.AsyncClient(transport=self.transport, timeout=IMAGE_FETCH_TIMEOUT) as client:
+            response = await client.get(f"{IMAGE_ORIGIN_URL}/original/{name}")
+        if response.status_code == 404:
+            raise ImageNotFoundError(name)
+        response.raise_for_status()
+        self._added(await asyncio.get_running_loop().run_in_executor(self._executor, self._write, destination, response.content))
+
+    def _added(self, size: int):
+        """Account for a new file and prune in the background once over budget"""
+        if self._cache_bytes is not None:
+            self._cache_bytes += size
+            if self._cache_bytes <= self.max_bytes:
+                return
+        if self._pruning is not None and not self._pruning.done():
+            return
+        self._pruning = asyncio.get_running_loop().run_in_executor(self._executor, self._prune)
+        self._pruning.add_done_callback(self._pruned)
+
+    def _pruned(self, future: asyncio.Future):
+        try:
+            self._cache_bytes = future.result()
+        except Exception as e:
+            logger.error(f"Error pruning image cache: {str(e)}")
+
+    def _prune(self) -> int:
+        """Delete least recently used files until under the prune target; returns the bytes left"""
+        files = []
+        for path in self.cache_dir.glob("*/*"):
+            if path.name.startswith("."):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        if total <= self.max_bytes:
+            return total
+        target = self.max_bytes * IMAGE_CACHE_PRUNE_TARGET
+        cutoff = time.time() - IMAGE_CACHE_MIN_AGE_SECONDS
+        removed = 0
+        for mtime, size, path in sorted(files, key=lambda file: file[0]):
+            if total <= target or mtime > cutoff:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        logger.info(f"Pruned {removed} images from the cache, {total} bytes left")
+        return total
+
+    @staticmethod
+    def _write(destination: Path, data: bytes) -> int:
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        temporary = destination.with_name(f".{destination.name}.{uuid.uuid4().hex}")
+        temporary.write_bytes(data)
+        os.replace(temporary, destination)
+        return len(data)
+
+    @staticmethod
+    def _resize(source: Path, destination: Path, width: int, quality: int) -> int:
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        temporary = destination.with_name(f".{destination.name}.{uuid.uuid4().hex}")
+        with Image.open(source) as image:
+            if image.width > width:
+                height = round(image.height * width / image.width)
+                image = image.resize((width, height), Image.LANCZOS)
+            if destination.suffix.lower() in (".jpg", ".jpeg"):
+                image.convert("RGB").save(temporary, "JPEG", quality=quality, optimize=True, progressive=True)
+            elif destination.suffix.lower() == ".webp":
+                image.save(temporary, "WEBP", quality=quality)
+            else:
+                image.save(temporary, "PNG", optimize=True)
+        size = temporary.stat().st_size
+        os.replace(temporary, destination)
+        return size
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+# Global instance
+image_service = ImageService()
@@ -0,0 +1,189 @@
+from typing import Any, Dict, Optional
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import OperationFailure
+from services.cache import bump_namespace_version
+from services.content_service import row_cache
+from services.fieldsets import FIELD_SOURCES
+from services.personalization_service import profile_vectors, item_genres
+from services.kids_service import profile_flags
+from services.catalog_index import catalog_index
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+CHANGE_STREAM_ENABLED = os.environ.get("CHANGE_STREAM_ENABLED", "true").lower() == "true"
+# How often the resume token is persisted while events (or idle batches) arrive
+RESUME_TOKEN_SAVE_SECONDS = float(os.environ.get("RESUME_TOKEN_SAVE_SECONDS", 5))
+CHANGE_STREAM_RETRY_SECONDS = float(os.environ.get("CHANGE_STREAM_RETRY_SECONDS", 5))
+CHANGE_STREAM_MAX_AWAIT_MS = int(os.environ.get("CHANGE_STREAM_MAX_AWAIT_MS", 1000))
+
+WATCHED_COLLECTIONS = ["content", "my_list", "viewing_progress", "user_profiles"]
+# Small per-profile collections whose deletes need the pre-image to know the profile_id
+PRE_IMAGE_COLLECTIONS = ["my_list", "viewing_progress", "user_profiles"]
+# Stored content fields that cached rows are built from; other updates leave rows valid
+ROW_FIELDS = {source for sources in FIELD_SOURCES.values() for source in sources} | {
+    "kids_safe", "genre_ids", "adult", "certification",
+}
+
+# Replica set and resume errors: no change streams on this deployment, or a token
+# older than the oplog window
+CHANGE_STREAM_UNSUPPORTED_CODES = {40573, 40324}
+RESUME_TOKEN_LOST_CODES = {260, 280, 286}
+
+
+def cluster_version(change: Dict[str, Any]) -> int:
+    """Cache version from the event's cluster time, identical on every worker"""
+    cluster_time = change.get("clusterTime")
+    if cluster_time is None:
+        return int(time.time()) << 32
+    return (cluster_time.time << 32) | cluster_time.inc
+
+
+class InvalidationService:
+    """Consumes a Mongo change stream and invalidates caches in this worker.
+
+    Every worker runs its own consumer, so each drops its own L1 entries; namespace
+    versions for the shared L2 tier are bumped to the event's cluster time, which is the
+    same for every worker. The resume token is stored in `cache_invalidation_state`, so
+    events missed while all workers were down are replayed on the next start. Requires a
+    replica set (a single-node one is enough); on a standalone server caches fall back
+    to their TTLs.
+    """
+
+    def __init__(self):
+        self.events = 0
+        self.last_event: Optional[datetime] = None
+        self.error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "events": self.events,
+            "last_event": self.last_event,
+            "error": self.error,
+        }
+
+    def start(self, db: AsyncIOMotorDatabase):
+        if not CHANGE_STREAM_ENABLED or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run_forever(db))
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run_forever(self, db: AsyncIOMotorDatabase):
+        await self._enable_pre_images(db)
+        while True:
+            try:
+                await self._consume(db)
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAM_UNSUPPORTED_CODES:
+                    self.error = "change streams need a replica set; caches rely on TTL expiry"
+                    logger.warning(f"Cache invalidation disabled: {str(e)}")
+                    return
+                if e.code in RESUME_TOKEN_LOST_CODES:
+                    # Events were missed: every namespace may be stale
+                    logger.warning(f"Change stream resume token lost, invalidating all caches: {str(e)}")
+                    await self._reset(db)
+                    continue
+                self.error = str(e)
+                logger.error(f"Change stream error: {str(e)}")
+            except Exception as e:
+                self.error = str(e)
+                logger.error(f"Change stream error: {str(e)}")
+            await asyncio.sleep(CHANGE_STREAM_RETRY_SECONDS)
+
+    async def _enable_pre_images(self, db: AsyncIOMotorDatabase):
+        for name in PRE_IMAGE_COLLECTIONS:
+            try:
+                await db.command("collMod", name, changeStreamPreAndPostImages={"enabled": True})
+            except Exception as e:
+                # Older servers (or a missing collection): deletes then clear the whole cache
+                logger.debug(f"Pre-images not enabled on {name}: {str(e)}")
+
+    async def _consume(self, db: AsyncIOMotorDatabase):
+        state = await db.cache_invalidation_state.find_one({"_id": "change_stream"})
+        pipeline = [{"$match": {"ns.coll": {"$in": WATCHED_COLLECTIONS}}}]
+        async with db.watch(
+            pipeline,
+            full_document="updateLookup",
+            full_document_before_change="whenAvailable",
+            resume_after=state.get("resume_token") if state else None,
+            max_await_time_ms=CHANGE_STREAM_MAX_AWAIT_MS,
+        ) as stream:
+            self.error = None
+            saved_at = time.monotonic()
+            while stream.alive:
+                change = await stream.try_next()
+                if change is not None:
+                    await self.handle(change)
+                if time.monotonic() - saved_at >= RESUME_TOKEN_SAVE_SECONDS and stream.resume_token is not None:
+                    await db.cache_invalidation_state.update_one(
+                        {"_id": "change_stream"},
+                        {"$set": {"resume_token": stream.resume_token, "updated_at": datetime.utcnow()}},
+                        upsert=True
+                    )
+                    saved_at = time.monotonic()
+
+    async def _reset(self, db: AsyncIOMotorDatabase):
+        await db.cache_invalidation_state.delete_one({"_id": "change_stream"})
+        version = int(time.time()) << 32
+        await bump_namespace_version(row_cache.namespace, version)
+        item_genres.clear()
+        profile_vectors.clear()
+        profile_flags.clear()
+
+    async def handle(self, change: Dict[str, Any]):
+        """Map one change event to the cache entries it makes stale"""
+        self.events += 1
+        self.last_event = datetime.utcnow()
+        collection = change.get("ns", {}).get("coll")
+        operation = change.get("operationType")
+        document = change.get("fullDocument") or change.get("fullDocumentBeforeChange") or {}
+
+        if collection == "content":
+            if change.get("fullDocument"):
+                # Other workers' writes reach the browse index before its next poll
+                catalog_index.upsert(change["fullDocument"])
+            elif operation == "delete":
+                catalog_index.remove_object(change.get("documentKey", {}).get("_id"))
+            if operation == "insert":
+                # New titles aren't part of any cached row yet
+                return
+            if operation == "update" and not self._touches_rows(change):
+                return
+            if document.get("id"):
+                item_genres.invalidate(document["id"])
+            else:
+                item_genres.clear()
+            await bump_namespace_version(row_cache.namespace, cluster_version(change))
+        elif collection in ("my_list", "viewing_progress"):
+            if document.get("profile_id"):
+                profile_vectors.invalidate(document["profile_id"])
+            else:
+                profile_vectors.clear()
+        elif collection == "user_profiles":
+            if document.get("id"):
+                profile_flags.invalidate(document["id"])
+            else:
+                profile_flags.clear()
+
+    @staticmethod
+    def _touches_rows(change: Dict[str, Any]) -> bool:
+        description = change.get("updateDescription") or {}
+        changed = list(description.get("updatedFields", {})) + list(description.get("removedFields", []))
+        return any(field.split(".", 1)[0] in ROW_FIELDS for field in changed)
+
+
+# Global instance
+invalidation_service = InvalidationService()
@@ -0,0 +1,114 @@
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from services.tmdb_service import tmdb_service
+from services.cache import TTLCache, MISSING
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+KIDS_BACKFILL_ENABLED = os.environ.get("KIDS_BACKFILL_ENABLED", "true").lower() == "true"
+KIDS_BACKFILL_BATCH_SIZE = int(os.environ.get("KIDS_BACKFILL_BATCH_SIZE", 100))
+KIDS_BACKFILL_CONCURRENCY = int(os.environ.get("KIDS_BACKFILL_CONCURRENCY", 4))
+
+# US certifications a kids profile may see
+KIDS_MOVIE_CERTIFICATIONS = {"G", "PG"}
+KIDS_TV_CERTIFICATIONS = {"TV-Y", "TV-Y7", "TV-Y7-FV", "TV-G"}
+# Animation, Family and Kids: enough on their own when TMDB has no certification
+KIDS_GENRE_IDS = {16, 10751, 10762}
+# Horror, Thriller, Crime, War and War & Politics exclude a title whatever its certification
+BLOCKED_GENRE_IDS = {27, 53, 80, 10752, 10768}
+
+profile_flags = TTLCache(
+    "kids_profiles",
+    maxsize=int(os.environ.get("KIDS_PROFILE_CACHE_SIZE", 10000)),
+    ttl=float(os.environ.get("KIDS_PROFILE_CACHE_TTL", 300))
+)
+
+
+def is_kids_safe(content_type: str, adult: bool, certification: Optional[str], genre_ids: List[int]) -> bool:
+    """Kids eligibility from the adult flag, the US certification and genres"""
+    if adult or BLOCKED_GENRE_IDS.intersection(genre_ids or []):
+        return False
+    if certification:
+        allowed = KIDS_MOVIE_CERTIFICATIONS if content_type == "movie" else KIDS_TV_CERTIFICATIONS
+        return certification in allowed
+    return bool(KIDS_GENRE_IDS.intersection(genre_ids or []))
+
+
+class KidsService:
+    """Kids-profile detection and the backfill of the precomputed `content.kids_safe` flag.
+
+    `kids_safe` is computed when content is created (from the certification in its enriched
+    TMDB details), so request-time filtering is an indexed `kids_safe: true` predicate.
+    """
+
+    def __init__(self):
+        self.backfilled = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def ensure_indexes(self, db: AsyncIOMotorDatabase):
+        # Covers the id + kids_safe filter of built rows and the kids fallback row
+        await db.content.create_index([("id", 1), ("kids_safe", 1)])
+        await db.content.create_index([("kids_safe", 1), ("popularity", -1)])
+
+    async def is_kids_profile(self, db: AsyncIOMotorDatabase, profile_id: Optional[str]) -> bool:
+        if not profile_id:
+            return False
+        cached = profile_flags.get(profile_id)
+        if cached is not MISSING:
+            return cached
+        profile = await db.user_profiles.find_one({"id": profile_id}, {"_id": 0, "is_kids": 1})
+        is_kids = bool(profile and profile.get("is_kids"))
+        profile_flags.set(profile_id, is_kids)
+        return is_kids
+
+    def invalidate_profile(self, profile_id: str):
+        profile_flags.invalidate(profile_id)
+
+    def start(self, db: AsyncIOMotorDatabase):
+        if not KIDS_BACKFILL_ENABLED or self._task is not None:
+            return
+        self._task = asyncio.create_task(self.backfill(db))
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def backfill(self, db: AsyncIOMotorDatabase):
+        """Fetch certifications and set kids_safe on content stored before the flag existed"""
+        try:
+            await self.ensure_indexes(db)
+            semaphore = asyncio.Semaphore(KIDS_BACKFILL_CONCURRENCY)
+
+            async def classify(doc: Dict[str, Any]) -> UpdateOne:
+                certification = doc.get("certification")
+                if certification is None:
+                    async with semaphore:
+                        certification = await tmdb_service.get_certification(doc["tmdb_id"], doc["content_type"])
+                kids_safe = is_kids_safe(doc["content_type"], doc.get("adult", False), certification, doc.get("genre_ids", []))
+                return UpdateOne({"id": doc["id"]}, {"$set": {"certification": certification, "kids_safe": kids_safe, "updated_at": datetime.utcnow()}})
+
+            projection = {"_id": 0, "id": 1, "tmdb_id": 1, "content_type": 1, "adult": 1, "genre_ids": 1, "certification": 1}
+            while True:
+                docs = await db.content.find({"kids_safe": {"$exists": False}}, projection).limit(KIDS_BACKFILL_BATCH_SIZE).to_list(KIDS_BACKFILL_BATCH_SIZE)
+                if not docs:
+                    break
+                operations = await asyncio.gather(*(classify(doc) for doc in docs))
+                await db.content.bulk_write(operations, ordered=False)
+                self.backfilled += len(operations)
+            if self.backfilled:
+                logger.info(f"Backfilled kids_safe on {self.backfilled} content items")
+        except Exception as e:
+            logger.error(f"Error backfilling kids_safe: {str(e)}")
+
+
+# Global instance
+kids_service = KidsService()
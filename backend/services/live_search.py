@@ -0,0 +1,76 @@
+from typing import Any, Awaitable, Callable, List, Optional
+from fastapi.encoders import jsonable_encoder
+from services.content_service import ContentService
+from services.fieldsets import select_fields
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Quiet period after a query update before searching; typing faster than this only
+# ever searches for the last query
+LIVE_SEARCH_DEBOUNCE_MS = float(os.environ.get("LIVE_SEARCH_DEBOUNCE_MS", 150))
+LIVE_SEARCH_LIMIT = 30
+
+
+class LiveSearchSession:
+    """Search-as-you-type state of one WebSocket connection.
+
+    Each query update cancels the search still running for the previous query (its TMDB
+    request too, unless another request shares it) and starts a new one after the
+    debounce delay. Stored matches are sent first (`stage: local`), then the TMDB results
+    merged with them (`stage: tmdb`); partial queries never store TMDB hits. Every message
+    carries its query so clients can drop results for text that is no longer in the box.
+    """
+
+    def __init__(self, content_service: ContentService, send: Callable[[Any], Awaitable[None]]):
+        self.content_service = content_service
+        self.send = send
+        self.searches = 0
+        self.cancelled = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def update(self, query: str, profile_id: Optional[str] = None, fields: Optional[List[str]] = None):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            self.cancelled += 1
+        self._task = asyncio.create_task(self._search(query.strip(), profile_id, fields))
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except (asyncio.CancelledError, Exception):
+            # Includes sends failing because the client is already gone
+            pass
+
+    async def _send_results(self, query: str, stage: str, results: List[Any], fields: Optional[List[str]]):
+        if fields is not None:
+            results = select_fields(results, fields)
+        await self.send(jsonable_encoder({"q": query, "stage": stage, "results": results}))
+
+    async def _search(self, query: str, profile_id: Optional[str], fields: Optional[List[str]]):
+        await asyncio.sleep(LIVE_SEARCH_DEBOUNCE_MS / 1000)
+        if not query:
+            await self._send_results(query, "tmdb", [], fields)
+            return
+        self.searches += 1
+        try:
+            local = await self.content_service.search_local(query, LIVE_SEARCH_LIMIT)
+            local = await self.content_service.apply_profile_row(profile_id, local, rerank=False, fill=False)
+            await self._send_results(query, "local", local, fields)
+
+            remote = await self.content_service.search_tmdb(query)
+            remote = await self.content_service.apply_profile_row(profile_id, remote, rerank=False, fill=False)
+            # TMDB relevance order first, then stored matches TMDB didn't return
+            seen = {item.id for item in remote}
+            merged = remote + [item for item in local if item.id not in seen]
+            await self._send_results(query, "tmdb", merged[:LIVE_SEARCH_LIMIT], fields)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in live search: {str(e)}")
+            await self.send({"q": query, "stage": "error", "detail": f"Error searching content: {str(e)}"})
@@ -0,0 +1,230 @@
+from typing import Dict, List, Sequence, Tuple
+from bisect import bisect_left
+from pymongo import monitoring
+import re
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, tuned for API calls between ~1ms and ~10s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, value in sorted(self.samples().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    metric_type = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, *labels: str, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._values.items()}
+        for labels, series in sorted(snapshot.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        lines.extend(_render_cache_ratios())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template and status.",
+    ("method", "route", "status")))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served.", ("method",)))
+
+tmdb_requests = registry.register(Counter(
+    "tmdb_requests_total", "TMDB API calls by endpoint, API key and status.", ("endpoint", "api_key", "status")))
+tmdb_request_duration = registry.register(Histogram(
+    "tmdb_request_duration_seconds", "TMDB API call latency by endpoint and API key.", ("endpoint", "api_key")))
+tmdb_requests_in_flight = registry.register(Gauge(
+    "tmdb_requests_in_flight", "TMDB API calls currently awaiting a response."))
+
+mongo_command_duration = registry.register(Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency by collection and command.",
+    ("collection", "command")))
+mongo_commands = registry.register(Counter(
+    "mongo_commands_total", "MongoDB commands by collection, command and outcome.",
+    ("collection", "command", "outcome")))
+
+circuit_breaker_state = registry.register(Gauge(
+    "circuit_breaker_state", "Circuit breaker state (0=closed, 1=half_open, 2=open).", ("name",)))
+
+cache_requests = registry.register(Counter(
+    "cache_requests_total", "Cache lookups by cache name and result (hit/miss).", ("cache", "result")))
+
+
+def _render_cache_ratios() -> List[str]:
+    samples = cache_requests.samples()
+    caches = sorted({labels[0] for labels in samples})
+    if not caches:
+        return []
+    lines = ["# HELP cache_hit_ratio Fraction of cache lookups served from cache since start.",
+             "# TYPE cache_hit_ratio gauge"]
+    for cache in caches:
+        hits = samples.get((cache, "hit"), 0.0)
+        total = hits + samples.get((cache, "miss"), 0.0)
+        lines.append(f'cache_hit_ratio{{cache="{_escape(cache)}"}} {hits / total if total else 0.0}')
+    return lines
+
+
+def record_cache(cache: str, hit: bool):
+    """Count a cache lookup for the hit/miss ratio families"""
+    cache_requests.inc(cache, "hit" if hit else "miss")
+
+
+_NUMERIC_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+def normalize_tmdb_endpoint(endpoint: str) -> str:
+    """Collapse ids so /movie/123/videos becomes /movie/{id}/videos"""
+    return _NUMERIC_SEGMENT.sub("/{id}", endpoint)
+
+
+def mask_api_key(api_key: str) -> str:
+    return f"...{api_key[-4:]}" if api_key else "none"
+
+
+def observe_tmdb_request(endpoint: str, api_key: str, status: str, duration: float):
+    endpoint = normalize_tmdb_endpoint(endpoint)
+    masked = mask_api_key(api_key)
+    tmdb_requests.inc(endpoint, masked, status)
+    tmdb_request_duration.observe(endpoint, masked, value=duration)
+
+
+# getMore/killCursors name the collection in a separate field
+_COLLECTION_FIELD = {"getMore": "collection", "killCursors": "killCursors"}
+_IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "saslStart", "saslContinue", "endSessions"}
+
+
+def command_collection(command_name: str, command: Dict) -> str:
+    value = command.get(_COLLECTION_FIELD.get(command_name, command_name))
+    return value if isinstance(value, str) else "-"
+
+
+class MongoMetricsListener(monitoring.CommandListener):
+    """Feeds the mongo_* families from pymongo command monitoring events"""
+
+    def __init__(self):
+        self._pending: Dict[Tuple[int, int], Tuple[str, str]] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        if event.command_name in _IGNORED_COMMANDS:
+            return
+        self._pending[(event.request_id, event.operation_id)] = (
+            command_collection(event.command_name, event.command), event.command_name)
+
+    def _finish(self, event, outcome: str):
+        labels = self._pending.pop((event.request_id, event.operation_id), None)
+        if labels is None:
+            return
+        mongo_command_duration.observe(*labels, value=event.duration_micros / 1e6)
+        mongo_commands.inc(*labels, outcome)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finish(event, "success")
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finish(event, "failure")
+
+
+mongo_metrics_listener = MongoMetricsListener()
@@ -0,0 +1,156 @@
+from typing import Dict, List, Optional, Set, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from models.content import ContentResponse
+from services.cache import TTLCache, MISSING
+from services.similarity_service import GENRE_IDS, GENRE_COLUMNS
+import numpy as np
+import math
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Blend of the per-profile score; the weights sum to 1 so scores stay comparable across rows
+AFFINITY_WEIGHT = float(os.environ.get("RANKING_AFFINITY_WEIGHT", 0.55))
+POPULARITY_WEIGHT = float(os.environ.get("RANKING_POPULARITY_WEIGHT", 0.3))
+VOTE_WEIGHT = float(os.environ.get("RANKING_VOTE_WEIGHT", 0.15))
+# Titles watched past this point sink below everything not yet finished
+FINISHED_PROGRESS = 90
+FINISHED_PENALTY = 1.0
+# Progress entries count less than an explicit My List add, scaled by how far they got
+MY_LIST_WEIGHT = 1.0
+MIN_PROGRESS_WEIGHT = 0.3
+POPULARITY_SCALE = math.log1p(5000)
+
+# Profile vectors are dropped when the profile's list/progress changes (on this worker
+# directly, on the others through the change stream); the TTL is only a safety net
+profile_vectors = TTLCache(
+    "profile_vectors",
+    maxsize=int(os.environ.get("PROFILE_VECTOR_CACHE_SIZE", 10000)),
+    ttl=float(os.environ.get("PROFILE_VECTOR_TTL", 900))
+)
+# Genre ids never change for a title, so they are kept for as long as the LRU allows
+item_genres = TTLCache(
+    "item_genres",
+    maxsize=int(os.environ.get("ITEM_GENRE_CACHE_SIZE", 50000)),
+    ttl=float(os.environ.get("ITEM_GENRE_TTL", 86400))
+)
+
+
+def genre_vector(genre_ids: List[int]) -> np.ndarray:
+    vector = np.zeros(len(GENRE_IDS), dtype=np.float32)
+    columns = [GENRE_COLUMNS[genre_id] for genre_id in genre_ids if genre_id in GENRE_COLUMNS]
+    if columns:
+        vector[columns] = 1 / math.sqrt(len(columns))
+    return vector
+
+
+def score_items(affinity: np.ndarray, genres: np.ndarray, popularity: np.ndarray,
+                vote_average: np.ndarray, finished: np.ndarray) -> np.ndarray:
+    """Vectorised per-profile score for a batch of candidates (one row per item)"""
+    popularity_score = np.minimum(np.log1p(np.maximum(popularity, 0)) / POPULARITY_SCALE, 1)
+    return (
+        AFFINITY_WEIGHT * (genres @ affinity)
+        + POPULARITY_WEIGHT * popularity_score
+        + VOTE_WEIGHT * np.clip(vote_average, 0, 10) / 10
+        - FINISHED_PENALTY * finished
+    )
+
+
+class PersonalizationService:
+    """Re-ranks home page rows per profile.
+
+    A profile's genre affinity comes from the genres of its My List and viewing progress
+    titles; each candidate is scored by affinity, popularity and rating, with titles the
+    profile already finished pushed to the end. Profiles without history keep the shared
+    TMDB order.
+    """
+
+    async def get_profile_vector(self, db: AsyncIOMotorDatabase, profile_id: str) -> Optional[Tuple[np.ndarray, Set[str]]]:
+        """(normalised genre affinity, finished content ids), or None for a profile with no history"""
+        cached = profile_vectors.get(profile_id)
+        if cached is not MISSING:
+            return cached
+
+        weights: Dict[str, float] = {}
+        finished: Set[str] = set()
+        async for item in db.my_list.find({"profile_id": profile_id}, {"content_id": 1}):
+            weights[item["content_id"]] = MY_LIST_WEIGHT
+        async for item in db.viewing_progress.find({"profile_id": profile_id}, {"content_id": 1, "progress": 1}):
+            progress = item.get("progress", 0)
+            weight = MIN_PROGRESS_WEIGHT + (1 - MIN_PROGRESS_WEIGHT) * min(progress, 100) / 100
+            weights[item["content_id"]] = max(weights.get(item["content_id"], 0), weight)
+            if progress >= FINISHED_PROGRESS:
+                finished.add(item["content_id"])
+
+        vector = None
+        if weights:
+            affinity = np.zeros(len(GENRE_IDS), dtype=np.float32)
+            for content_id, genres in (await self._item_genres(db, list(weights))).items():
+                affinity += weights[content_id] * genres
+            if affinity.any():
+                vector = (affinity / np.linalg.norm(affinity), finished)
+        profile_vectors.set(profile_id, vector)
+        return vector
+
+    def invalidate(self, profile_id: str):
+        profile_vectors.invalidate(profile_id)
+
+    async def _item_genres(self, db: AsyncIOMotorDatabase, content_ids: List[str]) -> Dict[str, np.ndarray]:
+        """Genre vectors for content ids, fetching any not cached with one $in query"""
+        found: Dict[str, np.ndarray] = {}
+        missing = []
+        for content_id in content_ids:
+            vector = item_genres.get(content_id)
+            if vector is MISSING:
+                missing.append(content_id)
+            else:
+                found[content_id] = vector
+        if missing:
+            async for doc in db.content.find({"id": {"$in": missing}}, {"_id": 0, "id": 1, "genre_ids": 1}):
+                vector = genre_vector(doc.get("genre_ids") or [])
+                item_genres.set(doc["id"], vector)
+                found[doc["id"]] = vector
+        return found
+
+    async def rerank(self, db: AsyncIOMotorDatabase, profile_id: str,
+                     content: List[ContentResponse]) -> List[ContentResponse]:
+        return (await self.rerank_rows(db, profile_id, {"row": content}))["row"]
+
+    async def rerank_rows(self, db: AsyncIOMotorDatabase, profile_id: str,
+                          rows: Dict[str, List[ContentResponse]]) -> Dict[str, List[ContentResponse]]:
+        """Re-rank several rows for a profile with one batched scoring pass"""
+        try:
+            profile = await self.get_profile_vector(db, profile_id)
+            if profile is None:
+                return rows
+            affinity, finished = profile
+
+            items = [item for row in rows.values() for item in row]
+            if not items:
+                return rows
+            genres = await self._item_genres(db, list({item.id for item in items}))
+            empty = np.zeros(len(GENRE_IDS), dtype=np.float32)
+            scores = score_items(
+                affinity,
+                np.stack([genres.get(item.id, empty) for item in items]),
+                np.fromiter((item.popularity for item in items), dtype=np.float64, count=len(items)),
+                np.fromiter((item.vote_average for item in items), dtype=np.float64, count=len(items)),
+                np.fromiter((item.id in finished for item in items), dtype=np.float64, count=len(items)),
+            )
+
+            ranked: Dict[str, List[ContentResponse]] = {}
+            offset = 0
+            for name, row in rows.items():
+                # Stable sort keeps TMDB order between equally scored titles
+                order = np.argsort(-scores[offset:offset + len(row)], kind="stable")
+                ranked[name] = [row[index] for index in order.tolist()]
+                offset += len(row)
+            return ranked
+        except Exception as e:
+            logger.error(f"Error personalizing rows: {str(e)}")
+            return rows
+
+
+# Global instance
+personalization_service = PersonalizationService()
@@ -0,0 +1,110 @@
+from typing import Dict
+import asyncio
+import cProfile
+import io
+import logging
+import pstats
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MAX_PROFILE_SECONDS = 120
+
+
+class ProfilerBusyError(Exception):
+    pass
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    qualname = getattr(code, "co_qualname", code.co_name)
+    return f"{qualname} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})"
+
+
+class EventLoopProfiler:
+    """Profiles the worker's event loop thread for a fixed window.
+
+    Nothing is installed until a profile is requested, so an idle profiler costs nothing.
+    Only one profile can run at a time per worker.
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def _exclusive(self):
+        if self._lock.locked():
+            raise ProfilerBusyError("A profile is already running on this worker")
+        await self._lock.acquire()
+
+    async def profile_pstats(self, seconds: float, sort: str = "cumulative", limit: int = 50) -> str:
+        """Deterministic profile of every coroutine step run on the loop during the window"""
+        await self._exclusive()
+        try:
+            # cProfile hooks the current thread, which is the loop thread running every task
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+
+            stream = io.StringIO()
+            stats = pstats.Stats(profiler, stream=stream)
+            stats.sort_stats(sort).print_stats(limit)
+            return stream.getvalue()
+        finally:
+            self._lock.release()
+
+    async def profile_collapsed(self, seconds: float, interval_ms: float = 5.0, all_threads: bool = False) -> str:
+        """Statistical profile as collapsed stacks (`frame;frame;frame count`) for flame graphs"""
+        await self._exclusive()
+        try:
+            loop_thread_id = threading.get_ident()
+            counts: Dict[str, int] = {}
+            stop = threading.Event()
+            thread_names = {}
+
+            def sample():
+                interval = interval_ms / 1000
+                own_id = threading.get_ident()
+                while not stop.is_set():
+                    frames = sys._current_frames()
+                    if not all_threads:
+                        frames = {loop_thread_id: frames.get(loop_thread_id)}
+                    for thread_id, frame in frames.items():
+                        if frame is None or thread_id == own_id:
+                            continue
+                        stack = []
+                        while frame is not None:
+                            stack.append(_frame_label(frame))
+                            frame = frame.f_back
+                        if all_threads:
+                            if thread_id not in thread_names:
+                                thread_names.update({thread.ident: thread.name for thread in threading.enumerate()})
+                            stack.append(f"thread:{thread_names.get(thread_id, thread_id)}")
+                        key = ";".join(reversed(stack))
+                        counts[key] = counts.get(key, 0) + 1
+                    time.sleep(interval)
+
+            sampler = threading.Thread(target=sample, name="loop-profiler", daemon=True)
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stop.set()
+                await asyncio.get_running_loop().run_in_executor(None, sampler.join)
+
+            lines = [f"{stack} {count}" for stack, count in sorted(counts.items(), key=lambda item: -item[1])]
+            return "\n".join(lines) + "\n"
+        finally:
+            self._lock.release()
+
+
+# Global instance
+event_loop_profiler = EventLoopProfiler()
@@ -0,0 +1,440 @@
+from typing import Any, Dict, List, Optional, Set, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReplaceOne
+from pymongo.errors import DuplicateKeyError
+from services.task_queue import task_queue
+import numpy as np
+import asyncio
+import logging
+import multiprocessing
+import os
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDATIONS_ENABLED = os.environ.get("RECOMMENDATIONS_ENABLED", "true").lower() == "true"
+RECOMMENDATIONS_INTERVAL = float(os.environ.get("RECOMMENDATIONS_INTERVAL", 60))
+RECOMMENDATIONS_FULL_REBUILD_HOURS = float(os.environ.get("RECOMMENDATIONS_FULL_REBUILD_HOURS", 24))
+# Neighbours kept per item and recommendations kept per profile
+RECOMMENDATIONS_TOP_K = int(os.environ.get("RECOMMENDATIONS_TOP_K", 20))
+RECOMMENDATIONS_PER_PROFILE = int(os.environ.get("RECOMMENDATIONS_PER_PROFILE", 40))
+# Co-occurrence pairs grow with the square of a profile's history, so only the
+# most recent interactions of very active profiles are used
+RECOMMENDATIONS_MAX_ITEMS_PER_PROFILE = int(os.environ.get("RECOMMENDATIONS_MAX_ITEMS_PER_PROFILE", 200))
+BUILD_LEASE_SECONDS = 600
+
+# Interaction weights: an explicit My List add counts fully, viewing counts by how far it got
+MY_LIST_WEIGHT = 1.0
+MIN_PROGRESS_WEIGHT = 0.5
+
+STATE_ID = "item_item"
+LEASE_ID = "item_item:lease"
+
+
+def _group_starts(sorted_keys: np.ndarray) -> np.ndarray:
+    """Index of the first element of every run of equal keys"""
+    return np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+
+
+def _rank_within_groups(sorted_keys: np.ndarray) -> np.ndarray:
+    """0-based position of every element inside its run of equal keys"""
+    positions = np.arange(len(sorted_keys))
+    first = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+    return positions - np.maximum.accumulate(np.where(first, positions, 0))
+
+
+def _expand_groups(group_starts: np.ndarray, group_sizes: np.ndarray, members: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """For every element of `members`, pair it with every position of its group.
+
+    `group_starts`/`group_sizes` are indexed per member. Returns (member, position) arrays.
+    """
+    repeats = group_sizes
+    left = np.repeat(members, repeats)
+    offsets = np.arange(len(left)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    right = np.repeat(group_starts, repeats) + offsets
+    return left, right
+
+
+def build_item_neighbours(profile_idx: np.ndarray, item_idx: np.ndarray, weights: np.ndarray,
+                          norms: np.ndarray, source_mask: np.ndarray,
+                          top_k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Top-k cosine neighbours from the sparse profile x item matrix given as COO triples.
+
+    Equivalent to normalising the rows of X.T @ X, computed on the non-zero pairs only.
+    `norms` holds each item's squared weight sum; only items with `source_mask` set get
+    neighbour lists. Returns (source, neighbour, score) sorted by source then score.
+    Runs in the build process pool, so it must stay a picklable module-level function.
+    """
+    order = np.lexsort((item_idx, profile_idx))
+    profiles, items, w = profile_idx[order], item_idx[order], weights[order].astype(np.float64)
+    if not len(profiles):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0)
+
+    starts = _group_starts(profiles)
+    sizes = np.diff(np.r_[starts, len(profiles)])
+    group_of = np.repeat(np.arange(len(starts)), sizes)
+
+    # Only interactions on source items need their pairs expanded
+    members = np.flatnonzero(source_mask[items])
+    left, right = _expand_groups(starts[group_of[members]], sizes[group_of[members]], members)
+    keep = left != right
+    left, right = left[keep], right[keep]
+
+    n_items = len(norms)
+    pair_keys = items[left].astype(np.int64) * n_items + items[right]
+    unique_keys, inverse = np.unique(pair_keys, return_inverse=True)
+    co_occurrence = np.bincount(inverse, weights=w[left] * w[right])
+
+    sources = unique_keys // n_items
+    neighbours = unique_keys % n_items
+    scores = co_occurrence / np.sqrt(norms[sources] * norms[neighbours])
+
+    order = np.lexsort((-scores, sources))
+    sources, neighbours, scores = sources[order], neighbours[order], scores[order]
+    keep = _rank_within_groups(sources) < top_k
+    return sources[keep], neighbours[keep], scores[keep]
+
+
+def build_profile_recommendations(profile_idx: np.ndarray, item_idx: np.ndarray, weights: np.ndarray,
+                                  nb_source: np.ndarray, nb_neighbour: np.ndarray, nb_score: np.ndarray,
+                                  n_items: int, top_n: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Score unseen items for each profile as the weighted sum of its items' neighbour scores.
+
+    `nb_*` must be sorted by source. Returns (profile, item, score, because_item) with the
+    top_n items per profile; `because_item` is the watched item contributing the most.
+    """
+    if not len(nb_source) or not len(profile_idx):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0), empty
+
+    counts = np.bincount(nb_source, minlength=n_items)
+    first_neighbour = np.cumsum(counts) - counts
+    interactions, positions = _expand_groups(first_neighbour[item_idx], counts[item_idx], np.arange(len(item_idx)))
+
+    profiles = profile_idx[interactions].astype(np.int64)
+    candidates = nb_neighbour[positions]
+    contributions = weights[interactions] * nb_score[positions]
+    because = item_idx[interactions]
+
+    seen = profile_idx.astype(np.int64) * n_items + item_idx
+    candidate_keys = profiles * n_items + candidates
+    unseen = ~np.isin(candidate_keys, seen)
+    candidate_keys, contributions, because = candidate_keys[unseen], contributions[unseen], because[unseen]
+    if not len(candidate_keys):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0), empty
+
+    # Strongest single contribution explains each candidate
+    order = np.lexsort((-contributions, candidate_keys))
+    candidate_keys, contributions, because = candidate_keys[order], contributions[order], because[order]
+    starts = _group_starts(candidate_keys)
+    totals = np.add.reduceat(contributions, starts)
+    keys = candidate_keys[starts]
+    because = because[starts]
+
+    profiles, items = keys // n_items, keys % n_items
+    order = np.lexsort((-totals, profiles))
+    profiles, items, totals, because = profiles[order], items[order], totals[order], because[order]
+    keep = _rank_within_groups(profiles) < top_n
+    return profiles[keep], items[keep], totals[keep], because[keep]
+
+
+def build_recommendations(profile_idx: np.ndarray, item_idx: np.ndarray, weights: np.ndarray,
+                          norms: np.ndarray, source_mask: np.ndarray,
+                          stored_source: np.ndarray, stored_neighbour: np.ndarray, stored_score: np.ndarray,
+                          top_k: int, top_n: int) -> Dict[str, np.ndarray]:
+    """Whole build step for the process pool: neighbours for the source items, then
+    per-profile recommendations using them plus the stored lists of every other item."""
+    sources, neighbours, scores = build_item_neighbours(profile_idx, item_idx, weights, norms, source_mask, top_k)
+
+    keep_stored = ~source_mask[stored_source]
+    all_source = np.concatenate([sources, stored_source[keep_stored]])
+    all_neighbour = np.concatenate([neighbours, stored_neighbour[keep_stored]])
+    all_score = np.concatenate([scores, stored_score[keep_stored]])
+    order = np.argsort(all_source, kind="stable")
+
+    rec_profiles, rec_items, rec_scores, rec_because = build_profile_recommendations(
+        profile_idx, item_idx, weights,
+        all_source[order], all_neighbour[order], all_score[order],
+        len(norms), top_n
+    )
+    return {
+        "sources": sources, "neighbours": neighbours, "scores": scores,
+        "rec_profiles": rec_profiles, "rec_items": rec_items,
+        "rec_scores": rec_scores, "rec_because": rec_because,
+    }
+
+
+class RecommendationService:
+    """Item-to-item ("because you watched") recommendations.
+
+    A background job turns `my_list` and `viewing_progress` into a sparse co-occurrence
+    matrix and stores, in `recommendations`, the top-k neighbours of every content id
+    (`item:<content_id>`) and a ready-made list for every profile (`profile:<profile_id>`),
+    so serving is a single `_id` lookup. After the first full build only profiles with
+    interactions newer than the stored watermark, and the items they touch, are rebuilt.
+    Removals leave nothing to compare with the watermark, so they are logged in
+    `recommendation_changes` by `record_removal`.
+    """
+
+    def __init__(self):
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._indexed = False
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn rather than fork: the API process has Motor's executor threads running
+            self._pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def ensure_indexes(self, db: AsyncIOMotorDatabase):
+        await db.my_list.create_index([("added_at", 1)])
+        await db.my_list.create_index([("content_id", 1)])
+        await db.viewing_progress.create_index([("last_watched", 1)])
+        await db.viewing_progress.create_index([("content_id", 1)])
+        # Changes older than a full rebuild are already in the stored lists
+        await db.recommendation_changes.create_index(
+            [("changed_at", 1)], expireAfterSeconds=int(RECOMMENDATIONS_FULL_REBUILD_HOURS * 3600) + 3600
+        )
+
+    async def record_removal(self, db: AsyncIOMotorDatabase, profile_id: str, content_id: str):
+        """Make the next incremental build recount a profile that dropped an interaction"""
+        try:
+            await db.recommendation_changes.insert_one(
+                {"profile_id": profile_id, "content_id": content_id, "changed_at": datetime.utcnow()}
+            )
+        except Exception as e:
+            # The next full rebuild still picks the removal up
+            logger.error(f"Error recording recommendation change for {profile_id}: {str(e)}")
+
+    async def get_profile_recommendations(self, db: AsyncIOMotorDatabase, profile_id: str,
+                                          limit: int = 20) -> List[Dict[str, Any]]:
+        """Stored recommendations for a profile as [{content_id, score, because}]"""
+        doc = await db.recommendations.find_one({"_id": f"profile:{profile_id}"})
+        if not doc:
+            return []
+        return doc.get("items", [])[:limit]
+
+    def start(self, db: AsyncIOMotorDatabase):
+        if not RECOMMENDATIONS_ENABLED:
+            return
+        task_queue.register("recommendations.build", self._run_task, queue="builds", every=RECOMMENDATIONS_INTERVAL)
+
+    async def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _run_task(self, db: AsyncIOMotorDatabase, payload: Dict[str, Any]):
+        if not self._indexed:
+            await self.ensure_indexes(db)
+            self._indexed = True
+        await self.run(db)
+
+    async def _acquire_lease(self, db: AsyncIOMotorDatabase) -> bool:
+        """Only one worker in the fleet builds at a time"""
+        now = datetime.utcnow()
+        try:
+            await db.recommendation_state.insert_one(
+                {"_id": LEASE_ID, "expires_at": now + timedelta(seconds=BUILD_LEASE_SECONDS)}
+            )
+            return True
+        except DuplicateKeyError:
+            result = await db.recommendation_state.delete_one({"_id": LEASE_ID, "expires_at": {"$lte": now}})
+            if result.deleted_count:
+                return await self._acquire_lease(db)
+            return False
+
+    async def run(self, db: AsyncIOMotorDatabase, full: bool = False) -> Optional[Dict[str, Any]]:
+        """Build (incrementally unless `full` or due) and store the recommendations"""
+        if not await self._acquire_lease(db):
+            return None
+        try:
+            return await self._build(db, full)
+        finally:
+            await db.recommendation_state.delete_one({"_id": LEASE_ID})
+
+    async def _build(self, db: AsyncIOMotorDatabase, full: bool) -> Dict[str, Any]:
+        started_at = datetime.utcnow()
+        state = await db.recommendation_state.find_one({"_id": STATE_ID}) or {}
+        watermark = state.get("watermark")
+        last_full = state.get("last_full_build")
+        if watermark is None or last_full is None or \
+                started_at - last_full > timedelta(hours=RECOMMENDATIONS_FULL_REBUILD_HOURS):
+            full = True
+
+        if full:
+            profile_filter: Dict[str, Any] = {}
+            changed_items: Optional[Set[str]] = None
+        else:
+            changed_profiles = set(await db.my_list.distinct("profile_id", {"added_at": {"$gt": watermark}}))
+            changed_profiles.update(
+                await db.viewing_progress.distinct("profile_id", {"last_watched": {"$gt": watermark}})
+            )
+            removed_items: Set[str] = set()
+            async for change in db.recommendation_changes.find({"changed_at": {"$gt": watermark}}):
+                changed_profiles.add(change["profile_id"])
+                removed_items.add(change["content_id"])
+            if not changed_profiles:
+                await self._save_state(db, started_at, last_full)
+                self.last_run = {"mode": "incremental", "profiles": 0, "items": 0, "started_at": started_at}
+                return self.last_run
+
+            # Every item a changed profile touched gets a new neighbour list, and every
+            # profile touching one of those items is needed to recount its co-occurrences
+            in_changed = {"profile_id": {"$in": list(changed_profiles)}}
+            changed_items = set(await db.my_list.distinct("content_id", in_changed)) | removed_items
+            changed_items.update(await db.viewing_progress.distinct("content_id", in_changed))
+            in_items = {"content_id": {"$in": list(changed_items)}}
+            affected_profiles = set(await db.my_list.distinct("profile_id", in_items))
+            affected_profiles.update(await db.viewing_progress.distinct("profile_id", in_items))
+            profile_filter = {"profile_id": {"$in": list(affected_profiles)}}
+
+        interactions = await self._load_interactions(db, profile_filter)
+        profile_ids = sorted({profile_id for profile_id, _ in interactions})
+        item_ids = sorted({content_id for _, content_id in interactions})
+        if changed_items is None:
+            changed_items = set(item_ids)
+
+        # Items outside the rebuilt set keep their stored lists; the affected profiles
+        # still need those lists (and their norms) to score recommendations
+        stored = {}
+        if not full:
+            outside = [f"item:{content_id}" for content_id in item_ids if content_id not in changed_items]
+            if outside:
+                async for doc in db.recommendations.find({"_id": {"$in": outside}}):
+                    stored[doc["content_id"]] = doc
+            item_ids = sorted(set(item_ids).union(
+                neighbour["content_id"] for doc in stored.values() for neighbour in doc.get("neighbours", [])
+            ))
+
+        profile_index = {profile_id: index for index, profile_id in enumerate(profile_ids)}
+        item_index = {content_id: index for index, content_id in enumerate(item_ids)}
+        profile_idx = np.fromiter((profile_index[p] for p, _ in interactions), dtype=np.int64, count=len(interactions))
+        item_idx = np.fromiter((item_index[c] for _, c in interactions), dtype=np.int64, count=len(interactions))
+        weights = np.fromiter(interactions.values(), dtype=np.float64, count=len(interactions))
+
+        norms = np.bincount(item_idx, weights=weights * weights, minlength=len(item_ids))
+        source_mask = np.zeros(len(item_ids), dtype=bool)
+        for content_id in changed_items:
+            if content_id in item_index:
+                source_mask[item_index[content_id]] = True
+        stored_rows = []
+        for content_id, doc in stored.items():
+            # Stored norms are exact: none of these items' profiles changed
+            norms[item_index[content_id]] = doc.get("norm", norms[item_index[content_id]])
+            for neighbour in doc.get("neighbours", []):
+                stored_rows.append((item_index[content_id], item_index[neighbour["content_id"]], neighbour["score"]))
+        stored_array = np.array(stored_rows, dtype=np.float64).reshape(-1, 3)
+
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            self._executor(), build_recommendations,
+            profile_idx, item_idx, weights, norms, source_mask,
+            stored_array[:, 0].astype(np.int64), stored_array[:, 1].astype(np.int64), stored_array[:, 2],
+            RECOMMENDATIONS_TOP_K, RECOMMENDATIONS_PER_PROFILE
+        )
+
+        await self._write(db, result, profile_ids, item_ids, norms, source_mask, started_at)
+        if full:
+            # Items and profiles without any interactions left
+            await db.recommendations.delete_many({"built_at": {"$lt": started_at}})
+        else:
+            gone = [f"item:{content_id}" for content_id in changed_items if content_id not in item_index]
+            gone += [f"profile:{profile_id}" for profile_id in changed_profiles if profile_id not in profile_index]
+            if gone:
+                await db.recommendations.delete_many({"_id": {"$in": gone}})
+        await self._save_state(db, started_at, started_at if full else last_full)
+        self.last_run = {
+            "mode": "full" if full else "incremental",
+            "profiles": len(profile_ids),
+            "items": int(source_mask.sum()),
+            "interactions": len(interactions),
+            "started_at": started_at,
+            "seconds": (datetime.utcnow() - started_at).total_seconds(),
+        }
+        logger.info(f"Recommendations built: {self.last_run}")
+        return self.last_run
+
+    async def _load_interactions(self, db: AsyncIOMotorDatabase,
+                                 profile_filter: Dict[str, Any]) -> Dict[Tuple[str, str], float]:
+        """(profile_id, content_id) -> weight, capped to each profile's most recent items"""
+        events: Dict[str, List[Tuple[datetime, str, float]]] = {}
+        async for doc in db.my_list.find(profile_filter, {"profile_id": 1, "content_id": 1, "added_at": 1}):
+            events.setdefault(doc["profile_id"], []).append(
+                (doc.get("added_at") or datetime.min, doc["content_id"], MY_LIST_WEIGHT)
+            )
+        async for doc in db.viewing_progress.find(
+            profile_filter, {"profile_id": 1, "content_id": 1, "progress": 1, "last_watched": 1}
+        ):
+            weight = MIN_PROGRESS_WEIGHT + (1 - MIN_PROGRESS_WEIGHT) * min(doc.get("progress", 0), 100) / 100
+            events.setdefault(doc["profile_id"], []).append(
+                (doc.get("last_watched") or datetime.min, doc["content_id"], weight)
+            )
+
+        interactions: Dict[Tuple[str, str], float] = {}
+        for profile_id, profile_events in events.items():
+            profile_events.sort(key=lambda event: event[0], reverse=True)
+            kept: Dict[str, float] = {}
+            for _, content_id, weight in profile_events:
+                if content_id in kept:
+                    kept[content_id] = max(kept[content_id], weight)
+                elif len(kept) < RECOMMENDATIONS_MAX_ITEMS_PER_PROFILE:
+                    kept[content_id] = weight
+            for content_id, weight in kept.items():
+                interactions[(profile_id, content_id)] = weight
+        return interactions
+
+    async def _write(self, db: AsyncIOMotorDatabase, result: Dict[str, np.ndarray], profile_ids: List[str],
+                     item_ids: List[str], norms: np.ndarray, source_mask: np.ndarray, built_at: datetime):
+        neighbours: Dict[int, List[Dict[str, Any]]] = {int(index): [] for index in np.flatnonzero(source_mask)}
+        for source, neighbour, score in zip(result["sources"].tolist(), result["neighbours"].tolist(),
+                                            result["scores"].tolist()):
+            neighbours[source].append({"content_id": item_ids[neighbour], "score": round(score, 6)})
+
+        profile_items: Dict[int, List[Dict[str, Any]]] = {index: [] for index in range(len(profile_ids))}
+        for profile, item, score, because in zip(result["rec_profiles"].tolist(), result["rec_items"].tolist(),
+                                                 result["rec_scores"].tolist(), result["rec_because"].tolist()):
+            profile_items[profile].append({
+                "content_id": item_ids[item],
+                "score": round(score, 6),
+                "because": item_ids[because],
+            })
+
+        operations = [
+            ReplaceOne({"_id": f"item:{item_ids[index]}"}, {
+                "kind": "item",
+                "content_id": item_ids[index],
+                "norm": float(norms[index]),
+                "neighbours": items,
+                "built_at": built_at,
+            }, upsert=True)
+            for index, items in neighbours.items()
+        ] + [
+            ReplaceOne({"_id": f"profile:{profile_ids[index]}"}, {
+                "kind": "profile",
+                "profile_id": profile_ids[index],
+                "items": items,
+                "built_at": built_at,
+            }, upsert=True)
+            for index, items in profile_items.items()
+        ]
+        for start in range(0, len(operations), 1000):
+            await db.recommendations.bulk_write(operations[start:start + 1000], ordered=False)
+
+    async def _save_state(self, db: AsyncIOMotorDatabase, watermark: datetime, last_full: Optional[datetime]):
+        await db.recommendation_state.update_one(
+            {"_id": STATE_ID},
+            {"$set": {"watermark": watermark, "last_full_build": last_full}},
+            upsert=True
+        )
+
+    def status(self) -> Dict[str, Any]:
+        return {"enabled": RECOMMENDATIONS_ENABLED, "last_run": self.last_run}
+
+
+# Global instance
+recommendation_service = RecommendationService()
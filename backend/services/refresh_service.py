@@ -0,0 +1,210 @@
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from services.tmdb_service import tmdb_service
+from services.rate_limiter import TokenBucket
+from services.task_queue import task_queue
+from services.kids_service import is_kids_safe
+import asyncio
+import logging
+import math
+import os
+
+logger = logging.getLogger(__name__)
+
+REFRESH_ENABLED = os.environ.get("REFRESH_ENABLED", "true").lower() == "true"
+REFRESH_INTERVAL = float(os.environ.get("REFRESH_INTERVAL", 60))
+# Fleet-wide TMDB budget for refreshes: the lease lets one worker start one cycle per
+# REFRESH_INTERVAL, and a cycle spends at most one interval's worth. Request traffic is
+# never throttled by it
+REFRESH_REQUESTS_PER_MINUTE = float(os.environ.get("REFRESH_REQUESTS_PER_MINUTE", 120))
+REFRESH_CONCURRENCY = int(os.environ.get("REFRESH_CONCURRENCY", 4))
+# Documents younger than this are never refreshed; at REFRESH_TARGET_AGE_HOURS an
+# unwatched, unpopular title scores 1
+REFRESH_MIN_AGE_HOURS = float(os.environ.get("REFRESH_MIN_AGE_HOURS", 6))
+REFRESH_TARGET_AGE_HOURS = float(os.environ.get("REFRESH_TARGET_AGE_HOURS", 72))
+# Candidates per cycle from each of the "oldest" and "most popular" ends of the stale set
+REFRESH_CANDIDATES = int(os.environ.get("REFRESH_CANDIDATES", 1000))
+REFRESH_VIEW_WEIGHT = float(os.environ.get("REFRESH_VIEW_WEIGHT", 0.5))
+# Popularity drifts on every fetch; smaller relative changes aren't written, since any
+# write to a row field invalidates the row caches of the whole fleet
+REFRESH_POPULARITY_CHANGE = float(os.environ.get("REFRESH_POPULARITY_CHANGE", 0.2))
+REFRESH_VOTE_CHANGE = 0.1
+POPULARITY_SCALE = math.log1p(5000)
+# Details with videos, certifications and images appended
+REQUESTS_PER_ITEM = 1
+LEASE_ID = "refresh:lease"
+
+
+def changed_fields(doc: Dict[str, Any], changes: Dict[str, Any]) -> Dict[str, Any]:
+    """The refreshed values that differ from the stored ones, ignoring score drift"""
+    changed = {}
+    for field, value in changes.items():
+        current = doc.get(field)
+        if field == "popularity" and current:
+            if abs(value - current) / current < REFRESH_POPULARITY_CHANGE:
+                continue
+        elif field == "vote_average" and current is not None:
+            if abs(value - current) < REFRESH_VOTE_CHANGE:
+                continue
+        elif current == value:
+            continue
+        changed[field] = value
+    return changed
+
+
+def refresh_priority(age_hours: float, popularity: float, views: int) -> float:
+    """Staleness scaled by demand: popular and watched titles are refreshed sooner"""
+    demand = 1 + min(math.log1p(max(popularity, 0)) / POPULARITY_SCALE, 1) + REFRESH_VIEW_WEIGHT * math.log1p(views)
+    return age_hours / REFRESH_TARGET_AGE_HOURS * demand
+
+
+class RefreshService:
+    """Keeps stored TMDB metadata (popularity, certification, trailer, logo, seasons) fresh.
+
+    Every REFRESH_INTERVAL seconds a `content.refresh` task (holding a lease in
+    `refresh_state`) ranks stale `content` documents by `refresh_priority`, re-fetches as
+    many as the TMDB budget allows and applies the changes with one bulk write, bumping
+    `updated_at`. Only fields whose values changed are written, so an unchanged title
+    doesn't invalidate cached rows.
+    """
+
+    def __init__(self):
+        self.last_run: Optional[Dict[str, Any]] = None
+        self.budget = TokenBucket(REFRESH_REQUESTS_PER_MINUTE / 60, REFRESH_REQUESTS_PER_MINUTE)
+        self._indexed = False
+
+    async def ensure_indexes(self, db: AsyncIOMotorDatabase):
+        await db.content.create_index([("updated_at", 1)])
+        await db.content.create_index([("popularity", -1)])
+
+    def start(self, db: AsyncIOMotorDatabase):
+        if not REFRESH_ENABLED:
+            return
+        task_queue.register("content.refresh", self._run_task, queue="tmdb", every=REFRESH_INTERVAL)
+
+    async def _run_task(self, db: AsyncIOMotorDatabase, payload: Dict[str, Any]):
+        if not self._indexed:
+            await self.ensure_indexes(db)
+            self._indexed = True
+        await self.run(db)
+
+    async def _acquire_lease(self, db: AsyncIOMotorDatabase) -> bool:
+        """Only one worker in the fleet starts a cycle per REFRESH_INTERVAL"""
+        now = datetime.utcnow()
+        try:
+            # Long enough to cover the cycle; shortened to one interval once it ends
+            await db.refresh_state.insert_one({"_id": LEASE_ID, "expires_at": now + timedelta(seconds=REFRESH_INTERVAL * 2)})
+            return True
+        except DuplicateKeyError:
+            result = await db.refresh_state.delete_one({"_id": LEASE_ID, "expires_at": {"$lte": now}})
+            if result.deleted_count:
+                return await self._acquire_lease(db)
+            return False
+
+    async def run(self, db: AsyncIOMotorDatabase) -> Optional[Dict[str, Any]]:
+        started_at = datetime.utcnow()
+        if not await self._acquire_lease(db):
+            return None
+        try:
+            return await self._refresh(db)
+        finally:
+            # Held until a full interval has passed since this cycle started: other workers'
+            # cycles in the meantime would spend the budget again
+            await db.refresh_state.update_one(
+                {"_id": LEASE_ID}, {"$set": {"expires_at": started_at + timedelta(seconds=REFRESH_INTERVAL)}}
+            )
+
+    async def pick(self, db: AsyncIOMotorDatabase, limit: int) -> List[Dict[str, Any]]:
+        """Highest-priority stale documents"""
+        now = datetime.utcnow()
+        cutoff = now - timedelta(hours=REFRESH_MIN_AGE_HOURS)
+        stale = {
+            "updated_at": {"$lt": cutoff},
+            "$or": [{"refresh_failed_at": {"$exists": False}}, {"refresh_failed_at": {"$lt": cutoff}}],
+        }
+        projection = {
+            "_id": 0, "id": 1, "tmdb_id": 1, "content_type": 1, "popularity": 1, "updated_at": 1,
+            "adult": 1, "genre_ids": 1, "certification": 1, "rating": 1, "seasons": 1, "logo_path": 1,
+            "trailer_url": 1, "vote_average": 1, "kids_safe": 1,
+        }
+        candidates: Dict[str, Dict[str, Any]] = {}
+        for sort in ([("updated_at", 1)], [("popularity", -1)]):
+            async for doc in db.content.find(stale, projection).sort(sort).limit(REFRESH_CANDIDATES):
+                candidates[doc["id"]] = doc
+        if not candidates:
+            return []
+
+        views: Dict[str, int] = {}
+        async for row in db.viewing_progress.aggregate([
+            {"$match": {"content_id": {"$in": list(candidates)}}},
+            {"$group": {"_id": "$content_id", "views": {"$sum": 1}}},
+        ]):
+            views[row["_id"]] = row["views"]
+
+        for doc in candidates.values():
+            age_hours = (now - doc["updated_at"]).total_seconds() / 3600
+            doc["priority"] = refresh_priority(age_hours, doc.get("popularity", 0), views.get(doc["id"], 0))
+        return sorted(candidates.values(), key=lambda doc: doc["priority"], reverse=True)[:limit]
+
+    async def fetch_changes(self, doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Current TMDB values for a document's refreshable fields, or None if TMDB failed"""
+        await self.budget.acquire(REQUESTS_PER_ITEM)
+        details = await tmdb_service.get_enriched_details(doc["tmdb_id"], doc["content_type"])
+        if not details:
+            return None
+        changes = tmdb_service.parse_enrichment(details, doc["content_type"])
+        # A new certification can move a title in or out of kids rows
+        changes["kids_safe"] = is_kids_safe(
+            doc["content_type"], doc.get("adult", False), changes["certification"], doc.get("genre_ids", [])
+        )
+        return changes
+
+    async def _refresh(self, db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+        started_at = datetime.utcnow()
+        # One interval's worth of budget, so cycles don't queue up behind each other
+        limit = max(1, int(REFRESH_REQUESTS_PER_MINUTE * REFRESH_INTERVAL / 60 / REQUESTS_PER_ITEM))
+        docs = await self.pick(db, limit)
+        semaphore = asyncio.Semaphore(REFRESH_CONCURRENCY)
+        failed = 0
+        updated = 0
+
+        async def refresh(doc: Dict[str, Any]) -> Optional[UpdateOne]:
+            nonlocal failed, updated
+            async with semaphore:
+                if tmdb_service.breaker.state == "open":
+                    return None
+                changes = await self.fetch_changes(doc)
+            now = datetime.utcnow()
+            if changes is None:
+                # Back off for REFRESH_MIN_AGE_HOURS instead of retrying it every cycle
+                failed += 1
+                return UpdateOne({"id": doc["id"]}, {"$set": {"refresh_failed_at": now}})
+            changed = changed_fields(doc, changes)
+            if changed:
+                updated += 1
+            return UpdateOne(
+                {"id": doc["id"]},
+                {"$set": {**changed, "updated_at": now}, "$unset": {"refresh_failed_at": ""}}
+            )
+
+        operations = [operation for operation in await asyncio.gather(*(refresh(doc) for doc in docs)) if operation]
+        if operations:
+            await db.content.bulk_write(operations, ordered=False)
+        self.last_run = {
+            "started_at": started_at,
+            "duration_seconds": round((datetime.utcnow() - started_at).total_seconds(), 3),
+            "candidates": len(docs),
+            "refreshed": len(operations) - failed,
+            "changed": updated,
+            "failed": failed,
+        }
+        if operations:
+            logger.info(f"Refreshed {self.last_run['refreshed']} content items ({updated} changed, {failed} failed)")
+        return self.last_run
+
+
+# Global instance
+refresh_service = RefreshService()
@@ -0,0 +1,263 @@
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReplaceOne
+from services.task_queue import task_queue
+import numpy as np
+import asyncio
+import logging
+import math
+import os
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_ENABLED = os.environ.get("SIMILARITY_ENABLED", "true").lower() == "true"
+# Fallback poll; every insert also queues a (deduplicated) run after the debounce delay
+SIMILARITY_INTERVAL = float(os.environ.get("SIMILARITY_INTERVAL", 60))
+SIMILARITY_DEBOUNCE_SECONDS = float(os.environ.get("SIMILARITY_DEBOUNCE_SECONDS", 2))
+SIMILARITY_TOP_K = int(os.environ.get("SIMILARITY_TOP_K", 20))
+# Rows of the similarity matrix computed per matmul, bounding memory to BLOCK x catalog
+SIMILARITY_BLOCK_SIZE = int(os.environ.get("SIMILARITY_BLOCK_SIZE", 512))
+# Incremental runs re-read this much history before the watermark: created_at comes from
+# each writer's clock, and an insert can commit after a run has already passed its timestamp
+SIMILARITY_OVERLAP_SECONDS = float(os.environ.get("SIMILARITY_OVERLAP_SECONDS", 30))
+
+STATE_ID = "content_similar"
+
+# Fixed vocabularies keep every item's feature row independent of the rest of the
+# catalog, so rows for new content can be added without rescaling existing ones
+GENRE_IDS = [
+    28, 12, 16, 35, 80, 99, 18, 10751, 14, 36, 27, 10402, 9648, 10749, 878, 10770, 53, 10752, 37,
+    10759, 10762, 10763, 10764, 10765, 10766, 10767, 10768,
+]
+LANGUAGES = ["en", "es", "fr", "de", "it", "ja", "ko", "zh", "hi", "pt", "ru"]
+GENRE_COLUMNS = {genre_id: index for index, genre_id in enumerate(GENRE_IDS)}
+LANGUAGE_COLUMNS = {language: len(GENRE_IDS) + index for index, language in enumerate(LANGUAGES + ["other"])}
+NUMERIC_OFFSET = len(GENRE_IDS) + len(LANGUAGES) + 1
+N_FEATURES = NUMERIC_OFFSET + 3
+
+# Relative importance of each feature block (genres dominate "more like this")
+GENRE_WEIGHT = 1.0
+LANGUAGE_WEIGHT = 0.6
+VOTE_WEIGHT = 0.3
+POPULARITY_WEIGHT = 0.3
+YEAR_WEIGHT = 0.4
+POPULARITY_SCALE = math.log1p(5000)
+
+FEATURE_PROJECTION = {
+    "_id": 0, "id": 1, "genre_ids": 1, "original_language": 1, "vote_average": 1,
+    "popularity": 1, "release_date": 1, "first_air_date": 1,
+}
+
+
+def _year(doc: Dict[str, Any]) -> Optional[int]:
+    date = doc.get("release_date") or doc.get("first_air_date")
+    if date and len(date) >= 4 and date[:4].isdigit():
+        return int(date[:4])
+    return None
+
+
+def feature_matrix(docs: List[Dict[str, Any]]) -> np.ndarray:
+    """L2-normalised feature rows: multi-hot genres, one-hot language, scaled vote, popularity and year"""
+    features = np.zeros((len(docs), N_FEATURES), dtype=np.float32)
+    for row, doc in enumerate(docs):
+        genre_columns = [GENRE_COLUMNS[genre_id] for genre_id in doc.get("genre_ids") or [] if genre_id in GENRE_COLUMNS]
+        if genre_columns:
+            # Spread the genre weight so multi-genre titles don't outweigh the other blocks
+            features[row, genre_columns] = GENRE_WEIGHT / math.sqrt(len(genre_columns))
+        language = doc.get("original_language") or "other"
+        features[row, LANGUAGE_COLUMNS.get(language, LANGUAGE_COLUMNS["other"])] = LANGUAGE_WEIGHT
+        features[row, NUMERIC_OFFSET] = VOTE_WEIGHT * min(float(doc.get("vote_average") or 0), 10) / 10
+        features[row, NUMERIC_OFFSET + 1] = POPULARITY_WEIGHT * min(
+            math.log1p(max(float(doc.get("popularity") or 0), 0)) / POPULARITY_SCALE, 1
+        )
+        year = _year(doc)
+        if year is not None:
+            features[row, NUMERIC_OFFSET + 2] = YEAR_WEIGHT * min(max(year - 1900, 0), 150) / 150
+
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return features / norms
+
+
+def top_k_neighbours(queries: np.ndarray, catalog: np.ndarray, query_rows: np.ndarray,
+                     k: int, block_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-k cosine neighbours in `catalog` for each row of `queries`, one block of rows at a time.
+
+    `query_rows` gives each query's own row in `catalog` (or -1) so it is excluded.
+    Returns (indices, scores), each shaped (len(queries), min(k, len(catalog) - 1)).
+    """
+    k = min(k, max(len(catalog) - 1, 0))
+    indices = np.zeros((len(queries), k), dtype=np.int64)
+    scores = np.zeros((len(queries), k), dtype=np.float32)
+    if not k:
+        return indices, scores
+    for start in range(0, len(queries), block_size):
+        stop = min(start + block_size, len(queries))
+        similarity = queries[start:stop] @ catalog.T
+        own = query_rows[start:stop]
+        has_own = own >= 0
+        similarity[np.flatnonzero(has_own), own[has_own]] = -np.inf
+        # argpartition finds the k best in linear time; only those k are sorted
+        candidates = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        candidate_scores = np.take_along_axis(similarity, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1)
+        indices[start:stop] = np.take_along_axis(candidates, order, axis=1)
+        scores[start:stop] = np.take_along_axis(candidate_scores, order, axis=1)
+    return indices, scores
+
+
+class SimilarityService:
+    """Content-based "More like this" index in the `content_similar` collection.
+
+    Each content id stores its top-k neighbours by cosine similarity of catalog features,
+    so cold-start titles without any watch data still get neighbours. The first run
+    builds the whole table; later runs only score content created since the watermark
+    (less SIMILARITY_OVERLAP_SECONDS) against the catalog and merge it into existing lists
+    it now belongs in. Re-scoring content from the overlap rewrites the same lists.
+    """
+
+    def __init__(self):
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._indexed = False
+
+    async def ensure_indexes(self, db: AsyncIOMotorDatabase):
+        await db.content.create_index([("created_at", 1)])
+
+    async def get_similar(self, db: AsyncIOMotorDatabase, content_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Stored neighbours for a content id as [{content_id, score}]"""
+        doc = await db.content_similar.find_one({"_id": content_id})
+        if not doc:
+            return []
+        return doc.get("neighbours", [])[:limit]
+
+    def notify_inserted(self):
+        """Queue the incremental job after new content was stored"""
+        if SIMILARITY_ENABLED:
+            # The delay lets a burst of inserts (e.g. one row build) share a single run
+            task_queue.submit("similarity.build", dedup_key="similarity.build", delay=SIMILARITY_DEBOUNCE_SECONDS)
+
+    def start(self, db: AsyncIOMotorDatabase):
+        if not SIMILARITY_ENABLED:
+            return
+        task_queue.register("similarity.build", self._build, queue="builds", every=SIMILARITY_INTERVAL)
+
+    async def _build(self, db: AsyncIOMotorDatabase, payload: Dict[str, Any]):
+        if not self._indexed:
+            await self.ensure_indexes(db)
+            self._indexed = True
+        await self.run(db)
+
+    async def run(self, db: AsyncIOMotorDatabase, full: bool = False) -> Dict[str, Any]:
+        started_at = datetime.utcnow()
+        state = await db.similarity_state.find_one({"_id": STATE_ID}) or {}
+        watermark = state.get("watermark")
+        full = full or watermark is None
+
+        new_ids: List[str] = []
+        catalog_docs: List[Dict[str, Any]] = []
+        if not full:
+            # Cheap indexed check first: most periodic runs find nothing new
+            since = watermark - timedelta(seconds=SIMILARITY_OVERLAP_SECONDS)
+            new_ids = await db.content.distinct("id", {"created_at": {"$gt": since}})
+        if full or new_ids:
+            catalog_docs = await db.content.find({}, FEATURE_PROJECTION).to_list(None)
+            catalog_docs = [doc for doc in catalog_docs if doc.get("id")]
+            if full:
+                new_ids = [doc["id"] for doc in catalog_docs]
+        if not new_ids or len(catalog_docs) < 2:
+            await self._save_state(db, started_at)
+            self.last_run = {"mode": "full" if full else "incremental", "items": 0, "started_at": started_at}
+            return self.last_run
+
+        ids = [doc["id"] for doc in catalog_docs]
+        row_of = {content_id: row for row, content_id in enumerate(ids)}
+        new_rows = np.array([row_of[content_id] for content_id in new_ids if content_id in row_of], dtype=np.int64)
+
+        loop = asyncio.get_running_loop()
+        # BLAS releases the GIL for the matmuls, so a thread keeps the loop responsive
+        catalog = await loop.run_in_executor(None, feature_matrix, catalog_docs)
+        indices, scores = await loop.run_in_executor(
+            None, top_k_neighbours, catalog[new_rows], catalog, new_rows, SIMILARITY_TOP_K, SIMILARITY_BLOCK_SIZE
+        )
+
+        lists: Dict[str, List[Dict[str, Any]]] = {}
+        for position, row in enumerate(new_rows.tolist()):
+            lists[ids[row]] = [
+                {"content_id": ids[neighbour], "score": round(float(score), 6)}
+                for neighbour, score in zip(indices[position].tolist(), scores[position].tolist())
+            ]
+        if not full:
+            lists.update(await self._merge_into_existing(db, catalog, ids, row_of, new_rows))
+
+        operations = [
+            ReplaceOne({"_id": content_id}, {
+                "neighbours": neighbours,
+                "min_score": neighbours[-1]["score"] if len(neighbours) >= SIMILARITY_TOP_K else None,
+                "built_at": started_at,
+            }, upsert=True)
+            for content_id, neighbours in lists.items()
+        ]
+        for start in range(0, len(operations), 1000):
+            await db.content_similar.bulk_write(operations[start:start + 1000], ordered=False)
+
+        await self._save_state(db, started_at)
+        self.last_run = {
+            "mode": "full" if full else "incremental",
+            "items": len(new_rows),
+            "updated": len(lists),
+            "catalog": len(ids),
+            "started_at": started_at,
+            "seconds": (datetime.utcnow() - started_at).total_seconds(),
+        }
+        logger.info(f"Similarity index built: {self.last_run}")
+        return self.last_run
+
+    async def _merge_into_existing(self, db: AsyncIOMotorDatabase, catalog: np.ndarray, ids: List[str],
+                                   row_of: Dict[str, int], new_rows: np.ndarray) -> Dict[str, List[Dict[str, Any]]]:
+        """Add new items to the stored lists of existing items they now rank in"""
+        is_new = np.zeros(len(ids), dtype=bool)
+        is_new[new_rows] = True
+        existing_rows = np.flatnonzero(~is_new)
+        if not len(existing_rows):
+            return {}
+
+        thresholds = np.full(len(ids), -np.inf, dtype=np.float32)
+        # Items with a full list only take new neighbours that beat their current k-th
+        async for doc in db.content_similar.find({"min_score": {"$ne": None}}, {"min_score": 1}):
+            row = row_of.get(doc["_id"])
+            if row is not None:
+                thresholds[row] = doc["min_score"]
+
+        similarity = catalog[existing_rows] @ catalog[new_rows].T
+        better = similarity > thresholds[existing_rows][:, None]
+        affected = np.flatnonzero(better.any(axis=1))
+        if not len(affected):
+            return {}
+
+        affected_ids = [ids[existing_rows[position]] for position in affected.tolist()]
+        stored = {
+            doc["_id"]: doc.get("neighbours", [])
+            async for doc in db.content_similar.find({"_id": {"$in": affected_ids}})
+        }
+        new_ids = [ids[row] for row in new_rows.tolist()]
+        merged = {}
+        for position, content_id in zip(affected.tolist(), affected_ids):
+            additions = [
+                {"content_id": new_ids[column], "score": round(float(similarity[position, column]), 6)}
+                for column in np.flatnonzero(better[position]).tolist()
+            ]
+            additions_ids = {item["content_id"] for item in additions}
+            neighbours = [item for item in stored.get(content_id, []) if item["content_id"] not in additions_ids]
+            merged[content_id] = sorted(neighbours + additions, key=lambda item: -item["score"])[:SIMILARITY_TOP_K]
+        return merged
+
+    async def _save_state(self, db: AsyncIOMotorDatabase, watermark: Optional[datetime]):
+        await db.similarity_state.update_one({"_id": STATE_ID}, {"$set": {"watermark": watermark}}, upsert=True)
+
+    def status(self) -> Dict[str, Any]:
+        return {"enabled": SIMILARITY_ENABLED, "last_run": self.last_run}
+
+
+# Global instance
+similarity_service = SimilarityService()
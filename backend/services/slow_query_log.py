@@ -0,0 +1,178 @@
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import monitoring
+from services.metrics_service import command_collection
+from services.tracing import current_trace
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", 100))
+MAX_TRACKED_SHAPES = 1000
+
+# Where each command keeps its query document
+_FILTER_FIELDS = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+}
+_IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "saslStart", "saslContinue", "endSessions",
+                     "ping", "buildInfo", "getMore", "killCursors"}
+
+
+def normalize_shape(value: Any) -> Any:
+    """Replace literal values with placeholders, keeping field names and operators"""
+    if isinstance(value, dict):
+        return {key: normalize_shape(item) for key, item in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        # $in/$and lists collapse to a single element so list length doesn't split shapes
+        shapes = []
+        for item in value:
+            shape = normalize_shape(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return "?"
+
+
+def extract_filter(command_name: str, command: Dict[str, Any]) -> Optional[Any]:
+    field = _FILTER_FIELDS.get(command_name)
+    if field:
+        return command.get(field) or {}
+    if command_name in ("update", "delete"):
+        statements = command.get("updates" if command_name == "update" else "deletes") or []
+        return statements[0].get("q", {}) if statements else {}
+    if command_name == "aggregate":
+        pipeline = command.get("pipeline") or []
+        return pipeline[0].get("$match", {}) if pipeline and "$match" in pipeline[0] else {}
+    return None
+
+
+def extract_sort(command_name: str, command: Dict[str, Any]) -> Optional[Any]:
+    sort = command.get("sort")
+    return normalize_shape(dict(sort)) if sort else None
+
+
+def docs_returned(reply: Dict[str, Any]) -> int:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+    if "n" in reply:
+        return int(reply.get("n") or 0)
+    if "value" in reply:
+        return 1 if reply.get("value") else 0
+    if "values" in reply:
+        return len(reply.get("values") or [])
+    return 0
+
+
+class QueryShapeStats:
+    __slots__ = ("collection", "command", "shape", "count", "slow_count", "total_ms", "max_ms",
+                 "docs_returned", "max_per_request")
+
+    def __init__(self, collection: str, command: str, shape: str):
+        self.collection = collection
+        self.command = command
+        self.shape = shape
+        self.count = 0
+        self.slow_count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.docs_returned = 0
+        self.max_per_request = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "collection": self.collection,
+            "command": self.command,
+            "shape": self.shape,
+            "count": self.count,
+            "slow_count": self.slow_count,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "avg_docs_returned": round(self.docs_returned / self.count, 2) if self.count else 0.0,
+            # Many executions of one shape inside a single request usually means an N+1 loop
+            "max_per_request": self.max_per_request,
+        }
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """Aggregates per-shape command statistics and logs commands over the threshold"""
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_THRESHOLD_MS):
+        self.threshold_ms = threshold_ms
+        self._pending: Dict[Tuple[int, int], Tuple[str, str, str, Any]] = {}
+        self._stats: Dict[Tuple[str, str, str], QueryShapeStats] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        if event.command_name in _IGNORED_COMMANDS:
+            return
+        query = extract_filter(event.command_name, event.command)
+        shape: Dict[str, Any] = {}
+        if query is not None:
+            shape["filter"] = normalize_shape(query)
+        sort = extract_sort(event.command_name, event.command)
+        if sort:
+            shape["sort"] = sort
+        shape_key = json.dumps(shape, sort_keys=True, default=str)
+
+        per_request = 0
+        trace = current_trace()
+        if trace is not None:
+            key = f"{event.command_name}:{command_collection(event.command_name, event.command)}:{shape_key}"
+            per_request = trace.counters.get(key, 0) + 1
+            trace.counters[key] = per_request
+
+        self._pending[(event.request_id, event.operation_id)] = (
+            command_collection(event.command_name, event.command), event.command_name, shape_key, per_request)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        pending = self._pending.pop((event.request_id, event.operation_id), None)
+        if pending is None:
+            return
+        self._record(pending, event.duration_micros / 1000, docs_returned(event.reply))
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        pending = self._pending.pop((event.request_id, event.operation_id), None)
+        if pending is None:
+            return
+        self._record(pending, event.duration_micros / 1000, 0)
+
+    def _record(self, pending: Tuple[str, str, str, int], duration_ms: float, returned: int):
+        collection, command, shape, per_request = pending
+        key = (collection, command, shape)
+        slow = duration_ms >= self.threshold_ms
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= MAX_TRACKED_SHAPES:
+                    return
+                stats = self._stats[key] = QueryShapeStats(collection, command, shape)
+            stats.count += 1
+            stats.total_ms += duration_ms
+            stats.max_ms = max(stats.max_ms, duration_ms)
+            stats.docs_returned += returned
+            stats.max_per_request = max(stats.max_per_request, per_request)
+            if slow:
+                stats.slow_count += 1
+
+        if slow:
+            logger.warning(f"Slow query: {command} {collection} {shape} took {duration_ms:.1f}ms, returned {returned} docs")
+
+    def top(self, limit: int = 20, sort_by: str = "total_ms") -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = [stats.to_dict() for stats in self._stats.values()]
+        rows.sort(key=lambda row: row.get(sort_by, 0), reverse=True)
+        return rows[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+slow_query_listener = SlowQueryListener()
@@ -0,0 +1,509 @@
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from models.content import ContentResponse, ContentRef
+from services.content_service import ContentService, GENRE_ROW_IDS, KIDS_ROW_SIZE
+import numpy as np
+import asyncio
+import json
+import logging
+import mmap
+import os
+
+logger = logging.getLogger(__name__)
+
+# SNAPSHOT_MODE=true serves /content/* read-only from SNAPSHOT_PATH, without Mongo
+SNAPSHOT_MODE = os.environ.get("SNAPSHOT_MODE", "false").lower() == "true"
+SNAPSHOT_PATH = os.environ.get("SNAPSHOT_PATH", "catalog.snapshot")
+
+MAGIC = b"CATSNAP1"
+FORMAT_VERSION = 1
+# Sections start on cache-line boundaries so every array view is aligned
+ALIGNMENT = 64
+SEARCH_LIMIT = 30
+
+# String fields are (offset, length) pairs into one UTF-8 heap; list fields are stored
+# joined with LIST_SEPARATOR
+STRING_FIELDS = [
+    "id", "title", "overview", "poster_path", "backdrop_path", "logo_path", "release_date",
+    "first_air_date", "rating", "seasons", "trailer_url", "certification", "original_language",
+]
+LIST_FIELDS = ["genre_ids", "genre_names"]
+LIST_SEPARATOR = "\x1f"
+CONTENT_TYPES = ["movie", "tv"]
+RECORD_DTYPE = np.dtype(
+    [("tmdb_id", "<i8"), ("vote_average", "<f4"), ("popularity", "<f4"),
+     ("content_type", "u1"), ("adult", "?"), ("kids_safe", "?")]
+    + [(field, "<u4", (2,)) for field in STRING_FIELDS + LIST_FIELDS]
+)
+EXPORT_PROJECTION = {
+    "_id": 0, **{field: 1 for field in STRING_FIELDS + LIST_FIELDS},
+    "tmdb_id": 1, "vote_average": 1, "popularity": 1, "content_type": 1, "adult": 1, "kids_safe": 1,
+}
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def tmdb_key(content_type: str, tmdb_id: int) -> int:
+    """One sortable integer per (type, tmdb_id)"""
+    return tmdb_id * 2 + (content_type == "tv")
+
+
+def write_snapshot(path: str, sections: Dict[str, np.ndarray], meta: Dict[str, Any]):
+    """Write sections after a JSON header, aligned; replaces `path` atomically"""
+    index, offset = {}, 0
+    for name, array in sections.items():
+        offset = _align(offset)
+        dtype = "record" if array.dtype == RECORD_DTYPE else array.dtype.str
+        index[name] = {"offset": offset, "dtype": dtype, "shape": list(array.shape)}
+        offset += array.nbytes
+    header = json.dumps({**meta, "version": FORMAT_VERSION, "sections": index}).encode()
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(MAGIC)
+        file.write(len(header).to_bytes(8, "little"))
+        file.write(header)
+        for name, array in sections.items():
+            file.seek(data_start + index[name]["offset"])
+            file.write(np.ascontiguousarray(array).tobytes())
+        # Covers empty trailing sections, whose offsets lie past the last byte written
+        file.truncate(data_start + offset)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def build_sections(docs: List[Dict[str, Any]], rows: Dict[str, List[str]],
+                   similar: Dict[str, List[str]], top_k: int,
+                   adult_profiles: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+    """Columnar sections for content documents, named rows and similarity lists (by content
+    id), plus the ids of the profiles allowed to see titles that aren't kids-safe"""
+    records = np.zeros(len(docs), dtype=RECORD_DTYPE)
+    heap = bytearray()
+    for index, doc in enumerate(docs):
+        record = records[index]
+        record["tmdb_id"] = doc.get("tmdb_id") or 0
+        record["vote_average"] = doc.get("vote_average") or 0
+        record["popularity"] = doc.get("popularity") or 0
+        record["content_type"] = CONTENT_TYPES.index(doc.get("content_type", "movie"))
+        record["adult"] = bool(doc.get("adult"))
+        record["kids_safe"] = bool(doc.get("kids_safe"))
+        for field in STRING_FIELDS + LIST_FIELDS:
+            value = doc.get(field)
+            if field in LIST_FIELDS:
+                value = LIST_SEPARATOR.join(str(item) for item in value or [])
+            data = (value or "").encode()
+            record[field] = (len(heap), len(data))
+            heap += data
+
+    ids = [doc["id"].encode() for doc in docs]
+    width = max([len(content_id) for content_id in ids] + [1])
+    id_array = np.array(ids, dtype=f"S{width}")
+    id_order = np.argsort(id_array, kind="stable").astype(np.int32)
+    tmdb_keys = np.array([tmdb_key(doc.get("content_type", "movie"), doc.get("tmdb_id") or 0) for doc in docs], dtype=np.int64)
+    tmdb_order = np.argsort(tmdb_keys, kind="stable").astype(np.int32)
+
+    # Lowercased titles, one per line, for substring search straight on the mapping
+    titles = [(doc.get("title") or "").lower().replace("\n", " ").encode() for doc in docs]
+    title_starts = np.zeros(len(titles), dtype=np.int64)
+    position = 0
+    for index, title in enumerate(titles):
+        title_starts[index] = position
+        position += len(title) + 1
+
+    row_of = {doc["id"]: index for index, doc in enumerate(docs)}
+    neighbours = np.full((len(docs), top_k), -1, dtype=np.int32)
+    for content_id, similar_ids in similar.items():
+        if content_id not in row_of:
+            continue
+        found = [row_of[other] for other in similar_ids if other in row_of][:top_k]
+        neighbours[row_of[content_id], :len(found)] = found
+
+    profile_ids = [profile_id.encode() for profile_id in adult_profiles or []]
+    profile_width = max([len(profile_id) for profile_id in profile_ids] + [1])
+
+    sections = {
+        "records": records,
+        "heap": np.frombuffer(bytes(heap), dtype=np.uint8),
+        "ids": id_array[id_order],
+        "id_rows": id_order,
+        "tmdb_keys": tmdb_keys[tmdb_order],
+        "tmdb_rows": tmdb_order,
+        "titles": np.frombuffer(b"\n".join(titles), dtype=np.uint8),
+        "title_starts": title_starts,
+        "similar": neighbours,
+        "adult_profiles": np.sort(np.array(profile_ids, dtype=f"S{profile_width}")),
+    }
+    for name, content_ids in rows.items():
+        sections[f"row:{name}"] = np.array([row_of[content_id] for content_id in content_ids if content_id in row_of], dtype=np.int32)
+    return sections
+
+
+async def export_snapshot(db: AsyncIOMotorDatabase, path: str, top_k: int = 20) -> Dict[str, Any]:
+    """Export `content`, the home rows, the similarity lists and the non-kids profile ids
+    to a snapshot file"""
+    started_at = datetime.utcnow()
+    content_service = ContentService(db)
+    # Rows first: building them may store content that the catalog export must include
+    featured = await content_service.get_featured_content()
+    row_items = {
+        "trending": await content_service.get_trending_content(),
+        "popular": await content_service.get_popular_content(),
+        "featured": [featured] if featured else [],
+    }
+    for genre_name in GENRE_ROW_IDS:
+        row_items[f"genre:{genre_name}"] = await content_service.get_content_by_genre(genre_name)
+    rows = {name: [item.id for item in items] for name, items in row_items.items()}
+
+    docs = [doc for doc in await db.content.find({}, EXPORT_PROJECTION).to_list(None) if doc.get("id")]
+    similar = {}
+    async for doc in db.content_similar.find({}, {"neighbours": 1}):
+        similar[doc["_id"]] = [item["content_id"] for item in doc.get("neighbours", [])]
+
+    adult_profiles = await db.user_profiles.distinct("id", {"is_kids": {"$ne": True}})
+
+    sections = build_sections(docs, rows, similar, top_k, adult_profiles)
+    meta = {"created_at": started_at.isoformat(), "count": len(docs), "rows": sorted(rows)}
+    await asyncio.get_running_loop().run_in_executor(None, write_snapshot, path, sections, meta)
+    return {
+        "path": path,
+        "count": len(docs),
+        "rows": {name: len(ids) for name, ids in rows.items()},
+        "bytes": os.path.getsize(path),
+        "duration_seconds": round((datetime.utcnow() - started_at).total_seconds(), 3),
+    }
+
+
+class CatalogSnapshot:
+    """A snapshot file memory-mapped read-only.
+
+    Every array is a zero-copy view of the mapping, so loading only parses the header and
+    worker processes serving the same file share one page-cached copy. Lookups by content
+    id or (type, tmdb_id) are binary searches over sorted key columns; documents are
+    decoded from the string heap only for the rows a response needs.
+    """
+
+    def __init__(self):
+        self.path: Optional[str] = None
+        self.meta: Dict[str, Any] = {}
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._titles_start = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._mmap is not None
+
+    def load(self, path: str):
+        file = open(path, "rb")
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapped[:len(MAGIC)] != MAGIC:
+            mapped.close()
+            file.close()
+            raise ValueError(f"{path} is not a catalog snapshot")
+        header_length = int.from_bytes(mapped[len(MAGIC):len(MAGIC) + 8], "little")
+        header_start = len(MAGIC) + 8
+        meta = json.loads(mapped[header_start:header_start + header_length])
+        if meta.get("version") != FORMAT_VERSION:
+            mapped.close()
+            file.close()
+            raise ValueError(f"Unsupported snapshot version {meta.get('version')}")
+        data_start = _align(header_start + header_length)
+
+        arrays = {}
+        for name, section in meta.pop("sections").items():
+            dtype = RECORD_DTYPE if section["dtype"] == "record" else np.dtype(section["dtype"])
+            count = int(np.prod(section["shape"], dtype=np.int64))
+            arrays[name] = np.frombuffer(mapped, dtype, count, data_start + section["offset"]).reshape(section["shape"])
+            if name == "titles":
+                self._titles_start = data_start + section["offset"]
+
+        self.close()
+        self.path, self.meta, self._file, self._mmap, self._arrays = path, meta, file, mapped, arrays
+        logger.info(f"Loaded catalog snapshot {path} ({meta['count']} titles, created {meta['created_at']})")
+
+    def close(self):
+        mapped, file = self._mmap, self._file
+        self._arrays, self._mmap, self._file = {}, None, None
+        if mapped is not None:
+            try:
+                mapped.close()
+            except BufferError:
+                # Views still referenced by in-flight requests; freed with them
+                pass
+            file.close()
+
+    def __len__(self) -> int:
+        return len(self._arrays["records"]) if self.loaded else 0
+
+    def _string(self, span: np.ndarray) -> str:
+        start, length = int(span[0]), int(span[1])
+        return self._arrays["heap"][start:start + length].tobytes().decode()
+
+    def document(self, row: int) -> Dict[str, Any]:
+        """The stored `content` document of a row"""
+        record = self._arrays["records"][row]
+        doc: Dict[str, Any] = {field: self._string(record[field]) or None for field in STRING_FIELDS}
+        genre_ids = self._string(record["genre_ids"])
+        genre_names = self._string(record["genre_names"])
+        doc.update(
+            tmdb_id=int(record["tmdb_id"]),
+            vote_average=float(record["vote_average"]),
+            popularity=float(record["popularity"]),
+            content_type=CONTENT_TYPES[record["content_type"]],
+            adult=bool(record["adult"]),
+            kids_safe=bool(record["kids_safe"]),
+            genre_ids=[int(genre_id) for genre_id in genre_ids.split(LIST_SEPARATOR)] if genre_ids else [],
+            genre_names=genre_names.split(LIST_SEPARATOR) if genre_names else [],
+        )
+        return doc
+
+    @property
+    def records(self) -> np.ndarray:
+        return self._arrays["records"]
+
+    def _bytes(self, field: str, width: int) -> Tuple[np.ndarray, np.ndarray]:
+        """The first `width` heap bytes of a string field for every row (zero-padded),
+        and the field lengths"""
+        spans = self._arrays["records"][field]
+        heap = self._arrays["heap"]
+        lengths = spans[:, 1].astype(np.int64)
+        positions = spans[:, 0].astype(np.int64)[:, None] + np.arange(width)
+        inside = np.arange(width) < lengths[:, None]
+        data = heap[np.clip(positions, 0, max(len(heap) - 1, 0))] if len(heap) else np.zeros(positions.shape, dtype=np.uint8)
+        return np.where(inside, data, 0).astype(np.uint8), lengths
+
+    def years(self) -> np.ndarray:
+        """Release (or first air) year of every row, 0 when unknown"""
+        release, release_lengths = self._bytes("release_date", 4)
+        first_air, first_air_lengths = self._bytes("first_air_date", 4)
+        use_release = release_lengths > 0
+        digits = np.where(use_release[:, None], release, first_air).astype(np.int16) - ord("0")
+        lengths = np.where(use_release, release_lengths, first_air_lengths)
+        valid = (lengths >= 4) & np.all((digits >= 0) & (digits <= 9), axis=1)
+        years = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+        return np.where(valid, years, 0).astype(np.int16)
+
+    def dictionary(self, field: str) -> Tuple[np.ndarray, List[str]]:
+        """Dictionary-encode a short string field: a code per row and the distinct values,
+        in order of first appearance"""
+        data, lengths = self._bytes(field, 8)
+        codes = np.unique(data.view("<u8").ravel(), return_inverse=True)[1].ravel()
+        values: List[Optional[str]] = [None] * (int(codes.max()) + 1 if len(codes) else 0)
+        short = np.flatnonzero(lengths <= 8)
+        for row in short[np.unique(codes[short], return_index=True)[1]]:
+            values[codes[row]] = data[row, :lengths[row]].tobytes().decode(errors="ignore")
+        # Longer values don't fit the 8-byte key; decoded one by one
+        long_codes: Dict[str, int] = {}
+        for row in np.flatnonzero(lengths > 8):
+            value = self._string(self._arrays["records"][field][row])
+            if value not in long_codes:
+                long_codes[value] = len(values)
+                values.append(value)
+            codes[row] = long_codes[value]
+
+        first = np.full(len(values), len(codes), dtype=np.int64)
+        np.minimum.at(first, codes, np.arange(len(codes)))
+        order = np.argsort(first, kind="stable")[:np.count_nonzero(first < len(codes))]
+        rank = np.zeros(len(values), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        return rank[codes], [values[code] for code in order]
+
+    def id_lists(self, field: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Parse an integer list field into (row, id) pairs for every row at once"""
+        spans = self._arrays["records"][field]
+        lengths = spans[:, 1].astype(np.int64)
+        total = int(lengths.sum())
+        if not total:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        rows = np.repeat(np.arange(len(spans)), lengths)
+        starts = np.repeat(spans[:, 0].astype(np.int64) - (np.cumsum(lengths) - lengths), lengths)
+        data = self._arrays["heap"][starts + np.arange(total)]
+        separator = data == ord(LIST_SEPARATOR)
+        # A token starts at each row's first byte and after each separator
+        token_start = np.ones(total, dtype=np.bool_)
+        token_start[1:] = separator[:-1] | (rows[1:] != rows[:-1])
+        tokens = np.cumsum(token_start) - 1
+        digit = ~separator
+        token_lengths = np.bincount(tokens[digit], minlength=int(tokens[-1]) + 1)
+        first_byte = np.flatnonzero(token_start)
+        exponent = token_lengths[tokens] - 1 - (np.arange(total) - first_byte[tokens])
+        values = np.bincount(tokens[digit], weights=(data[digit] - ord("0")) * 10.0 ** exponent[digit],
+                             minlength=len(token_lengths))
+        return rows[first_byte], np.rint(values).astype(np.int64)
+
+    def kids_safe(self, rows: np.ndarray) -> np.ndarray:
+        return self._arrays["records"]["kids_safe"][rows]
+
+    def kids_safe_rows(self) -> np.ndarray:
+        """Kids-safe rows, most popular first"""
+        records = self._arrays["records"]
+        rows = np.flatnonzero(records["kids_safe"])
+        return rows[np.argsort(-records["popularity"][rows], kind="stable")]
+
+    def is_adult_profile(self, profile_id: str) -> bool:
+        """Whether the profile was a non-kids profile at export time. Kids profiles,
+        profiles created since and snapshots exported without profiles all say False."""
+        profiles = self._arrays.get("adult_profiles")
+        key = profile_id.encode()
+        if profiles is None or not len(profiles) or len(key) > profiles.dtype.itemsize:
+            return False
+        position = int(np.searchsorted(profiles, np.array([key], dtype=profiles.dtype))[0])
+        return position < len(profiles) and profiles[position] == key
+
+    def row(self, name: str) -> np.ndarray:
+        return self._arrays.get(f"row:{name}", np.zeros(0, dtype=np.int32))
+
+    def rows_by_id(self, content_ids: List[str]) -> List[Optional[int]]:
+        ids = self._arrays["ids"]
+        width = ids.dtype.itemsize
+        keys = [content_id.encode() for content_id in content_ids]
+        positions = np.searchsorted(ids, np.array(keys, dtype=ids.dtype)) if keys else []
+        results = []
+        for key, position in zip(keys, positions):
+            # Longer keys were truncated to the column width and can't be stored ids
+            found = len(key) <= width and position < len(ids) and ids[position] == key
+            results.append(int(self._arrays["id_rows"][position]) if found else None)
+        return results
+
+    def rows_by_tmdb(self, refs: List[ContentRef]) -> List[Optional[int]]:
+        keys = np.array([tmdb_key("tv" if ref.type in ("tv", "series") else "movie", ref.tmdb_id) for ref in refs], dtype=np.int64)
+        sorted_keys = self._arrays["tmdb_keys"]
+        positions = np.searchsorted(sorted_keys, keys)
+        return [
+            int(self._arrays["tmdb_rows"][position]) if position < len(sorted_keys) and sorted_keys[position] == key else None
+            for key, position in zip(keys, positions)
+        ]
+
+    def similar(self, row: int, limit: int) -> np.ndarray:
+        neighbours = self._arrays["similar"][row]
+        return neighbours[neighbours >= 0][:limit]
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT) -> np.ndarray:
+        """Rows whose title contains `query` (case-insensitive), most popular first"""
+        needle = query.strip().lower().replace("\n", " ").encode()
+        if not needle:
+            return np.zeros(0, dtype=np.int32)
+        starts = self._arrays["title_starts"]
+        end = self._titles_start + len(self._arrays["titles"])
+        matches = set()
+        position = self._mmap.find(needle, self._titles_start, end)
+        while position != -1:
+            row = int(np.searchsorted(starts, position - self._titles_start, side="right")) - 1
+            matches.add(row)
+            # Continue after this title: one match per row is enough
+            next_start = starts[row + 1] if row + 1 < len(starts) else end - self._titles_start
+            position = self._mmap.find(needle, self._titles_start + int(next_start), end)
+        rows = np.fromiter(matches, dtype=np.int32, count=len(matches))
+        popularity = self._arrays["records"]["popularity"][rows]
+        return rows[np.argsort(-popularity, kind="stable")][:limit]
+
+
+class SnapshotContentService(ContentService):
+    """ContentService interface served from a `CatalogSnapshot`, without Mongo or TMDB.
+
+    Rows are the ones exported with the snapshot; search matches stored titles only.
+    Profiles live in Mongo, so rows aren't personalised in this mode. Kids filtering
+    fails safe: only profiles exported as non-kids profiles see titles that aren't
+    kids-safe.
+    """
+
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.db = None
+        self.content_collection = None
+        self.snapshot = snapshot
+
+    def _contents(self, rows: Any, fields: Optional[List[str]] = None) -> List[Union[ContentResponse, Dict[str, Any]]]:
+        docs = [self.snapshot.document(int(row)) for row in rows]
+        if fields:
+            return [self._format_content_fields(doc, fields) for doc in docs]
+        return [self._format_content_response(doc) for doc in docs]
+
+    async def get_trending_content(self) -> List[ContentResponse]:
+        return self._contents(self.snapshot.row("trending"))
+
+    async def get_popular_content(self) -> List[ContentResponse]:
+        return self._contents(self.snapshot.row("popular"))
+
+    async def get_featured_content(self) -> Optional[ContentResponse]:
+        featured = self._contents(self.snapshot.row("featured"))
+        return featured[0] if featured else None
+
+    async def get_content_by_genre(self, genre_name: str) -> List[ContentResponse]:
+        return self._contents(self.snapshot.row(f"genre:{genre_name.lower()}"))
+
+    async def search_local(self, query: str, limit: int = SEARCH_LIMIT) -> List[ContentResponse]:
+        return self._contents(self.snapshot.search(query, limit))
+
+    async def search_content(self, query: str) -> List[ContentResponse]:
+        return await self.search_local(query)
+
+    async def search_tmdb(self, query: str) -> List[ContentResponse]:
+        return await self.search_local(query)
+
+    async def get_content_details(self, content_id: str, fields: Optional[List[str]] = None) -> Optional[Union[ContentResponse, Dict[str, Any]]]:
+        row = self.snapshot.rows_by_id([content_id])[0]
+        return self._contents([row], fields)[0] if row is not None else None
+
+    async def get_content_batch(self, refs: List[Union[str, ContentRef]], kids_only: bool = False,
+                                fields: Optional[List[str]] = None) -> List[Optional[Union[ContentResponse, Dict[str, Any]]]]:
+        rows = dict(zip(
+            [index for index, ref in enumerate(refs) if isinstance(ref, str)],
+            self.snapshot.rows_by_id([ref for ref in refs if isinstance(ref, str)])
+        ))
+        rows.update(zip(
+            [index for index, ref in enumerate(refs) if not isinstance(ref, str)],
+            self.snapshot.rows_by_tmdb([ref for ref in refs if not isinstance(ref, str)])
+        ))
+        results = []
+        for index in range(len(refs)):
+            row = rows[index]
+            if row is None or (kids_only and not self.snapshot.kids_safe(np.array([row]))[0]):
+                results.append(None)
+            else:
+                results.append(self._contents([row], fields)[0])
+        return results
+
+    async def get_similar_content(self, content_id: str, limit: int = 20, profile_id: Optional[str] = None,
+                                  fields: Optional[List[str]] = None) -> List[Union[ContentResponse, Dict[str, Any]]]:
+        row = self.snapshot.rows_by_id([content_id])[0]
+        if row is None:
+            return []
+        neighbours = self.snapshot.similar(row, limit)
+        if self._kids_only(profile_id):
+            neighbours = neighbours[self.snapshot.kids_safe(neighbours)]
+        return self._contents(neighbours, fields)
+
+    async def get_kids_content(self) -> List[ContentResponse]:
+        return self._contents(self.snapshot.kids_safe_rows()[:KIDS_ROW_SIZE])
+
+    async def _kids_safe_ids(self, content_ids: List[str]) -> Set[str]:
+        rows = self.snapshot.rows_by_id(content_ids)
+        found = [(content_id, row) for content_id, row in zip(content_ids, rows) if row is not None]
+        safe = self.snapshot.kids_safe(np.array([row for _, row in found], dtype=np.int64))
+        return {content_id for (content_id, _), is_safe in zip(found, safe) if is_safe}
+
+    def _kids_only(self, profile_id: Optional[str]) -> bool:
+        return bool(profile_id) and not self.snapshot.is_adult_profile(profile_id)
+
+    async def browse(self, page: int = 1, page_size: int = 20, profile_id: Optional[str] = None,
+                     fields: Optional[List[str]] = None, facets: bool = True, **filters: Any) -> Dict[str, Any]:
+        if self._kids_only(profile_id):
+            filters["kids_only"] = True
+        return await super().browse(page, page_size, None, fields, facets, **filters)
+
+    async def apply_profile(self, profile_id: Optional[str], rows: Dict[str, List[ContentResponse]],
+                            rerank: bool = True, fill: bool = True) -> Dict[str, List[ContentResponse]]:
+        if self._kids_only(profile_id):
+            rows = await self.filter_kids_safe(rows, fill)
+        return rows
+
+
+# Global instance
+catalog_snapshot = CatalogSnapshot()
+
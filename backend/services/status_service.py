@@ -0,0 +1,217 @@
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import BulkWriteError, CollectionInvalid
+from models.status import StatusCheck
+import asyncio
+import base64
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+STATUS_RETENTION_DAYS = float(os.environ.get("STATUS_RETENTION_DAYS", 7))
+# Used when the server has no time-series collections (MongoDB < 5.0)
+STATUS_CAPPED_BYTES = int(os.environ.get("STATUS_CAPPED_BYTES", 256 * 1024 * 1024))
+STATUS_BATCH_SIZE = int(os.environ.get("STATUS_BATCH_SIZE", 500))
+STATUS_FLUSH_INTERVAL = float(os.environ.get("STATUS_FLUSH_INTERVAL", 1))
+# Writers wait for a flush once this many checks are pending
+STATUS_BUFFER_MAX = int(os.environ.get("STATUS_BUFFER_MAX", 10000))
+# Checks kept for retry while Mongo is failing; the oldest are dropped beyond it
+STATUS_RETRY_MAX = int(os.environ.get("STATUS_RETRY_MAX", 50000))
+DUPLICATE_KEY = 11000
+
+
+def encode_cursor(check: Dict[str, Any]) -> str:
+    payload = json.dumps([check["timestamp"].isoformat(), check["id"]])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Raises ValueError for a malformed cursor"""
+    try:
+        timestamp, check_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp), check_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class StatusService:
+    """Buffered ingestion and bounded reads for client status checks.
+
+    Checks go to a time-series collection (a capped one on older servers) in batches:
+    POST appends to an in-process buffer that is flushed with one `insert_many` every
+    STATUS_FLUSH_INTERVAL seconds or STATUS_BATCH_SIZE checks, so reads may trail writes
+    by up to a flush interval. Batches that fail stay buffered and are retried on the next
+    flush (a retry after a dropped connection may store a check twice), up to
+    STATUS_RETRY_MAX checks.
+
+    A `status_checks` collection created before this service was added is a plain one:
+    it gets a TTL index on `timestamp` instead of the time-series retention.
+    """
+
+    def __init__(self):
+        self.flushed = 0
+        self.dropped = 0
+        self._buffer: List[Dict[str, Any]] = []
+        # Batches that failed to write, oldest first; retried before the buffer
+        self._failed: List[List[Dict[str, Any]]] = []
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def ensure_collection(self, db: AsyncIOMotorDatabase):
+        retention = int(STATUS_RETENTION_DAYS * 86400)
+        try:
+            await db.create_collection(
+                "status_checks",
+                timeseries={"timeField": "timestamp", "metaField": "client_name", "granularity": "seconds"},
+                expireAfterSeconds=retention
+            )
+        except CollectionInvalid:
+            pass  # Already exists
+        except Exception as e:
+            logger.warning(f"Time-series status_checks unavailable, using a capped collection: {str(e)}")
+            try:
+                await db.create_collection("status_checks", capped=True, size=STATUS_CAPPED_BYTES)
+            except CollectionInvalid:
+                pass
+
+        indexes = [
+            ([("client_name", 1), ("timestamp", -1)], {}),
+            # Unfiltered pages and rollups sort and range on (timestamp, id) alone
+            ([("timestamp", -1), ("id", -1)], {}),
+        ]
+        info = await self._collection_info(db)
+        if info.get("type") != "timeseries" and not info.get("options", {}).get("capped"):
+            # A plain collection from before time-series: expire checks with a TTL index
+            indexes.append(([("timestamp", 1)], {"expireAfterSeconds": retention}))
+        for keys, options in indexes:
+            try:
+                await db.status_checks.create_index(keys, **options)
+            except Exception as e:
+                logger.error(f"Error creating status_checks index {keys}: {str(e)}")
+
+    async def _collection_info(self, db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+        try:
+            result = await db.command("listCollections", filter={"name": "status_checks"})
+        except Exception as e:
+            logger.debug(f"Could not inspect status_checks: {str(e)}")
+            return {}
+        batch = result.get("cursor", {}).get("firstBatch", [])
+        return batch[0] if batch else {}
+
+    def start(self, db: AsyncIOMotorDatabase):
+        self._db = db
+        if self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run_forever(db))
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    async def _run_forever(self, db: AsyncIOMotorDatabase):
+        try:
+            await self.ensure_collection(db)
+        except Exception as e:
+            logger.error(f"Error creating status_checks collection: {str(e)}")
+        while True:
+            await asyncio.sleep(STATUS_FLUSH_INTERVAL)
+            await self.flush()
+
+    async def record(self, db: AsyncIOMotorDatabase, check: StatusCheck):
+        """Queue a check for the next batch insert"""
+        self._db = db
+        self._buffer.append(check.dict())
+        if len(self._buffer) >= STATUS_BUFFER_MAX:
+            await self.flush()
+        elif len(self._buffer) >= STATUS_BATCH_SIZE or self._task is None:
+            # Without the background flusher (e.g. before startup) nothing else would write it
+            asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        async with self._flush_lock:
+            if self._db is None:
+                return
+            while self._buffer:
+                self._failed.append(self._buffer[:STATUS_BATCH_SIZE])
+                self._buffer = self._buffer[STATUS_BATCH_SIZE:]
+            while self._failed:
+                batch = self._failed[0]
+                try:
+                    await self._db.status_checks.insert_many(batch, ordered=False)
+                except BulkWriteError as e:
+                    # Keep only the checks that weren't written
+                    failed = {error["index"] for error in e.details.get("writeErrors", []) if error.get("code") != DUPLICATE_KEY}
+                    self._failed[0] = [check for index, check in enumerate(batch) if index in failed]
+                    self.flushed += len(batch) - len(self._failed[0])
+                    if self._failed[0] or e.details.get("writeConcernErrors"):
+                        logger.error(f"Error writing {len(self._failed[0])} status checks, retrying on the next flush: {str(e)}")
+                        self._drop_overflow()
+                        return
+                except Exception as e:
+                    logger.error(f"Error writing {len(batch)} status checks, retrying on the next flush: {str(e)}")
+                    self._drop_overflow()
+                    return
+                else:
+                    self.flushed += len(batch)
+                self._failed.pop(0)
+
+    def _drop_overflow(self):
+        while len(self._failed) > 1 and sum(len(batch) for batch in self._failed) > STATUS_RETRY_MAX:
+            batch = self._failed.pop(0)
+            self.dropped += len(batch)
+            logger.error(f"Dropped {len(batch)} unwritten status checks: retry buffer full")
+
+    async def get_rollups(self, db: AsyncIOMotorDatabase, minutes: int,
+                          client_name: Optional[str] = None) -> Dict[str, Any]:
+        """Checks per client per minute over the last `minutes` minutes"""
+        until = datetime.utcnow()
+        since = until - timedelta(minutes=minutes)
+        match: Dict[str, Any] = {"timestamp": {"$gte": since}}
+        if client_name:
+            match["client_name"] = client_name
+        buckets = []
+        async for row in db.status_checks.aggregate([
+            {"$match": match},
+            {"$group": {
+                # Date arithmetic rather than $dateTrunc (5.0+): the capped-collection fallback
+                # exists for servers older than that
+                "_id": {"client_name": "$client_name", "minute": {"$subtract": [
+                    "$timestamp", {"$mod": [{"$toLong": "$timestamp"}, 60000]}
+                ]}},
+                "count": {"$sum": 1},
+            }},
+            {"$sort": {"_id.minute": 1, "_id.client_name": 1}},
+        ]):
+            buckets.append({**row["_id"], "count": row["count"]})
+        return {"since": since, "until": until, "buckets": buckets}
+
+    async def get_page(self, db: AsyncIOMotorDatabase, limit: int, cursor: Optional[str] = None,
+                       client_name: Optional[str] = None) -> Dict[str, Any]:
+        """Newest-first raw checks, continuing after `cursor`"""
+        query: Dict[str, Any] = {}
+        if client_name:
+            query["client_name"] = client_name
+        if cursor:
+            timestamp, check_id = decode_cursor(cursor)
+            query["$or"] = [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "id": {"$lt": check_id}},
+            ]
+        items = await db.status_checks.find(query, {"_id": 0}).sort(
+            [("timestamp", -1), ("id", -1)]
+        ).limit(limit + 1).to_list(limit + 1)
+        next_cursor = encode_cursor(items[limit - 1]) if len(items) > limit else None
+        return {"items": items[:limit], "next_cursor": next_cursor}
+
+
+# Global instance
+status_service = StatusService()
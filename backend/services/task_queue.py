@@ -0,0 +1,369 @@
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from collections import deque
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import asyncio
+import logging
+import os
+import random
+import socket
+import uuid
+
+logger = logging.getLogger(__name__)
+
+TASK_QUEUE_ENABLED = os.environ.get("TASK_QUEUE_ENABLED", "true").lower() == "true"
+# Workers per queue on every process, as "queue=count,..."; unlisted queues get one
+TASK_QUEUES = os.environ.get("TASK_QUEUES", "default=4,tmdb=2,builds=1")
+TASK_LEASE_SECONDS = float(os.environ.get("TASK_LEASE_SECONDS", 60))
+TASK_POLL_INTERVAL = float(os.environ.get("TASK_POLL_INTERVAL", 1))
+TASK_MAX_ATTEMPTS = int(os.environ.get("TASK_MAX_ATTEMPTS", 5))
+TASK_BACKOFF_SECONDS = float(os.environ.get("TASK_BACKOFF_SECONDS", 5))
+TASK_BACKOFF_MAX_SECONDS = float(os.environ.get("TASK_BACKOFF_MAX_SECONDS", 600))
+# Finished tasks are kept this long for the admin view, then removed by a TTL index
+TASK_RETENTION_HOURS = float(os.environ.get("TASK_RETENTION_HOURS", 24))
+# How long shutdown waits for running tasks before handing them back to the queue
+TASK_DRAIN_SECONDS = float(os.environ.get("TASK_DRAIN_SECONDS", 20))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+Handler = Callable[[AsyncIOMotorDatabase, Dict[str, Any]], Awaitable[Any]]
+
+
+def parse_queues(raw: str) -> Dict[str, int]:
+    queues = {}
+    for part in raw.split(","):
+        name, _, count = part.strip().partition("=")
+        if name:
+            queues[name.strip()] = max(int(count or 1), 1)
+    return queues
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Exponential backoff with jitter after the `attempts`-th failure"""
+    delay = min(TASK_BACKOFF_SECONDS * 2 ** (attempts - 1), TASK_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(int(len(ordered) * pct), len(ordered) - 1)], 3)
+
+
+class TaskQueue:
+    """Durable background tasks in the `tasks` collection.
+
+    Handlers are registered by name on a queue; every process runs the configured
+    number of workers per queue. A worker claims the highest-priority due task with
+    `find_one_and_update`, holding a lease it renews while the handler runs, so tasks of
+    a crashed worker are picked up again once the lease lapses. Failures are retried
+    with exponential backoff up to `max_attempts`; a task whose lease lapsed more often
+    than that (it keeps crashing its worker) is failed instead of claimed again. A
+    `dedup_key` allows only one queued/running task per key (enforced by a unique sparse
+    index on `active_key`). Periodic tasks are due per fleet: `task_schedule` holds each
+    one's next run, and only the process that moves it forward enqueues the run.
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.queues = parse_queues(TASK_QUEUES)
+        self._handlers: Dict[str, Tuple[str, Handler]] = {}
+        self._periodic: Dict[str, float] = {}
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._indexes: Optional[asyncio.Task] = None
+        self._wake: Dict[str, asyncio.Event] = {}
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._stopping = False
+        # Recent (wait seconds, run seconds) per queue on this process
+        self._latencies: Dict[str, Deque[Tuple[float, float]]] = {}
+
+    def register(self, name: str, handler: Handler, queue: str = "default", every: Optional[float] = None):
+        """Register a handler; `every` also enqueues it at that interval, deduplicated on
+        the task name so callers enqueueing with `dedup_key=name` share the pending run"""
+        self._handlers[name] = (queue, handler)
+        if every:
+            self._periodic[name] = every
+
+    async def ensure_indexes(self, db: AsyncIOMotorDatabase):
+        await db.tasks.create_index([("queue", 1), ("status", 1), ("priority", -1), ("run_at", 1)])
+        await db.tasks.create_index([("status", 1), ("leased_until", 1)])
+        await db.tasks.create_index("active_key", unique=True, sparse=True)
+        await db.tasks.create_index("finished_at", expireAfterSeconds=int(TASK_RETENTION_HOURS * 3600))
+
+    async def _create_indexes(self, db: AsyncIOMotorDatabase):
+        try:
+            await self.ensure_indexes(db)
+        except Exception as e:
+            logger.error(f"Error creating task indexes: {str(e)}")
+
+    async def enqueue(self, name: str, payload: Optional[Dict[str, Any]] = None, priority: int = 0,
+                      dedup_key: Optional[str] = None, delay: float = 0,
+                      max_attempts: int = TASK_MAX_ATTEMPTS) -> Optional[str]:
+        """Queue a task; returns its id, or None if one with `dedup_key` is already pending"""
+        if self._db is None:
+            raise RuntimeError("Task queue is not started")
+        if name not in self._handlers:
+            raise ValueError(f"No handler registered for task '{name}'")
+        queue = self._handlers[name][0]
+        now = datetime.utcnow()
+        task = {
+            "_id": uuid.uuid4().hex,
+            "name": name,
+            "queue": queue,
+            "payload": payload or {},
+            "priority": priority,
+            "status": QUEUED,
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "created_at": now,
+            "run_at": now + timedelta(seconds=delay),
+        }
+        if dedup_key:
+            task["active_key"] = dedup_key
+            # Deduplication relies on the unique index
+            await self._indexes
+        try:
+            await self._db.tasks.insert_one(task)
+        except DuplicateKeyError:
+            return None
+        if delay <= 0 and queue in self._wake:
+            self._wake[queue].set()
+        return task["_id"]
+
+    def submit(self, name: str, payload: Optional[Dict[str, Any]] = None, **kwargs):
+        """Fire-and-forget `enqueue` for synchronous callers"""
+        if not TASK_QUEUE_ENABLED or self._db is None:
+            return
+
+        async def enqueue():
+            try:
+                await self.enqueue(name, payload, **kwargs)
+            except Exception as e:
+                logger.error(f"Error enqueueing task {name}: {str(e)}")
+        asyncio.ensure_future(enqueue())
+
+    def start(self, db: AsyncIOMotorDatabase):
+        if not TASK_QUEUE_ENABLED:
+            if self._handlers:
+                logger.warning(
+                    f"TASK_QUEUE_ENABLED=false: tasks {sorted(self._handlers)} will not run, "
+                    f"including the periodic {sorted(self._periodic)}"
+                )
+            return
+        if self._workers:
+            return
+        self._db = db
+        self._stopping = False
+        self._indexes = asyncio.create_task(self._create_indexes(db))
+        self._workers.append(asyncio.create_task(self._maintain(db)))
+        queues = set(self.queues) | {queue for queue, _ in self._handlers.values()}
+        for queue in sorted(queues):
+            self._wake[queue] = asyncio.Event()
+            for _ in range(self.queues.get(queue, 1)):
+                self._workers.append(asyncio.create_task(self._work(db, queue)))
+
+    async def stop(self):
+        """Stop claiming tasks, let running ones finish for up to TASK_DRAIN_SECONDS,
+        then cancel the rest and hand them back to the queue"""
+        if not self._workers:
+            return
+        self._stopping = True
+        for event in self._wake.values():
+            event.set()
+        running = list(self._running.values())
+        if running:
+            logger.info(f"Draining {len(running)} running tasks")
+            await asyncio.wait(running, timeout=TASK_DRAIN_SECONDS)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _maintain(self, db: AsyncIOMotorDatabase):
+        await self._indexes
+        # When this process next looks at each schedule entry
+        next_check = {name: 0.0 for name in self._periodic}
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            for name, interval in self._periodic.items():
+                if loop.time() < next_check[name]:
+                    continue
+                try:
+                    wait = await self._schedule(db, name, interval)
+                    if wait is None:
+                        await self.enqueue(name, dedup_key=name)
+                        wait = interval
+                    next_check[name] = loop.time() + wait
+                except Exception as e:
+                    logger.error(f"Error scheduling task {name}: {str(e)}")
+            await asyncio.sleep(TASK_POLL_INTERVAL)
+
+    async def _schedule(self, db: AsyncIOMotorDatabase, name: str, interval: float) -> Optional[float]:
+        """Claim a due periodic run for this process (None), or return seconds until it is due"""
+        now = datetime.utcnow()
+        try:
+            # Matches only a due entry; the upsert creates a missing one and fails on the
+            # _id for one that isn't due yet
+            await db.task_schedule.find_one_and_update(
+                {"_id": name, "next_run": {"$lte": now}},
+                {"$set": {"next_run": now + timedelta(seconds=interval), "worker": self.worker_id}},
+                upsert=True
+            )
+            return None
+        except DuplicateKeyError:
+            entry = await db.task_schedule.find_one({"_id": name})
+            if entry is None:
+                return 0
+            return min(max((entry["next_run"] - now).total_seconds(), 0), interval)
+
+    async def _claim(self, db: AsyncIOMotorDatabase, queue: str) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        return await db.tasks.find_one_and_update(
+            {
+                "queue": queue,
+                "$or": [
+                    {"status": QUEUED, "run_at": {"$lte": now}},
+                    # Lease of a crashed or stalled worker ran out
+                    {"status": RUNNING, "leased_until": {"$lt": now}},
+                ],
+            },
+            {
+                "$set": {"status": RUNNING, "worker": self.worker_id, "started_at": now,
+                         "leased_until": now + timedelta(seconds=TASK_LEASE_SECONDS)},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", -1), ("run_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _work(self, db: AsyncIOMotorDatabase, queue: str):
+        await self._indexes
+        while not self._stopping:
+            try:
+                task = await self._claim(db, queue)
+            except Exception as e:
+                logger.error(f"Error claiming {queue} task: {str(e)}")
+                task = None
+            if task is not None and task["attempts"] > task.get("max_attempts", TASK_MAX_ATTEMPTS):
+                # Only reachable through lapsed leases: every attempt took its worker down
+                await self._fail(db, task, RuntimeError("lease expired on every attempt"))
+                continue
+            if task is None:
+                wake = self._wake[queue]
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout=TASK_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                wake.clear()
+                continue
+
+            execution = asyncio.create_task(self._execute(db, task))
+            self._running[task["_id"]] = execution
+            try:
+                # Shielded so a drain timeout cancels the worker, not the task mid-write
+                await asyncio.shield(execution)
+            except asyncio.CancelledError:
+                execution.cancel()
+                await self._release(db, task)
+                raise
+            finally:
+                self._running.pop(task["_id"], None)
+
+    async def _execute(self, db: AsyncIOMotorDatabase, task: Dict[str, Any]):
+        started = datetime.utcnow()
+        renewer = asyncio.create_task(self._renew_lease(db, task["_id"]))
+        try:
+            handler = self._handlers.get(task["name"])
+            if handler is None:
+                raise LookupError(f"No handler registered for task '{task['name']}'")
+            await handler[1](db, task["payload"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self._fail(db, task, e)
+            return
+        finally:
+            renewer.cancel()
+        finished = datetime.utcnow()
+        await db.tasks.update_one(
+            {"_id": task["_id"], "worker": self.worker_id},
+            {"$set": {"status": DONE, "finished_at": finished}, "$unset": {"active_key": "", "leased_until": "", "error": ""}}
+        )
+        wait = (started - task["run_at"]).total_seconds()
+        self._latencies.setdefault(task["queue"], deque(maxlen=500)).append(
+            (max(wait, 0), (finished - started).total_seconds())
+        )
+
+    async def _fail(self, db: AsyncIOMotorDatabase, task: Dict[str, Any], error: Exception):
+        now = datetime.utcnow()
+        message = f"{type(error).__name__}: {str(error)}"
+        if task["attempts"] < task.get("max_attempts", TASK_MAX_ATTEMPTS):
+            delay = backoff_seconds(task["attempts"])
+            logger.warning(f"Task {task['name']} failed (attempt {task['attempts']}), retrying in {delay:.0f}s: {message}")
+            update = {"$set": {"status": QUEUED, "run_at": now + timedelta(seconds=delay), "error": message},
+                      "$unset": {"leased_until": ""}}
+        else:
+            logger.error(f"Task {task['name']} failed permanently after {task['attempts']} attempts: {message}")
+            update = {"$set": {"status": FAILED, "finished_at": now, "error": message},
+                      "$unset": {"active_key": "", "leased_until": ""}}
+        await db.tasks.update_one({"_id": task["_id"], "worker": self.worker_id}, update)
+
+    async def _release(self, db: AsyncIOMotorDatabase, task: Dict[str, Any]):
+        """Hand an interrupted task back without counting the attempt"""
+        try:
+            await db.tasks.update_one(
+                {"_id": task["_id"], "worker": self.worker_id, "status": RUNNING},
+                {"$set": {"status": QUEUED, "run_at": datetime.utcnow()},
+                 "$unset": {"leased_until": ""}, "$inc": {"attempts": -1}}
+            )
+        except Exception as e:
+            logger.error(f"Error releasing task {task['_id']}: {str(e)}")
+
+    async def _renew_lease(self, db: AsyncIOMotorDatabase, task_id: str):
+        while True:
+            await asyncio.sleep(TASK_LEASE_SECONDS / 3)
+            try:
+                await db.tasks.update_one(
+                    {"_id": task_id, "worker": self.worker_id, "status": RUNNING},
+                    {"$set": {"leased_until": datetime.utcnow() + timedelta(seconds=TASK_LEASE_SECONDS)}}
+                )
+            except Exception as e:
+                logger.error(f"Error renewing task lease: {str(e)}")
+
+    async def stats(self, db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+        """Depth per queue and status, age of the oldest due task, and this process's latencies"""
+        now = datetime.utcnow()
+        queues: Dict[str, Dict[str, Any]] = {}
+        async for row in db.tasks.aggregate([
+            {"$group": {"_id": {"queue": "$queue", "status": "$status"}, "count": {"$sum": 1}}},
+        ]):
+            queue = queues.setdefault(row["_id"]["queue"], {"depth": {}})
+            queue["depth"][row["_id"]["status"]] = row["count"]
+        for name, queue in queues.items():
+            oldest = await db.tasks.find_one(
+                {"queue": name, "status": QUEUED, "run_at": {"$lte": now}}, {"run_at": 1}, sort=[("run_at", 1)]
+            )
+            queue["oldest_due_seconds"] = round((now - oldest["run_at"]).total_seconds(), 3) if oldest else 0
+            latencies = list(self._latencies.get(name, []))
+            queue["wait_seconds"] = {"p50": percentile([wait for wait, _ in latencies], 0.5),
+                                     "p95": percentile([wait for wait, _ in latencies], 0.95)}
+            queue["run_seconds"] = {"p50": percentile([run for _, run in latencies], 0.5),
+                                    "p95": percentile([run for _, run in latencies], 0.95)}
+            queue["workers"] = self.queues.get(name, 1)
+        return {
+            "worker": self.worker_id,
+            "running": len(self._running),
+            "handlers": sorted(self._handlers),
+            "queues": queues,
+        }
+
+
+# Global instance
+task_queue = TaskQueue()
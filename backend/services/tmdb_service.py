@@ -2,10 +2,22 @@ import httpx
 import asyncio
 from typing import List, Optional, Dict, Any
 import logging
+import os
+import time
 from datetime import datetime
+from services.metrics_service import observe_tmdb_request, tmdb_requests_in_flight
+from services.tracing import span
+from services.cache import TwoTierCache
+from services.circuit_breaker import CircuitBreaker
 
 logger = logging.getLogger(__name__)
 
+# Sub-resources fetched together with the details by `get_enriched_details`
+ENRICHMENT_APPENDS = {
+    "movie": "videos,release_dates,images",
+    "tv": "videos,content_ratings,images",
+}
+
 class TMDBService:
     def __init__(self):
         self.api_keys = [
@@ -13,9 +25,22 @@ class TMDBService:
             "3cb41ecea3bf606c56552db3d17adefd"
         ]
         self.current_key_index = 0
-        self.base_url = "https://api.themoviedb.org/3"
+        self.base_url = os.environ.get("TMDB_BASE_URL", "https://api.themoviedb.org/3")
         self.image_base_url = "https://image.tmdb.org/t/p/w500"
         self.backdrop_base_url = "https://image.tmdb.org/t/p/original"
+        # Optional httpx transport override (e.g. httpx.MockTransport in benchmarks)
+        self.transport = None
+        # Successful responses are shared by every worker for TMDB_CACHE_TTL seconds
+        self.response_cache = TwoTierCache(
+            "tmdb",
+            maxsize=int(os.environ.get("TMDB_CACHE_SIZE", 2048)),
+            ttl=float(os.environ.get("TMDB_CACHE_TTL", 600))
+        )
+        self.breaker = CircuitBreaker(
+            "tmdb",
+            failure_threshold=int(os.environ.get("TMDB_BREAKER_THRESHOLD", 5)),
+            reset_timeout=float(os.environ.get("TMDB_BREAKER_RESET_SECONDS", 30))
+        )
         
     def get_current_api_key(self) -> str:
         return self.api_keys[self.current_key_index]
@@ -24,32 +49,66 @@ class TMDBService:
         self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
         logger.info(f"Rotated to API key index: {self.current_key_index}")
 
+    def cache_key(self, endpoint: str, params: Dict[str, Any]) -> str:
+        query = "&".join(f"{key}={params[key]}" for key in sorted(params) if key != 'api_key')
+        return f"{endpoint}?{query}"
+
     async def make_request(self, endpoint: str, params: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
         if params is None:
             params = {}
         
+        key = self.cache_key(endpoint, params)
+        return await self.response_cache.get_or_load(key, lambda: self._fetch(endpoint, params))
+
+    async def _fetch(self, endpoint: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Call TMDB (behind the circuit breaker), rotating the API key on rate limits"""
+        if not self.breaker.allow_request():
+            logger.warning(f"TMDB circuit open, skipping request to {endpoint}")
+            return None
+        
         params['api_key'] = self.get_current_api_key()
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
+        async with httpx.AsyncClient(timeout=30.0, transport=self.transport) as client:
             try:
-                response = await client.get(f"{self.base_url}{endpoint}", params=params)
+                response = await self._get(client, endpoint, params)
                 
                 if response.status_code == 429:  # Rate limit
                     logger.warning("Rate limit hit, rotating API key")
                     self.rotate_api_key()
                     params['api_key'] = self.get_current_api_key()
-                    response = await client.get(f"{self.base_url}{endpoint}", params=params)
+                    response = await self._get(client, endpoint, params)
                 
                 if response.status_code == 200:
+                    self.breaker.record_success()
                     return response.json()
                 else:
+                    # Only server-side failures count against the breaker, not e.g. 404s
+                    if response.status_code >= 500 or response.status_code == 429:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()
                     logger.error(f"TMDB API error: {response.status_code} - {response.text}")
                     return None
                     
             except Exception as e:
+                self.breaker.record_failure()
                 logger.error(f"Error making TMDB request: {str(e)}")
                 return None
 
+    async def _get(self, client: httpx.AsyncClient, endpoint: str, params: Dict[str, Any]) -> httpx.Response:
+        """Issue a single TMDB GET, recording latency and outcome metrics"""
+        status = "error"
+        tmdb_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            with span("tmdb", endpoint):
+                response = await client.get(f"{self.base_url}{endpoint}", params=params)
+            status = str(response.status_code)
+            return response
+        finally:
+            tmdb_requests_in_flight.dec()
+            observe_tmdb_request(endpoint, params.get('api_key', ''), status, time.perf_counter() - started)
+
     async def get_trending_movies(self, time_window: str = "week") -> List[Dict[str, Any]]:
         """Get trending movies"""
         data = await self.make_request(f"/trending/movie/{time_window}")
@@ -112,6 +171,58 @@ class TMDBService:
         data = await self.make_request(f"/tv/{tv_id}/videos")
         return data.get("results", []) if data else []
 
+    async def get_certification(self, tmdb_id: int, content_type: str) -> Optional[str]:
+        """Get the US certification (movie release dates or TV content ratings)"""
+        if content_type == "movie":
+            data = await self.make_request(f"/movie/{tmdb_id}/release_dates")
+        else:
+            data = await self.make_request(f"/tv/{tmdb_id}/content_ratings")
+        return self.extract_certification(data.get("results", []) if data else [], content_type)
+
+    async def get_enriched_details(self, tmdb_id: int, content_type: str) -> Optional[Dict[str, Any]]:
+        """Details plus videos, certifications and logos in a single request"""
+        return await self.make_request(f"/{content_type}/{tmdb_id}", {
+            "append_to_response": ENRICHMENT_APPENDS[content_type],
+            # Only English and text-less logos instead of every language
+            "include_image_language": "en,null",
+        })
+
+    def parse_enrichment(self, details: Dict[str, Any], content_type: str) -> Dict[str, Any]:
+        """Stored `content` fields from a `get_enriched_details` response"""
+        ratings = details.get("release_dates" if content_type == "movie" else "content_ratings") or {}
+        certification = self.extract_certification(ratings.get("results", []), content_type)
+        return {
+            "certification": certification,
+            "rating": self.get_content_rating(details, content_type, certification),
+            "seasons": self.get_content_seasons(details, content_type),
+            "logo_path": self.extract_logo(details.get("images") or {}),
+            "trailer_url": self.extract_youtube_trailer((details.get("videos") or {}).get("results", [])),
+            "popularity": details.get("popularity", 0),
+            "vote_average": details.get("vote_average", 0),
+        }
+
+    def extract_logo(self, images: Dict[str, Any], language: str = "en") -> Optional[str]:
+        """Best-voted logo in `language`, falling back to text-less ones"""
+        logos = [logo for logo in images.get("logos", []) if logo.get("file_path")]
+        if not logos:
+            return None
+        best = min(logos, key=lambda logo: (logo.get("iso_639_1") != language, -(logo.get("vote_average") or 0)))
+        return best["file_path"]
+
+    def extract_certification(self, results: List[Dict[str, Any]], content_type: str, country: str = "US") -> Optional[str]:
+        """Pick a country's certification from release_dates/content_ratings results"""
+        for entry in results:
+            if entry.get("iso_3166_1") != country:
+                continue
+            if content_type != "movie":
+                return entry.get("rating") or None
+            # Theatrical release first, then any release that carries a certification
+            release_dates = sorted(entry.get("release_dates", []), key=lambda release: release.get("type") != 3)
+            for release in release_dates:
+                if release.get("certification"):
+                    return release["certification"]
+        return None
+
     async def get_genres(self) -> Dict[str, List[Dict[str, Any]]]:
         """Get all genres for movies and TV shows"""
         movie_genres = await self.make_request("/genre/movie/list")
@@ -149,13 +260,22 @@ class TMDBService:
                 pass
         return "2023"
 
-    def get_content_rating(self, item: Dict[str, Any], content_type: str) -> str:
-        """Get content rating based on content type"""
+    def get_content_rating(self, item: Dict[str, Any], content_type: str, certification: Optional[str] = None) -> str:
+        """The US certification when known, otherwise a guess from the content type"""
+        if certification:
+            return certification
         if content_type == "movie":
             return "PG-13" if not item.get("adult", False) else "R"
         else:
             return "TV-14"  # Default for TV shows
 
+    def get_content_seasons(self, item: Dict[str, Any], content_type: str) -> Optional[str]:
+        """Season count label for TV shows"""
+        if content_type != "tv":
+            return None
+        seasons = item.get("number_of_seasons", 1)
+        return f"{seasons} Season{'s' if seasons != 1 else ''}"
+
     def format_content_response(self, item: Dict[str, Any], content_type: str, trailer_url: Optional[str] = None) -> Dict[str, Any]:
         """Format TMDB response to match frontend expected format"""
         title = item.get("title") or item.get("name", "Unknown Title")
@@ -170,7 +290,7 @@ class TMDBService:
             "year": str(self.get_content_year(item)),
             "genre": [genre["name"] for genre in item.get("genres", [])] if item.get("genres") else ["Drama"],
             "description": item.get("overview"),
-            "seasons": f"{item.get('number_of_seasons', 1)} Season{'s' if item.get('number_of_seasons', 1) != 1 else ''}" if content_type == "tv" else None,
+            "seasons": self.get_content_seasons(item, content_type),
             "trailerUrl": trailer_url,
             "tmdb_id": item.get("id"),
             "vote_average": item.get("vote_average", 0),
@@ -0,0 +1,208 @@
+from typing import Any, Dict, List, Optional
+from contextvars import ContextVar
+from contextlib import contextmanager
+from pymongo import monitoring
+from services.metrics_service import command_collection
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+MAX_SPANS_PER_TRACE = 2000
+
+# Request-scoped trace; Motor copies the context into its executor threads, so
+# command listeners see the trace of the request that issued the command.
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+
+
+class Span:
+    __slots__ = ("category", "name", "start", "duration", "attrs")
+
+    def __init__(self, category: str, name: str, start: float, duration: float, attrs: Optional[Dict[str, Any]] = None):
+        self.category = category
+        self.name = name
+        self.start = start
+        self.duration = duration
+        self.attrs = attrs
+
+
+class Trace:
+    def __init__(self, method: str, path: str, sampled: bool = False):
+        self.trace_id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.sampled = sampled
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self.route: Optional[str] = None
+        # Set when the endpoint function returns; the rest is response serialisation
+        self.endpoint_end: Optional[float] = None
+        # Free-form per-request counters (e.g. executions per query shape)
+        self.counters: Dict[str, int] = {}
+
+    def add(self, category: str, name: str, start: float, duration: float, attrs: Optional[Dict[str, Any]] = None):
+        if len(self.spans) >= MAX_SPANS_PER_TRACE:
+            self.dropped += 1
+            return
+        # list.append is atomic, so listener threads can record concurrently
+        self.spans.append(Span(category, name, start, duration, attrs))
+
+    def summary(self) -> Dict[str, List[float]]:
+        """Total duration (ms) and span count per category"""
+        totals: Dict[str, List[float]] = {}
+        for span in list(self.spans):
+            entry = totals.setdefault(span.category, [0.0, 0])
+            entry[0] += span.duration * 1000
+            entry[1] += 1
+        return totals
+
+    def server_timing(self, total: float) -> str:
+        parts = []
+        for category, (duration_ms, count) in self.summary().items():
+            parts.append(f'{category};dur={duration_ms:.1f};desc="{count}"')
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+    def to_dict(self, status: int, total: float) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": status,
+            "timestamp": self.wall_start,
+            "duration_ms": round(total * 1000, 3),
+            "dropped_spans": self.dropped,
+            "spans": [
+                {
+                    "category": span.category,
+                    "name": span.name,
+                    "offset_ms": round((span.start - self.start) * 1000, 3),
+                    "duration_ms": round(span.duration * 1000, 3),
+                    **({"attrs": span.attrs} if span.attrs else {}),
+                }
+                for span in sorted(self.spans, key=lambda span: span.start)
+            ],
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def start_trace(method: str, path: str, sampled: bool = False):
+    trace = Trace(method, path, sampled)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+
+@contextmanager
+def span(category: str, name: str, **attrs):
+    """Record a span on the current request's trace (no-op outside a request)"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(category, name, started, time.perf_counter() - started, attrs or None)
+
+
+def traced(category: str, name: Optional[str] = None):
+    """Decorator recording a span around an async function"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            trace = _current_trace.get()
+            if trace is None:
+                return await func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                trace.add(category, span_name, started, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+class MongoTraceListener(monitoring.CommandListener):
+    """Turns pymongo command events into `mongo` spans on the issuing request's trace"""
+
+    def __init__(self):
+        self._pending: Dict[Any, Any] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        trace = _current_trace.get()
+        if trace is None:
+            return
+        self._pending[(event.request_id, event.operation_id)] = (
+            trace, time.perf_counter(), command_collection(event.command_name, event.command))
+
+    def _finish(self, event, error: bool = False):
+        pending = self._pending.pop((event.request_id, event.operation_id), None)
+        if pending is None:
+            return
+        trace, started, collection = pending
+        attrs = {"error": True} if error else None
+        trace.add("mongo", f"{event.command_name} {collection}", started, event.duration_micros / 1e6, attrs)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finish(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finish(event, error=True)
+
+
+mongo_trace_listener = MongoTraceListener()
+
+
+class TraceSampler:
+    """Decides which traces to keep and appends them as JSON lines from a writer thread"""
+
+    def __init__(self):
+        self.sample_rate = float(os.environ.get("TRACE_SAMPLE_RATE", 0))
+        self.log_path = os.environ.get("TRACE_LOG_PATH", "traces.jsonl")
+        self._queue: "queue.SimpleQueue[Dict[str, Any]]" = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def should_sample(self, forced: bool = False) -> bool:
+        return forced or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def submit(self, record: Dict[str, Any]):
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+                    self._writer.start()
+        self._queue.put(record)
+
+    def _write_loop(self):
+        while True:
+            record = self._queue.get()
+            try:
+                with open(self.log_path, "a") as handle:
+                    handle.write(json.dumps(record, default=str) + "\n")
+                    while not self._queue.empty():
+                        handle.write(json.dumps(self._queue.get(), default=str) + "\n")
+            except Exception as e:
+                logger.error(f"Error writing trace: {str(e)}")
+
+
+trace_sampler = TraceSampler()
@@ -1,8 +1,12 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Union
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from models.user import UserProfile, UserProfileCreate, MyListItem, MyListItemCreate, ViewingProgress, ViewingProgressCreate, ViewingProgressUpdate
+from models.user import UserProfile, UserProfileCreate, MyListItem, MyListItemCreate, ViewingProgressCreate, ViewingProgressUpdate
 from models.content import ContentResponse
 from services.content_service import ContentService
+from services.recommendation_service import recommendation_service
+from services.personalization_service import personalization_service
+from services.kids_service import kids_service
+from services.watch_event_service import watch_event_service, VIEW_FIELDS
 import logging
 
 logger = logging.getLogger(__name__)
@@ -73,26 +77,29 @@ class UserService:
             logger.error(f"Error creating profile: {str(e)}")
             return None
 
-    async def get_my_list(self, profile_id: str) -> List[ContentResponse]:
+    async def get_my_list(self, profile_id: str, fields: Optional[List[str]] = None) -> List[Union[ContentResponse, Dict[str, Any]]]:
         """Get user's my list"""
         try:
             my_list_items = await self.my_list_collection.find({"profile_id": profile_id}).to_list(100)
+            content_ids = [item["content_id"] for item in my_list_items]
+            contents = await self.content_service.get_content_batch(content_ids, fields=fields)
+            if fields:
+                return [content for content in contents if content]
+            
+            # Progress for every listed item in one query
+            if watch_event_service.has_pending(profile_id):
+                await watch_event_service.flush()
+            progress_docs = await self.progress_collection.find({
+                "profile_id": profile_id,
+                "content_id": {"$in": content_ids}
+            }).to_list(len(content_ids))
+            progress_by_content = {doc["content_id"]: doc["progress"] for doc in progress_docs}
             
             content_list = []
-            for item in my_list_items:
-                content = await self.content_service.get_content_details(item["content_id"])
+            for item, content in zip(my_list_items, contents):
                 if content:
-                    # Add progress if available
-                    progress_doc = await self.progress_collection.find_one({
-                        "profile_id": profile_id,
-                        "content_id": item["content_id"]
-                    })
-                    
                     content_dict = content.dict()
-                    if progress_doc:
-                        content_dict["progress"] = progress_doc["progress"]
-                    else:
-                        content_dict["progress"] = 0
+                    content_dict["progress"] = progress_by_content.get(item["content_id"], 0)
                     
                     content_list.append(ContentResponse(**content_dict))
             
@@ -121,6 +128,7 @@ class UserService:
             )
             
             await self.my_list_collection.insert_one(my_list_item.dict())
+            personalization_service.invalidate(profile_id)
             return True
 
         except Exception as e:
@@ -134,23 +142,31 @@ class UserService:
                 "profile_id": profile_id,
                 "content_id": content_id
             })
+            personalization_service.invalidate(profile_id)
+            if result.deleted_count:
+                await recommendation_service.record_removal(self.db, profile_id, content_id)
             return result.deleted_count > 0
 
         except Exception as e:
             logger.error(f"Error removing from my list: {str(e)}")
             return False
 
-    async def get_continue_watching(self, profile_id: str) -> List[ContentResponse]:
+    async def get_continue_watching(self, profile_id: str, fields: Optional[List[str]] = None) -> List[Union[ContentResponse, Dict[str, Any]]]:
         """Get continue watching list with progress"""
         try:
+            if watch_event_service.has_pending(profile_id):
+                await watch_event_service.flush()
             progress_items = await self.progress_collection.find({
                 "profile_id": profile_id,
                 "progress": {"$gt": 0, "$lt": 100}
             }).sort("last_watched", -1).limit(20).to_list(20)
             
+            contents = await self.content_service.get_content_batch([item["content_id"] for item in progress_items], fields=fields)
+            if fields:
+                return [content for content in contents if content]
+            
             content_list = []
-            for item in progress_items:
-                content = await self.content_service.get_content_details(item["content_id"])
+            for item, content in zip(progress_items, contents):
                 if content:
                     content_dict = content.dict()
                     content_dict["progress"] = item["progress"]
@@ -165,31 +181,34 @@ class UserService:
             logger.error(f"Error getting continue watching: {str(e)}")
             return []
 
+    async def get_recommendations(self, profile_id: str, limit: int = 20,
+                                  fields: Optional[List[str]] = None) -> List[Union[ContentResponse, Dict[str, Any]]]:
+        """Get precomputed "because you watched" recommendations"""
+        try:
+            items = await recommendation_service.get_profile_recommendations(self.db, profile_id, limit)
+            kids_only = await kids_service.is_kids_profile(self.db, profile_id)
+            return await self.content_service.get_contents_by_ids([item["content_id"] for item in items], kids_only, fields)
+        except Exception as e:
+            logger.error(f"Error getting recommendations: {str(e)}")
+            return []
+
     async def update_viewing_progress(self, profile_id: str, content_id: str, progress_data: ViewingProgressUpdate) -> bool:
         """Update viewing progress"""
         try:
-            # Try to update existing progress
-            result = await self.progress_collection.update_one(
-                {"profile_id": profile_id, "content_id": content_id},
-                {"$set": {**progress_data.dict(exclude_none=True), "last_watched": ViewingProgress().last_watched}}
-            )
+            previous = await watch_event_service.get_latest(self.db, profile_id, content_id)
+            values = progress_data.dict(exclude_none=True)
             
-            if result.matched_count == 0:
-                # Create new progress entry
+            if previous:
+                tmdb_id, content_type = previous["tmdb_id"], previous["content_type"]
+            else:
+                # First progress for this title
                 content = await self.content_service.get_content_details(content_id)
-                if not content:
+                if not content or values.get("progress") is None:
                     return False
-                
-                viewing_progress = ViewingProgress(
-                    profile_id=profile_id,
-                    content_id=content_id,
-                    tmdb_id=content.tmdb_id,
-                    content_type=content.type,
-                    **progress_data.dict(exclude_none=True)
-                )
-                
-                await self.progress_collection.insert_one(viewing_progress.dict())
+                tmdb_id, content_type = content.tmdb_id, content.type
             
+            # The profile vector is invalidated once the flush writes viewing_progress
+            await watch_event_service.record(self.db, profile_id, content_id, tmdb_id, content_type, values, previous)
             return True
 
         except Exception as e:
@@ -199,20 +218,25 @@ class UserService:
     async def create_viewing_progress(self, profile_id: str, progress_data: ViewingProgressCreate) -> bool:
         """Create viewing progress entry"""
         try:
-            viewing_progress = ViewingProgress(
-                profile_id=profile_id,
-                **progress_data.dict()
+            previous = await watch_event_service.get_latest(self.db, profile_id, progress_data.content_id)
+            # Every view field is set, replacing the previous state as before
+            values = {field: getattr(progress_data, field) for field in VIEW_FIELDS}
+            await watch_event_service.record(
+                self.db, profile_id, progress_data.content_id, progress_data.tmdb_id,
+                progress_data.content_type, values, previous
             )
-            
-            # Upsert the progress
-            await self.progress_collection.replace_one(
-                {"profile_id": profile_id, "content_id": progress_data.content_id},
-                viewing_progress.dict(),
-                upsert=True
-            )
-            
             return True
 
         except Exception as e:
             logger.error(f"Error creating viewing progress: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+
+    async def get_watch_time(self, profile_id: str, days: int = 30) -> List[Dict[str, Any]]:
+        """Daily watch time for a profile"""
+        try:
+            if watch_event_service.has_pending(profile_id):
+                await watch_event_service.flush()
+            return await watch_event_service.get_daily_watch_time(self.db, profile_id, days)
+        except Exception as e:
+            logger.error(f"Error getting watch time: {str(e)}")
+            return []
\ No newline at end of file
@@ -0,0 +1,83 @@
+from typing import Any, Dict, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.content_service import ContentService, DEFAULT_GENRE_ROWS
+from services.tmdb_service import tmdb_service
+from datetime import datetime
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.environ.get("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_TIMEOUT = float(os.environ.get("WARMUP_TIMEOUT", 120))
+
+
+class WarmupService:
+    """Prefetches the home page rows into the TMDB/row caches and the content collection"""
+
+    def __init__(self):
+        self.completed = not WARMUP_ENABLED
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.rows: Dict[str, int] = {}
+        self.errors: List[str] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, db: AsyncIOMotorDatabase):
+        """Run the warm-up in the background so the worker stays live while it warms"""
+        if not WARMUP_ENABLED or self._task is not None:
+            return
+        self._task = asyncio.create_task(self.run(db))
+
+    async def run(self, db: AsyncIOMotorDatabase):
+        self.started_at = datetime.utcnow()
+        content_service = ContentService(db)
+        rows = [
+            ("featured", content_service.get_featured_content),
+            ("trending", content_service.get_trending_content),
+            ("popular", content_service.get_popular_content),
+        ] + [
+            (f"genre:{genre_name}", lambda genre_name=genre_name: content_service.get_content_by_genre(genre_name))
+            for genre_name in DEFAULT_GENRE_ROWS
+        ]
+
+        for name, build_row in rows:
+            try:
+                result = await asyncio.wait_for(build_row(), timeout=WARMUP_TIMEOUT)
+                count = len(result) if isinstance(result, list) else int(result is not None)
+                self.rows[name] = count
+                if not count:
+                    self.errors.append(f"{name}: empty")
+            except Exception as e:
+                self.errors.append(f"{name}: {str(e)}")
+                logger.error(f"Error warming {name}: {str(e)}")
+
+        self.finished_at = datetime.utcnow()
+        # A cold TMDB shouldn't keep the worker out of rotation forever: readiness
+        # only needs warm-up to have finished, degraded rows are reported separately.
+        self.completed = True
+        logger.info(f"Warm-up finished in {(self.finished_at - self.started_at).total_seconds():.1f}s: {self.rows}")
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": WARMUP_ENABLED,
+            "completed": self.completed,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "rows": self.rows,
+            "errors": self.errors,
+            "tmdb_breaker": tmdb_service.breaker.state,
+        }
+
+
+# Global instance
+warmup_service = WarmupService()
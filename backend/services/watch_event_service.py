@@ -0,0 +1,307 @@
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from models.user import WatchEvent
+from services.cache import TTLCache, MISSING
+from services.personalization_service import personalization_service
+import asyncio
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+WATCH_EVENT_RETENTION_DAYS = float(os.environ.get("WATCH_EVENT_RETENTION_DAYS", 365))
+WATCH_EVENT_FLUSH_INTERVAL = float(os.environ.get("WATCH_EVENT_FLUSH_INTERVAL", 0.5))
+WATCH_EVENT_BATCH_SIZE = int(os.environ.get("WATCH_EVENT_BATCH_SIZE", 500))
+# Events kept for retry while Mongo is failing; the oldest batches are dropped beyond it
+WATCH_EVENT_BUFFER_MAX = int(os.environ.get("WATCH_EVENT_BUFFER_MAX", 50000))
+# Batch ids remembered on each watch_daily document, so a retried $inc applies once
+WATCH_DAILY_BATCH_HISTORY = 50
+DUPLICATE_KEY = 11000
+# Longest gap between two progress events of a title still counted as watching
+WATCH_MAX_GAP_SECONDS = float(os.environ.get("WATCH_MAX_GAP_SECONDS", 300))
+
+# Last event per (profile, content) on this worker, so consecutive heartbeats don't
+# need a read to compute the time watched between them
+latest_events = TTLCache(
+    "watch_latest",
+    maxsize=int(os.environ.get("WATCH_LATEST_CACHE_SIZE", 10000)),
+    ttl=WATCH_MAX_GAP_SECONDS
+)
+
+VIEW_FIELDS = ["progress", "current_episode", "season_number", "episode_number", "time_left"]
+
+
+def watch_seconds(previous: Optional[Dict[str, Any]], progress: Optional[float], watched_at: datetime) -> float:
+    """Seconds since the previous event of the same title, if playback moved forward"""
+    if not previous or progress is None or progress <= (previous.get("progress") or 0):
+        return 0
+    gap = (watched_at - previous["last_watched"]).total_seconds()
+    return gap if 0 < gap <= WATCH_MAX_GAP_SECONDS else 0
+
+
+class WatchEventService:
+    """Append-only watch events with a derived latest-progress view and daily rollups.
+
+    Every progress write becomes a `watch_events` document (a regular collection, so the
+    unique `_id` makes re-inserting an event a no-op; a TTL index applies the retention).
+    Events are buffered and flushed every WATCH_EVENT_FLUSH_INTERVAL seconds with one
+    `insert_many`, one bulk upsert of `viewing_progress` (the latest state per profile and
+    title, coalesced in memory) and one bulk `$inc` of `watch_daily`, the per-profile
+    watch time for each UTC day.
+
+    A flushed batch stays pending until all three writes succeed, and batches are written
+    oldest first, so a failure is retried on the next flush without reordering progress.
+    Each write is safe to repeat: events are keyed by their id, progress is a `$set`, and
+    `watch_daily` records the batch ids it has counted.
+
+    Buffers are per worker: reads flush them first when they hold the profile's writes
+    (`has_pending`), but a read served by another worker sees a write only after this
+    worker's next flush, up to WATCH_EVENT_FLUSH_INTERVAL later.
+    """
+
+    def __init__(self):
+        self.flushed = 0
+        self.dropped = 0
+        self._events: List[Dict[str, Any]] = []
+        self._views: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._daily: Dict[Tuple[str, str], List[float]] = {}
+        # Batches swapped out of the buffers but not fully written yet, oldest first
+        self._pending: List[Dict[str, Any]] = []
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def ensure_collections(self, db: AsyncIOMotorDatabase):
+        """Indexes of the three collections, each created on its own so one failure
+        doesn't leave the others missing"""
+        await self._warn_if_timeseries(db)
+        indexes = [
+            (db.watch_events, [("profile_id", 1), ("watched_at", -1)], {}),
+            (db.watch_events, [("watched_at", 1)], {"expireAfterSeconds": int(WATCH_EVENT_RETENTION_DAYS * 86400)}),
+            (db.watch_daily, [("profile_id", 1), ("date", -1)], {}),
+        ]
+        for collection, keys, options in indexes:
+            try:
+                await collection.create_index(keys, **options)
+            except Exception as e:
+                logger.error(f"Error creating {collection.name} index {keys}: {str(e)}")
+        await self._ensure_progress_index(db)
+
+    async def _warn_if_timeseries(self, db: AsyncIOMotorDatabase):
+        try:
+            result = await db.command("listCollections", filter={"name": "watch_events"})
+        except Exception as e:
+            logger.debug(f"Could not inspect watch_events: {str(e)}")
+            return
+        for info in result.get("cursor", {}).get("firstBatch", []):
+            if info.get("type") == "timeseries":
+                # No unique _id there: a retried insert after a partial failure duplicates events
+                logger.warning("watch_events is a time-series collection; retried flushes may duplicate "
+                               "events until it is renamed and recreated as a regular collection")
+
+    async def _ensure_progress_index(self, db: AsyncIOMotorDatabase):
+        """Unique (profile_id, content_id) on viewing_progress, after removing the duplicate
+        rows older versions inserted (the most recently watched one is kept)"""
+        keys = [("profile_id", 1), ("content_id", 1)]
+        try:
+            await db.viewing_progress.create_index(keys, unique=True)
+            return
+        except (DuplicateKeyError, OperationFailure) as e:
+            if not isinstance(e, DuplicateKeyError) and e.code != DUPLICATE_KEY:
+                logger.error(f"Error creating viewing_progress index: {str(e)}")
+                return
+        try:
+            removed = await self._dedupe_progress(db)
+            logger.warning(f"Removed {removed} duplicate viewing_progress rows")
+            await db.viewing_progress.create_index(keys, unique=True)
+        except Exception as e:
+            logger.error(f"Error creating unique viewing_progress index, using a non-unique one: {str(e)}")
+            await db.viewing_progress.create_index(keys)
+
+    async def _dedupe_progress(self, db: AsyncIOMotorDatabase) -> int:
+        seen = set()
+        duplicates = []
+        cursor = db.viewing_progress.find({}, {"_id": 1, "profile_id": 1, "content_id": 1}).sort("last_watched", -1)
+        async for doc in cursor:
+            key = (doc.get("profile_id"), doc.get("content_id"))
+            if key in seen:
+                duplicates.append(doc["_id"])
+            seen.add(key)
+        for start in range(0, len(duplicates), 1000):
+            await db.viewing_progress.delete_many({"_id": {"$in": duplicates[start:start + 1000]}})
+        return len(duplicates)
+
+    def start(self, db: AsyncIOMotorDatabase):
+        self._db = db
+        if self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run_forever(db))
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    async def _run_forever(self, db: AsyncIOMotorDatabase):
+        try:
+            await self.ensure_collections(db)
+        except Exception as e:
+            logger.error(f"Error creating watch event collections: {str(e)}")
+        while True:
+            await asyncio.sleep(WATCH_EVENT_FLUSH_INTERVAL)
+            await self.flush()
+
+    async def get_latest(self, db: AsyncIOMotorDatabase, profile_id: str, content_id: str) -> Optional[Dict[str, Any]]:
+        """Latest known state of a title for a profile, including unflushed events"""
+        key = (profile_id, content_id)
+        if key in self._views:
+            return self._views[key]
+        for batch in reversed(self._pending):
+            if key in batch["views"]:
+                return batch["views"][key]
+        cached = latest_events.get(key)
+        if cached is not MISSING:
+            return cached
+        return await db.viewing_progress.find_one({"profile_id": profile_id, "content_id": content_id}, {"_id": 0})
+
+    async def record(self, db: AsyncIOMotorDatabase, profile_id: str, content_id: str, tmdb_id: int,
+                     content_type: str, values: Dict[str, Any], previous: Optional[Dict[str, Any]] = None) -> WatchEvent:
+        """Append a progress event; `values` are the view fields it sets"""
+        self._db = db
+        event = WatchEvent(
+            profile_id=profile_id, content_id=content_id, tmdb_id=tmdb_id, content_type=content_type, **values
+        )
+        event.watch_seconds = watch_seconds(previous, values.get("progress"), event.watched_at)
+        self._events.append({"_id": event.id, **event.dict()})
+
+        key = (profile_id, content_id)
+        view = {**(self._views.get(key) or {}), **values,
+                "profile_id": profile_id, "content_id": content_id,
+                "tmdb_id": tmdb_id, "content_type": content_type, "last_watched": event.watched_at}
+        self._views[key] = view
+        latest_events.set(key, {**(previous or {}), **view})
+
+        daily = self._daily.setdefault((profile_id, event.watched_at.strftime("%Y-%m-%d")), [0, 0])
+        daily[0] += event.watch_seconds
+        daily[1] += 1
+
+        if len(self._events) >= WATCH_EVENT_BATCH_SIZE:
+            await self.flush()
+        return event
+
+    def has_pending(self, profile_id: str) -> bool:
+        """Whether this worker holds unwritten events of the profile (other workers' aren't visible)"""
+        return any(key[0] == profile_id for key in self._views) or any(
+            key[0] == profile_id for batch in self._pending for key in batch["views"]
+        )
+
+    async def flush(self):
+        async with self._flush_lock:
+            if self._db is None:
+                return
+            if self._events:
+                self._pending.append({
+                    "id": uuid.uuid4().hex, "events": self._events, "views": self._views, "daily": self._daily,
+                    "count": len(self._events), "written": set(),
+                })
+                self._events, self._views, self._daily = [], {}, {}
+            while self._pending:
+                batch = self._pending[0]
+                try:
+                    await self._write_batch(self._db, batch)
+                except Exception as e:
+                    logger.error(f"Error writing {batch['count']} watch events, retrying on the next flush: {str(e)}")
+                    self._drop_overflow()
+                    return
+                self._pending.pop(0)
+                self.flushed += batch["count"]
+
+    def _drop_overflow(self):
+        while len(self._pending) > 1 and sum(batch["count"] for batch in self._pending) > WATCH_EVENT_BUFFER_MAX:
+            batch = self._pending.pop(0)
+            self.dropped += batch["count"]
+            logger.error(f"Dropped {batch['count']} unwritten watch events: retry buffer full")
+
+    async def _write_batch(self, db: AsyncIOMotorDatabase, batch: Dict[str, Any]):
+        """Write one batch; the steps that succeeded are skipped when it is retried"""
+        written = batch["written"]
+        if "events" not in written:
+            try:
+                await db.watch_events.insert_many(batch["events"], ordered=False)
+            except BulkWriteError as e:
+                # Duplicate ids were inserted by an earlier attempt; keep only the real failures
+                failed = [error["index"] for error in e.details.get("writeErrors", []) if error.get("code") != DUPLICATE_KEY]
+                batch["events"] = [batch["events"][index] for index in failed]
+                if failed or e.details.get("writeConcernErrors"):
+                    raise
+            written.add("events")
+
+        if "views" not in written:
+            await db.viewing_progress.bulk_write([
+                UpdateOne(
+                    {"profile_id": profile_id, "content_id": content_id},
+                    {
+                        "$set": {field: value for field, value in view.items() if field != "last_watched"},
+                        # Flushes from several workers may land out of order
+                        "$max": {"last_watched": view["last_watched"]},
+                        "$setOnInsert": {"id": str(uuid.uuid4())},
+                    },
+                    upsert=True
+                )
+                for (profile_id, content_id), view in batch["views"].items()
+            ], ordered=False)
+            written.add("views")
+            # Vectors built from viewing_progress before this write are stale now
+            for profile_id in {profile_id for profile_id, _ in batch["views"]}:
+                personalization_service.invalidate(profile_id)
+
+        if "daily" not in written:
+            now = datetime.utcnow()
+
+            def increment(profile_id: str, date: str, seconds: float, count: int, upsert: bool) -> UpdateOne:
+                return UpdateOne(
+                    # A day that already counted this batch doesn't match
+                    {"_id": f"{profile_id}:{date}", "batches": {"$ne": batch["id"]}},
+                    {
+                        "$inc": {"watch_seconds": seconds, "events": count},
+                        "$set": {"updated_at": now},
+                        "$push": {"batches": {"$each": [batch["id"]], "$slice": -WATCH_DAILY_BATCH_HISTORY}},
+                        "$setOnInsert": {"profile_id": profile_id, "date": date},
+                    },
+                    upsert=upsert
+                )
+
+            days = [(profile_id, date, seconds, count) for (profile_id, date), (seconds, count) in batch["daily"].items()]
+            try:
+                await db.watch_daily.bulk_write([increment(*day, upsert=True) for day in days], ordered=False)
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                if e.details.get("writeConcernErrors") or any(error.get("code") != DUPLICATE_KEY for error in errors):
+                    raise
+                # The day exists now: either it already counted this batch, or another
+                # worker created it first. Without upsert the update applies only in the
+                # second case (matching nothing means the batch is already counted).
+                await db.watch_daily.bulk_write(
+                    [increment(*days[error["index"]], upsert=False) for error in errors], ordered=False
+                )
+            written.add("daily")
+
+    async def get_daily_watch_time(self, db: AsyncIOMotorDatabase, profile_id: str, days: int) -> List[Dict[str, Any]]:
+        """Watch time per UTC day for the last `days` days, newest first"""
+        since = (datetime.utcnow() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        return await db.watch_daily.find(
+            {"profile_id": profile_id, "date": {"$gte": since}},
+            {"_id": 0, "date": 1, "watch_seconds": 1, "events": 1}
+        ).sort("date", -1).to_list(days)
+
+
+# Global instance
+watch_event_service = WatchEventService()
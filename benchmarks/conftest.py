@@ -0,0 +1,125 @@
+"""
+Shared fixtures for the service-layer microbenchmarks
+
+Dataset sizes come from BENCH_SIZES (default "1k", e.g. "1k,10k,100k"), the timed
+window per benchmark from BENCH_MIN_TIME seconds, and BENCH_OUTPUT optionally names
+a JSON file for machine-readable results. Run with `python -m pytest benchmarks -s`.
+"""
+
+import asyncio
+import gc
+import inspect
+import json
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+
+def parse_sizes(raw: str) -> List[int]:
+    sizes = []
+    for token in raw.split(","):
+        token = token.strip().lower()
+        if not token:
+            continue
+        multiplier = 1
+        if token.endswith("k"):
+            multiplier, token = 1000, token[:-1]
+        elif token.endswith("m"):
+            multiplier, token = 1000000, token[:-1]
+        sizes.append(int(float(token) * multiplier))
+    return sizes
+
+
+BENCH_SIZES = parse_sizes(os.environ.get("BENCH_SIZES", "1k"))
+BENCH_MIN_TIME = float(os.environ.get("BENCH_MIN_TIME", 0.2))
+
+
+def size_id(size: int) -> str:
+    return f"{size // 1000}k" if size >= 1000 and size % 1000 == 0 else str(size)
+
+
+class BenchmarkRunner:
+    """Times a callable (sync or async) and counts the allocations of one call"""
+
+    def __init__(self):
+        self.results: List[Dict[str, Any]] = []
+
+    def run(self, name: str, size: int, fn: Callable[[], Any], ops_per_call: int = 1) -> Dict[str, Any]:
+        is_async = inspect.iscoroutinefunction(fn)
+
+        async def call():
+            if is_async:
+                await fn()
+            else:
+                fn()
+
+        async def measure() -> Dict[str, Any]:
+            await call()  # warm-up
+
+            calls = 0
+            started = time.perf_counter()
+            elapsed = 0.0
+            while elapsed < BENCH_MIN_TIME or calls == 0:
+                await call()
+                calls += 1
+                elapsed = time.perf_counter() - started
+
+            gc.collect()
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+            await call()
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+
+            ops = calls * ops_per_call
+            return {
+                "benchmark": name,
+                "size": size,
+                "calls": calls,
+                "ops": ops,
+                "ops_per_sec": round(ops / elapsed, 1),
+                "us_per_op": round(elapsed / ops * 1e6, 3),
+                "alloc_blocks_per_op": round(blocks / ops_per_call, 2),
+                "alloc_peak_bytes_per_op": round(peak / ops_per_call, 1),
+            }
+
+        result = asyncio.run(measure())
+        self.results.append(result)
+        return result
+
+
+_runner = BenchmarkRunner()
+
+
+@pytest.fixture
+def bench() -> BenchmarkRunner:
+    return _runner
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    if not _runner.results:
+        return
+    terminalreporter.write_sep("=", "service microbenchmarks")
+    header = f"{'benchmark':<45}{'size':>8}{'ops/sec':>14}{'us/op':>12}{'blocks/op':>12}{'peak B/op':>12}"
+    terminalreporter.write_line(header)
+    for result in _runner.results:
+        terminalreporter.write_line(
+            f"{result['benchmark']:<45}{size_id(result['size']):>8}{result['ops_per_sec']:>14.1f}"
+            f"{result['us_per_op']:>12.2f}{result['alloc_blocks_per_op']:>12.1f}{result['alloc_peak_bytes_per_op']:>12.0f}"
+        )
+    output = os.environ.get("BENCH_OUTPUT")
+    if output:
+        Path(output).write_text(json.dumps({"min_time": BENCH_MIN_TIME, "results": _runner.results}, indent=2))
+        terminalreporter.write_line(f"results written to {output}")
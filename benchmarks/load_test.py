@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+"""
+Netflix Clone Backend Load Test
+Launches the FastAPI app against a local Mongo and the local TMDB stub, drives
+concurrent load across every /api route and reports throughput and latency percentiles
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+BACKEND_DIR = ROOT_DIR / "backend"
+TIMEOUT = 30.0
+
+
+class RouteSpec:
+    def __init__(self, name: str, method: str, path: Callable[["LoadContext"], str],
+                 body: Optional[Callable[["LoadContext"], Dict[str, Any]]] = None,
+                 weight: int = 1, params: Optional[Callable[["LoadContext"], Dict[str, Any]]] = None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.body = body
+        self.weight = weight
+        self.params = params
+
+
+class LoadContext:
+    """Ids discovered while seeding, shared by all workers"""
+
+    def __init__(self, seed: int):
+        self.rng = random.Random(seed)
+        self.profile_ids: List[str] = []
+        self.content: List[Dict[str, Any]] = []
+
+    def profile_id(self) -> str:
+        return self.rng.choice(self.profile_ids)
+
+    def content_item(self) -> Dict[str, Any]:
+        return self.rng.choice(self.content)
+
+    def content_payload(self) -> Dict[str, Any]:
+        item = self.content_item()
+        return {
+            "content_id": item["id"],
+            "tmdb_id": item["tmdb_id"],
+            "content_type": "tv" if item["type"] == "series" else "movie",
+        }
+
+    def batch_payload(self, size: int = 20) -> Dict[str, Any]:
+        """Content ids, a quarter of them as (type, tmdb_id) refs"""
+        ids: List[Any] = []
+        for item in self.rng.sample(self.content, min(size, len(self.content))):
+            if self.rng.random() < 0.25:
+                ids.append({"type": item["type"], "tmdb_id": item["tmdb_id"]})
+            else:
+                ids.append(item["id"])
+        return {"ids": ids}
+
+    def browse_params(self) -> Dict[str, Any]:
+        """A random mix of catalog filters, sorts and pages"""
+        params: Dict[str, Any] = {
+            "sort": self.rng.choice(["popularity", "rating", "year"]),
+            "page": self.rng.randint(1, 3),
+        }
+        if self.rng.random() < 0.5:
+            params["genres"] = ",".join(self.rng.sample(GENRES, self.rng.randint(1, 2)))
+            params["genre_mode"] = self.rng.choice(["all", "any"])
+        if self.rng.random() < 0.3:
+            params["type"] = self.rng.choice(["movie", "series"])
+        if self.rng.random() < 0.3:
+            params["year_min"] = self.rng.choice([1980, 1990, 2000, 2010])
+        if self.rng.random() < 0.3:
+            params["rating_min"] = self.rng.choice([5, 6, 7])
+        return params
+
+    def progress_payload(self) -> Dict[str, Any]:
+        return {**self.content_payload(), "progress": round(self.rng.uniform(1, 99), 1)}
+
+
+SEARCH_TERMS = ["stub", "movie 1", "show 2", "stub movie 42", "nothing-matches"]
+IMAGE_SIZES = ["thumbnail", "card", "hero"]
+GENRES = ["action", "comedy", "drama", "horror", "thriller", "sci-fi"]
+
+ROUTES: List[RouteSpec] = [
+    RouteSpec("GET /api/", "GET", lambda ctx: "/api/"),
+    RouteSpec("GET /api/health", "GET", lambda ctx: "/api/health"),
+    RouteSpec("GET /api/health/live", "GET", lambda ctx: "/api/health/live"),
+    RouteSpec("GET /api/health/ready", "GET", lambda ctx: "/api/health/ready"),
+    RouteSpec("GET /api/metrics", "GET", lambda ctx: "/api/metrics"),
+    RouteSpec("POST /api/status", "POST", lambda ctx: "/api/status",
+              body=lambda ctx: {"client_name": f"load-{ctx.rng.randint(0, 9)}"}),
+    RouteSpec("GET /api/status", "GET", lambda ctx: "/api/status"),
+    RouteSpec("GET /api/status/raw", "GET", lambda ctx: "/api/status/raw"),
+    RouteSpec("GET /api/content/featured", "GET", lambda ctx: "/api/content/featured", weight=3),
+    RouteSpec("GET /api/content/trending", "GET", lambda ctx: "/api/content/trending", weight=5),
+    RouteSpec("GET /api/content/popular", "GET", lambda ctx: "/api/content/popular", weight=5),
+    RouteSpec("GET /api/content/genre/{genre_name}", "GET",
+              lambda ctx: f"/api/content/genre/{ctx.rng.choice(GENRES)}", weight=4),
+    RouteSpec("GET /api/content/search", "GET", lambda ctx: "/api/content/search",
+              params=lambda ctx: {"q": ctx.rng.choice(SEARCH_TERMS)}, weight=3),
+    RouteSpec("GET /api/content/browse", "GET", lambda ctx: "/api/content/browse",
+              params=lambda ctx: ctx.browse_params(), weight=3),
+    RouteSpec("GET /api/content/{content_id}", "GET",
+              lambda ctx: f"/api/content/{ctx.content_item()['id']}", weight=5),
+    RouteSpec("POST /api/content/batch", "POST", lambda ctx: "/api/content/batch",
+              body=lambda ctx: ctx.batch_payload(), weight=2),
+    RouteSpec("GET /api/content/{content_id}/similar", "GET",
+              lambda ctx: f"/api/content/{ctx.content_item()['id']}/similar", weight=2),
+    RouteSpec("GET /api/content/categories/all", "GET", lambda ctx: "/api/content/categories/all", weight=2),
+    RouteSpec("GET /api/images/{size}/{path}", "GET",
+              lambda ctx: f"/api/images/{ctx.rng.choice(IMAGE_SIZES)}/{ctx.content_item()['image'].rsplit('/', 1)[-1]}",
+              weight=3),
+    RouteSpec("GET /api/users/profiles", "GET", lambda ctx: "/api/users/profiles"),
+    RouteSpec("POST /api/users/profiles", "POST", lambda ctx: "/api/users/profiles",
+              body=lambda ctx: {"name": f"Load {uuid.uuid4().hex[:6]}", "avatar": "https://example.com/a.png"}),
+    RouteSpec("GET /api/users/{profile_id}/my-list", "GET",
+              lambda ctx: f"/api/users/{ctx.profile_id()}/my-list", weight=4),
+    RouteSpec("POST /api/users/{profile_id}/my-list", "POST",
+              lambda ctx: f"/api/users/{ctx.profile_id()}/my-list",
+              body=lambda ctx: ctx.content_payload(), weight=2),
+    RouteSpec("DELETE /api/users/{profile_id}/my-list/{content_id}", "DELETE",
+              lambda ctx: f"/api/users/{ctx.profile_id()}/my-list/{ctx.content_item()['id']}"),
+    RouteSpec("GET /api/users/{profile_id}/continue-watching", "GET",
+              lambda ctx: f"/api/users/{ctx.profile_id()}/continue-watching", weight=4),
+    RouteSpec("GET /api/users/{profile_id}/recommendations", "GET",
+              lambda ctx: f"/api/users/{ctx.profile_id()}/recommendations", weight=3),
+    RouteSpec("POST /api/users/{profile_id}/progress", "POST",
+              lambda ctx: f"/api/users/{ctx.profile_id()}/progress",
+              body=lambda ctx: ctx.progress_payload(), weight=2),
+    RouteSpec("PUT /api/users/{profile_id}/progress/{content_id}", "PUT",
+              lambda ctx: f"/api/users/{ctx.profile_id()}/progress/{ctx.content_item()['id']}",
+              body=lambda ctx: {"progress": round(ctx.rng.uniform(1, 99), 1)}, weight=2),
+    RouteSpec("GET /api/users/{profile_id}/watch-time", "GET",
+              lambda ctx: f"/api/users/{ctx.profile_id()}/watch-time",
+              params=lambda ctx: {"days": ctx.rng.choice([7, 30, 90])}),
+]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class RouteStats:
+    def __init__(self):
+        self.latencies_ms: List[float] = []
+        self.status_codes: Dict[str, int] = {}
+        self.errors = 0
+
+    def record(self, latency_ms: float, status: Optional[int]):
+        self.latencies_ms.append(latency_ms)
+        key = str(status) if status is not None else "exception"
+        self.status_codes[key] = self.status_codes.get(key, 0) + 1
+        if status is None or status >= 500:
+            self.errors += 1
+
+    def summary(self, duration: float) -> Dict[str, Any]:
+        values = sorted(self.latencies_ms)
+        count = len(values)
+        return {
+            "requests": count,
+            "errors": self.errors,
+            "throughput_rps": round(count / duration, 2) if duration else 0.0,
+            "mean_ms": round(sum(values) / count, 3) if count else 0.0,
+            "p50_ms": round(percentile(values, 50), 3),
+            "p95_ms": round(percentile(values, 95), 3),
+            "p99_ms": round(percentile(values, 99), 3),
+            "max_ms": round(values[-1], 3) if values else 0.0,
+            "status_codes": self.status_codes,
+        }
+
+
+class ManagedProcess:
+    def __init__(self, name: str, args: List[str], cwd: Path, env: Dict[str, str]):
+        self.name = name
+        self.args = args
+        self.cwd = cwd
+        self.env = env
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self):
+        print(f"▶ Starting {self.name}: {' '.join(self.args)}")
+        self.process = subprocess.Popen(self.args, cwd=self.cwd, env=self.env)
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+async def wait_for(url: str, timeout: float = 30.0):
+    """Poll a URL until it answers or the timeout expires"""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2.0) as client:
+        while time.monotonic() < deadline:
+            try:
+                response = await client.get(url)
+                if response.status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+async def seed(client: httpx.AsyncClient, base_url: str, ctx: LoadContext, my_list_items: int):
+    """Create profiles, content rows, list entries and progress for the load mix"""
+    response = await client.get(f"{base_url}/api/users/profiles")
+    response.raise_for_status()
+    ctx.profile_ids = [profile["id"] for profile in response.json()]
+
+    for path in ("/api/content/trending", "/api/content/popular"):
+        response = await client.get(f"{base_url}{path}")
+        response.raise_for_status()
+        ctx.content.extend(response.json())
+
+    if not ctx.profile_ids or not ctx.content:
+        raise RuntimeError("Seeding failed: no profiles or content returned")
+
+    for profile_id in ctx.profile_ids:
+        for item in ctx.content[:my_list_items]:
+            payload = {
+                "content_id": item["id"],
+                "tmdb_id": item["tmdb_id"],
+                "content_type": "tv" if item["type"] == "series" else "movie",
+            }
+            await client.post(f"{base_url}/api/users/{profile_id}/my-list", json=payload)
+            await client.post(f"{base_url}/api/users/{profile_id}/progress",
+                              json={**payload, "progress": 42.0})
+
+
+async def run_load(base_url: str, routes: List[RouteSpec], ctx: LoadContext,
+                   concurrency: int, duration: float, warmup: float) -> Dict[str, RouteStats]:
+    """Drive weighted random requests from `concurrency` workers for `duration` seconds"""
+    stats = {route.name: RouteStats() for route in routes}
+    weights = [route.weight for route in routes]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=TIMEOUT, limits=limits) as client:
+        async def worker(measure_from: float, deadline: float):
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    return
+                route = ctx.rng.choices(routes, weights)[0]
+                kwargs: Dict[str, Any] = {}
+                if route.body:
+                    kwargs["json"] = route.body(ctx)
+                if route.params:
+                    kwargs["params"] = route.params(ctx)
+
+                started = time.perf_counter()
+                status = None
+                try:
+                    response = await client.request(route.method, route.path(ctx), **kwargs)
+                    status = response.status_code
+                except httpx.HTTPError:
+                    pass
+                elapsed_ms = (time.perf_counter() - started) * 1000
+
+                if now >= measure_from:
+                    stats[route.name].record(elapsed_ms, status)
+
+        start = time.monotonic()
+        measure_from = start + warmup
+        deadline = measure_from + duration
+        await asyncio.gather(*(worker(measure_from, deadline) for _ in range(concurrency)))
+
+    return stats
+
+
+def build_report(stats: Dict[str, RouteStats], duration: float, config: Dict[str, Any]) -> Dict[str, Any]:
+    routes = {name: route_stats.summary(duration) for name, route_stats in stats.items()}
+    all_latencies = RouteStats()
+    for route_stats in stats.values():
+        all_latencies.latencies_ms.extend(route_stats.latencies_ms)
+        all_latencies.errors += route_stats.errors
+    return {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": config,
+        "overall": all_latencies.summary(duration),
+        "routes": routes,
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print("\n" + "=" * 100)
+    print("📊 LOAD TEST SUMMARY")
+    print("=" * 100)
+    header = f"{'route':<55}{'req':>7}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}"
+    print(header)
+    print("-" * len(header))
+    rows = list(report["routes"].items()) + [("OVERALL", report["overall"])]
+    for name, summary in rows:
+        print(f"{name:<55}{summary['requests']:>7}{summary['errors']:>6}{summary['throughput_rps']:>9.1f}"
+              f"{summary['p50_ms']:>9.1f}{summary['p95_ms']:>9.1f}{summary['p99_ms']:>9.1f}")
+    print("=" * 100)
+
+
+def compare_reports(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return the routes whose p95 or throughput regressed beyond `tolerance`"""
+    regressions = []
+    for name, summary in report["routes"].items():
+        previous = baseline.get("routes", {}).get(name)
+        if not previous or not previous["requests"] or not summary["requests"]:
+            continue
+        if summary["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']:.1f}ms -> {summary['p95_ms']:.1f}ms")
+        if summary["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['throughput_rps']:.1f} -> {summary['throughput_rps']:.1f} rps")
+    return regressions
+
+
+def start_mongod(port: int) -> ManagedProcess:
+    """Start a throwaway mongod when one is installed locally"""
+    mongod = shutil.which("mongod")
+    if not mongod:
+        raise RuntimeError("--start-mongo requested but mongod is not on PATH")
+    dbpath = tempfile.mkdtemp(prefix="bench-mongo-")
+    # Single-node replica set so the backend's change-stream cache invalidation runs
+    process = ManagedProcess("mongod", [mongod, "--dbpath", dbpath, "--port", str(port), "--quiet",
+                                        "--replSet", "rs0", "--bind_ip", "127.0.0.1"],
+                             ROOT_DIR, dict(os.environ))
+    process.start()
+    initiate_replica_set(port)
+    return process
+
+
+def initiate_replica_set(port: int, timeout: float = 30.0):
+    """Initiate the single-node replica set and wait for it to elect itself primary"""
+    from pymongo import MongoClient
+    from pymongo.errors import OperationFailure, PyMongoError
+
+    client = MongoClient(f"mongodb://127.0.0.1:{port}", directConnection=True, serverSelectionTimeoutMS=1000)
+    deadline = time.monotonic() + timeout
+    try:
+        while time.monotonic() < deadline:
+            try:
+                client.admin.command("replSetInitiate", {"_id": "rs0", "members": [{"_id": 0, "host": f"127.0.0.1:{port}"}]})
+            except OperationFailure as e:
+                if e.code != 23:  # AlreadyInitialized
+                    raise
+            except PyMongoError:
+                time.sleep(0.2)
+                continue
+            if client.admin.command("hello").get("isWritablePrimary"):
+                return
+            time.sleep(0.2)
+    finally:
+        client.close()
+    raise RuntimeError("Timed out initiating the mongod replica set")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="End-to-end load test for the Netflix Clone backend")
+    parser.add_argument("--base-url", help="Target an already running backend instead of launching one")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://127.0.0.1:27017"))
+    parser.add_argument("--start-mongo", action="store_true", help="Launch a temporary local mongod")
+    parser.add_argument("--mongo-port", type=int, default=27099)
+    parser.add_argument("--db-name", default=f"bench_{uuid.uuid4().hex[:8]}")
+    parser.add_argument("--app-port", type=int, default=8901)
+    parser.add_argument("--app-workers", type=int, default=1)
+    parser.add_argument("--stub-port", type=int, default=8900)
+    parser.add_argument("--stub-latency-ms", type=float, default=20.0)
+    parser.add_argument("--stub-jitter-ms", type=float, default=5.0)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--stub-rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Unmeasured seconds before measuring")
+    parser.add_argument("--routes", default="", help="Comma separated substrings selecting routes")
+    parser.add_argument("--my-list-items", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write machine-readable JSON results to this path")
+    parser.add_argument("--baseline", help="Compare against a previous JSON result")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed regression ratio vs baseline")
+    return parser.parse_args(argv)
+
+
+async def main_async(args: argparse.Namespace) -> int:
+    processes: List[ManagedProcess] = []
+    routes = ROUTES
+    if args.routes:
+        selectors = [selector.strip() for selector in args.routes.split(",") if selector.strip()]
+        routes = [route for route in ROUTES if any(selector in route.name for selector in selectors)]
+    if not routes:
+        print("No routes selected")
+        return 2
+
+    try:
+        base_url = args.base_url
+        if not base_url:
+            mongo_url = args.mongo_url
+            if args.start_mongo:
+                processes.append(start_mongod(args.mongo_port))
+                mongo_url = f"mongodb://127.0.0.1:{args.mongo_port}/?replicaSet=rs0"
+
+            stub = ManagedProcess("TMDB stub", [
+                sys.executable, "-m", "benchmarks.tmdb_stub",
+                "--port", str(args.stub_port),
+                "--latency-ms", str(args.stub_latency_ms),
+                "--jitter-ms", str(args.stub_jitter_ms),
+                "--error-rate", str(args.stub_error_rate),
+                "--rate-limit-rate", str(args.stub_rate_limit_rate),
+                "--seed", str(args.seed),
+            ], ROOT_DIR, dict(os.environ))
+            stub.start()
+            processes.append(stub)
+
+            # Fresh image cache so every run measures origin fetches and resizes too
+            image_cache_dir = tempfile.mkdtemp(prefix="bench-images-")
+            app_env = dict(os.environ)
+            app_env.update({
+                "MONGO_URL": mongo_url,
+                "DB_NAME": args.db_name,
+                "TMDB_BASE_URL": f"http://127.0.0.1:{args.stub_port}",
+                "IMAGE_ORIGIN_URL": f"http://127.0.0.1:{args.stub_port}/t/p",
+                "IMAGE_CACHE_DIR": image_cache_dir,
+            })
+            app = ManagedProcess("backend", [
+                sys.executable, "-m", "uvicorn", "server:app",
+                "--host", "127.0.0.1", "--port", str(args.app_port),
+                "--workers", str(args.app_workers), "--log-level", "warning",
+            ], BACKEND_DIR, app_env)
+            app.start()
+            processes.append(app)
+
+            await wait_for(f"http://127.0.0.1:{args.stub_port}/__stats")
+            base_url = f"http://127.0.0.1:{args.app_port}"
+            await wait_for(f"{base_url}/api/health/ready", timeout=120.0)
+
+        ctx = LoadContext(args.seed)
+        async with httpx.AsyncClient(timeout=TIMEOUT) as client:
+            await seed(client, base_url, ctx, args.my_list_items)
+
+        print(f"🔥 Driving {len(routes)} routes with concurrency={args.concurrency} "
+              f"for {args.duration:.0f}s (+{args.warmup:.0f}s warm-up)")
+        stats = await run_load(base_url, routes, ctx, args.concurrency, args.duration, args.warmup)
+
+        config = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+        report = build_report(stats, args.duration, config)
+        print_report(report)
+
+        if args.output:
+            Path(args.output).write_text(json.dumps(report, indent=2))
+            print(f"💾 Results written to {args.output}")
+
+        if args.baseline:
+            baseline = json.loads(Path(args.baseline).read_text())
+            regressions = compare_reports(report, baseline, args.tolerance)
+            if regressions:
+                print("\n🚨 REGRESSIONS:")
+                for regression in regressions:
+                    print(f"  • {regression}")
+                return 1
+            print("✅ No regressions against baseline")
+
+        return 0
+
+    finally:
+        for process in reversed(processes):
+            process.stop()
+
+
+def main():
+    sys.exit(asyncio.run(main_async(parse_args())))
+
+
+if __name__ == "__main__":
+    main()
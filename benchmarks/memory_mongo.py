@@ -0,0 +1,755 @@
+"""
+In-memory Motor-compatible stand-in
+Implements the subset of the AsyncIOMotorDatabase/Collection API the services use,
+with optional single-field hash indexes so large seeded datasets stay cheap to query
+"""
+
+import copy
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError
+
+EPOCH = datetime(1970, 1, 1)
+
+_MISSING = object()
+
+
+def _get_path(doc: Dict[str, Any], path: str) -> Any:
+    value: Any = doc
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return _MISSING
+    return value
+
+
+def _set_path(doc: Dict[str, Any], path: str, value: Any):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset_path(doc: Dict[str, Any], path: str):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def _compare(value: Any, op: str, operand: Any) -> bool:
+    if op == "$exists":
+        return (value is not _MISSING) == bool(operand)
+    if op == "$in":
+        if isinstance(value, list):
+            return any(item in operand for item in value)
+        return (None if value is _MISSING else value) in operand
+    if op == "$nin":
+        return not _compare(value, "$in", operand)
+    if op == "$ne":
+        return not _compare(value, "$eq", operand)
+    if op == "$eq":
+        if isinstance(value, list) and not isinstance(operand, list):
+            return operand in value
+        return (None if value is _MISSING else value) == operand
+    if op == "$regex":
+        return isinstance(value, str) and re.search(operand, value) is not None
+    if op == "$size":
+        return isinstance(value, list) and len(value) == operand
+    if value is _MISSING or value is None:
+        return False
+    try:
+        if op == "$gt":
+            return value > operand
+        if op == "$gte":
+            return value >= operand
+        if op == "$lt":
+            return value < operand
+        if op == "$lte":
+            return value <= operand
+    except TypeError:
+        return False
+    raise NotImplementedError(f"Unsupported query operator: {op}")
+
+
+def matches(doc: Dict[str, Any], query: Optional[Dict[str, Any]]) -> bool:
+    """Evaluate a Mongo query document against `doc`"""
+    if not query:
+        return True
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+            continue
+        if key == "$nor":
+            if any(matches(doc, sub) for sub in condition):
+                return False
+            continue
+
+        value = _get_path(doc, key)
+        if isinstance(condition, dict) and condition and all(op.startswith("$") for op in condition):
+            options = condition.get("$options", "")
+            for op, operand in condition.items():
+                if op == "$options":
+                    continue
+                if op == "$regex":
+                    operand = re.compile(operand, re.IGNORECASE if "i" in options else 0)
+                if op == "$not":
+                    if matches({key: value} if value is not _MISSING else {}, {key: operand}):
+                        return False
+                    continue
+                if op == "$elemMatch":
+                    if not isinstance(value, list) or not any(matches(item, operand) for item in value):
+                        return False
+                    continue
+                if not _compare(value, op, operand):
+                    return False
+        elif isinstance(condition, re.Pattern):
+            if not isinstance(value, str) or not condition.search(value):
+                return False
+        elif not _compare(value, "$eq", condition):
+            return False
+    return True
+
+
+def _project(doc: Dict[str, Any], projection: Optional[Any]) -> Dict[str, Any]:
+    if not projection:
+        return copy.deepcopy(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include = {key for key, flag in projection.items() if flag and key != "_id"}
+    exclude = {key for key, flag in projection.items() if not flag}
+    if include:
+        result = {}
+        for key in include:
+            value = _get_path(doc, key)
+            if value is not _MISSING:
+                _set_path(result, key, copy.deepcopy(value))
+        if "_id" not in exclude and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+    result = copy.deepcopy(doc)
+    for key in exclude:
+        _unset_path(result, key)
+    return result
+
+
+def _sort_key(fields: List[Tuple[str, int]]):
+    def key(doc):
+        parts = []
+        for field, _ in fields:
+            value = _get_path(doc, field)
+            parts.append((value is _MISSING or value is None, value if value is not _MISSING else None))
+        return parts
+    return key
+
+
+def _apply_sort(docs: List[Dict[str, Any]], fields: List[Tuple[str, int]]) -> List[Dict[str, Any]]:
+    for field, direction in reversed(fields):
+        docs.sort(key=_sort_key([(field, direction)]), reverse=direction < 0)
+    return docs
+
+
+def _expression(doc: Dict[str, Any], expression: Any) -> Any:
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = _get_path(doc, expression[1:])
+        return None if value is _MISSING else value
+    if isinstance(expression, dict):
+        if "$dateTrunc" in expression:
+            spec = expression["$dateTrunc"]
+            date = _expression(doc, spec["date"])
+            fields = {"second": {"microsecond": 0}, "minute": {"second": 0, "microsecond": 0},
+                      "hour": {"minute": 0, "second": 0, "microsecond": 0},
+                      "day": {"hour": 0, "minute": 0, "second": 0, "microsecond": 0}}
+            return date.replace(**fields[spec["unit"]]) if date is not None else None
+        if "$toLong" in expression:
+            value = _expression(doc, expression["$toLong"])
+            if isinstance(value, datetime):
+                return (value - EPOCH) // timedelta(milliseconds=1)
+            return None if value is None else int(value)
+        if "$mod" in expression:
+            dividend, divisor = (_expression(doc, operand) for operand in expression["$mod"])
+            return None if dividend is None else dividend % divisor
+        if "$subtract" in expression:
+            left, right = (_expression(doc, operand) for operand in expression["$subtract"])
+            if left is None or right is None:
+                return None
+            if isinstance(left, datetime) and not isinstance(right, datetime):
+                # BSON dates have millisecond precision
+                result = left - timedelta(milliseconds=right)
+                return result - timedelta(microseconds=result.microsecond % 1000)
+            if isinstance(left, datetime):
+                return (left - right) // timedelta(milliseconds=1)
+            return left - right
+        return {key: _expression(doc, value) for key, value in expression.items()}
+    return expression
+
+
+def _group(docs: List[Dict[str, Any]], spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    groups: Dict[Any, Dict[str, Any]] = {}
+    for doc in docs:
+        group_id = _expression(doc, spec["_id"])
+        key = repr(group_id)
+        group = groups.setdefault(key, {"_id": group_id})
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            (op, expression), = accumulator.items()
+            value = _expression(doc, expression)
+            if op == "$sum":
+                group[field] = group.get(field, 0) + (value or 0)
+            elif op == "$max":
+                group[field] = value if field not in group or (value is not None and value > group[field]) else group[field]
+            elif op == "$min":
+                group[field] = value if field not in group or (value is not None and value < group[field]) else group[field]
+            elif op == "$avg":
+                total, count = group.get(f"__{field}", (0, 0))
+                group[f"__{field}"] = (total + (value or 0), count + 1)
+            elif op == "$first":
+                group.setdefault(field, value)
+            elif op == "$last":
+                group[field] = value
+            elif op == "$push":
+                group.setdefault(field, []).append(value)
+            elif op == "$addToSet":
+                values = group.setdefault(field, [])
+                if value not in values:
+                    values.append(value)
+            else:
+                raise NotImplementedError(f"MemoryCollection.aggregate does not support {op}")
+    results = []
+    for group in groups.values():
+        for field in [field for field in group if field.startswith("__")]:
+            total, count = group.pop(field)
+            group[field[2:]] = total / count if count else None
+        results.append(group)
+    return results
+
+
+def apply_update(doc: Dict[str, Any], update: Dict[str, Any], inserting: bool = False):
+    """Apply an update document (operators or replacement) in place"""
+    if not any(key.startswith("$") for key in update):
+        preserved = doc.get("_id")
+        doc.clear()
+        doc.update(copy.deepcopy(update))
+        if preserved is not None:
+            doc.setdefault("_id", preserved)
+        return
+
+    for op, fields in update.items():
+        if op == "$set":
+            for path, value in fields.items():
+                _set_path(doc, path, copy.deepcopy(value))
+        elif op == "$setOnInsert":
+            if inserting:
+                for path, value in fields.items():
+                    _set_path(doc, path, copy.deepcopy(value))
+        elif op == "$unset":
+            for path in fields:
+                _unset_path(doc, path)
+        elif op == "$inc":
+            for path, amount in fields.items():
+                current = _get_path(doc, path)
+                _set_path(doc, path, (0 if current is _MISSING else current) + amount)
+        elif op == "$max":
+            for path, value in fields.items():
+                current = _get_path(doc, path)
+                if current is _MISSING or current is None or value > current:
+                    _set_path(doc, path, value)
+        elif op == "$min":
+            for path, value in fields.items():
+                current = _get_path(doc, path)
+                if current is _MISSING or current is None or value < current:
+                    _set_path(doc, path, value)
+        elif op == "$push":
+            for path, value in fields.items():
+                current = _get_path(doc, path)
+                items = [] if current is _MISSING else current
+                if isinstance(value, dict) and "$each" in value:
+                    items.extend(copy.deepcopy(value["$each"]))
+                    if "$slice" in value:
+                        items = items[value["$slice"]:] if value["$slice"] < 0 else items[:value["$slice"]]
+                else:
+                    items.append(copy.deepcopy(value))
+                _set_path(doc, path, items)
+        elif op == "$addToSet":
+            for path, value in fields.items():
+                current = _get_path(doc, path)
+                items = [] if current is _MISSING else current
+                values = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                for item in values:
+                    if item not in items:
+                        items.append(copy.deepcopy(item))
+                _set_path(doc, path, items)
+        elif op == "$pull":
+            for path, value in fields.items():
+                current = _get_path(doc, path)
+                if isinstance(current, list):
+                    _set_path(doc, path, [item for item in current if item != value])
+        else:
+            raise NotImplementedError(f"Unsupported update operator: {op}")
+
+
+def _seed_from_query(query: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    doc: Dict[str, Any] = {}
+    for key, value in (query or {}).items():
+        if key.startswith("$"):
+            continue
+        if isinstance(value, dict) and any(op.startswith("$") for op in value):
+            if "$eq" in value:
+                _set_path(doc, key, value["$eq"])
+            continue
+        _set_path(doc, key, copy.deepcopy(value))
+    return doc
+
+
+class InsertOneResult:
+    def __init__(self, inserted_id: Any):
+        self.inserted_id = inserted_id
+        self.acknowledged = True
+
+
+class InsertManyResult:
+    def __init__(self, inserted_ids: List[Any]):
+        self.inserted_ids = inserted_ids
+        self.acknowledged = True
+
+
+class UpdateResult:
+    def __init__(self, matched_count: int, modified_count: int, upserted_id: Any = None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+        self.acknowledged = True
+
+
+class DeleteResult:
+    def __init__(self, deleted_count: int):
+        self.deleted_count = deleted_count
+        self.acknowledged = True
+
+
+class BulkWriteResult:
+    def __init__(self):
+        self.inserted_count = 0
+        self.matched_count = 0
+        self.modified_count = 0
+        self.deleted_count = 0
+        self.upserted_count = 0
+        self.acknowledged = True
+
+
+class MemoryCursor:
+    def __init__(self, collection: "MemoryCollection", query: Optional[Dict[str, Any]],
+                 projection: Optional[Any] = None):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+        self._results: Optional[List[Dict[str, Any]]] = None
+
+    def sort(self, key_or_list: Any, direction: Optional[int] = None) -> "MemoryCursor":
+        if isinstance(key_or_list, str):
+            self._sort = [(key_or_list, direction or 1)]
+        else:
+            self._sort = list(key_or_list)
+        return self
+
+    def skip(self, count: int) -> "MemoryCursor":
+        self._skip = count
+        return self
+
+    def limit(self, count: int) -> "MemoryCursor":
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int) -> "MemoryCursor":
+        return self
+
+    def _evaluate(self) -> List[Dict[str, Any]]:
+        docs = list(self._collection._candidates(self._query))
+        if self._sort:
+            docs = _apply_sort(docs, self._sort)
+        if self._skip:
+            docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [_project(doc, self._projection) for doc in docs]
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        if self._results is None:
+            self._results = self._evaluate()
+        results, self._results = (self._results, []) if length is None else (self._results[:length], self._results[length:])
+        return results
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        if self._results is None:
+            self._results = self._evaluate()
+        if not self._results:
+            raise StopAsyncIteration
+        return self._results.pop(0)
+
+
+class MemoryCollection:
+    def __init__(self, name: str):
+        self.name = name
+        self._docs: Dict[Any, Dict[str, Any]] = {}
+        self._indexes: Dict[str, Dict[Any, Dict[Any, Dict[str, Any]]]] = {}
+        self._unique: Dict[str, bool] = {}
+        # Unique compound indexes: field tuple -> value tuple -> _id
+        self._compound: Dict[Tuple[str, ...], Dict[Tuple[Any, ...], Any]] = {}
+
+    # -- indexing -----------------------------------------------------------------
+
+    def _index_key(self, value: Any) -> Any:
+        return tuple(value) if isinstance(value, list) else value
+
+    def _compound_key(self, doc: Dict[str, Any], fields: Tuple[str, ...]) -> Tuple[Any, ...]:
+        return tuple(None if (value := _get_path(doc, field)) is _MISSING else self._index_key(value) for field in fields)
+
+    def _index_add(self, doc: Dict[str, Any]):
+        for fields, index in self._compound.items():
+            key = self._compound_key(doc, fields)
+            if index.get(key, doc["_id"]) != doc["_id"]:
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {'_'.join(fields)}")
+        for fields, index in self._compound.items():
+            index[self._compound_key(doc, fields)] = doc["_id"]
+        for field, index in self._indexes.items():
+            value = _get_path(doc, field)
+            if value is _MISSING:
+                continue
+            keys = value if isinstance(value, list) else [value]
+            for key in keys:
+                bucket = index.setdefault(self._index_key(key), {})
+                if self._unique.get(field) and bucket and doc["_id"] not in bucket:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {field}")
+                bucket[doc["_id"]] = doc
+
+    def _index_remove(self, doc: Dict[str, Any]):
+        for fields, index in self._compound.items():
+            key = self._compound_key(doc, fields)
+            if index.get(key) == doc["_id"]:
+                del index[key]
+        for field, index in self._indexes.items():
+            value = _get_path(doc, field)
+            if value is _MISSING:
+                continue
+            for key in (value if isinstance(value, list) else [value]):
+                bucket = index.get(self._index_key(key))
+                if bucket:
+                    bucket.pop(doc["_id"], None)
+
+    def _candidates(self, query: Optional[Dict[str, Any]]) -> Iterable[Dict[str, Any]]:
+        if query:
+            if "_id" in query and not isinstance(query["_id"], dict):
+                doc = self._docs.get(query["_id"])
+                return [doc] if doc is not None and matches(doc, query) else []
+            for field, index in self._indexes.items():
+                condition = query.get(field, _MISSING)
+                if condition is _MISSING:
+                    continue
+                if isinstance(condition, dict) and set(condition) == {"$in"}:
+                    seen: Dict[Any, Dict[str, Any]] = {}
+                    for value in condition["$in"]:
+                        seen.update(index.get(self._index_key(value), {}))
+                    return [doc for doc in seen.values() if matches(doc, query)]
+                if not isinstance(condition, dict):
+                    bucket = index.get(self._index_key(condition), {})
+                    return [doc for doc in list(bucket.values()) if matches(doc, query)]
+        return [doc for doc in list(self._docs.values()) if matches(doc, query)]
+
+    async def create_index(self, keys: Any, unique: bool = False, **kwargs) -> str:
+        if isinstance(keys, str):
+            fields = [keys]
+        else:
+            fields = [key if isinstance(key, str) else key[0] for key in keys]
+        if unique and len(fields) > 1 and tuple(fields) not in self._compound:
+            index: Dict[Tuple[Any, ...], Any] = {}
+            for doc in self._docs.values():
+                key = self._compound_key(doc, tuple(fields))
+                if key in index:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {'_'.join(fields)}")
+                index[key] = doc["_id"]
+            self._compound[tuple(fields)] = index
+        field = fields[0]
+        if field not in self._indexes:
+            self._indexes[field] = {}
+            self._unique[field] = unique and len(fields) == 1
+            try:
+                for doc in self._docs.values():
+                    self._index_add(doc)
+            except DuplicateKeyError:
+                del self._indexes[field], self._unique[field]
+                raise
+        return kwargs.get("name") or "_".join(f"{name}_1" for name in fields)
+
+    async def create_indexes(self, indexes: List[Any]) -> List[str]:
+        names = []
+        for index in indexes:
+            document = getattr(index, "document", index)
+            names.append(await self.create_index(list(document["key"].items()),
+                                                 unique=document.get("unique", False)))
+        return names
+
+    # -- reads ---------------------------------------------------------------------
+
+    def find(self, filter: Optional[Dict[str, Any]] = None, projection: Optional[Any] = None,
+             *args, **kwargs) -> MemoryCursor:
+        cursor = MemoryCursor(self, filter, projection)
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        if kwargs.get("limit"):
+            cursor.limit(kwargs["limit"])
+        return cursor
+
+    async def find_one(self, filter: Optional[Dict[str, Any]] = None, projection: Optional[Any] = None,
+                       *args, **kwargs) -> Optional[Dict[str, Any]]:
+        cursor = self.find(filter, projection, **kwargs)
+        cursor.limit(1)
+        results = await cursor.to_list(1)
+        return results[0] if results else None
+
+    async def count_documents(self, filter: Optional[Dict[str, Any]] = None, **kwargs) -> int:
+        if not filter:
+            return len(self._docs)
+        return len(list(self._candidates(filter)))
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        return len(self._docs)
+
+    async def distinct(self, key: str, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Any]:
+        values: List[Any] = []
+        for doc in self._candidates(filter):
+            value = _get_path(doc, key)
+            if value is _MISSING:
+                continue
+            for item in (value if isinstance(value, list) else [value]):
+                if item not in values:
+                    values.append(item)
+        return values
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs) -> MemoryCursor:
+        """$match, $group, $sort, $skip, $limit, $project and $count stages"""
+        docs = [copy.deepcopy(doc) for doc in self._docs.values()]
+        for stage in pipeline:
+            (op, spec), = stage.items()
+            if op == "$match":
+                docs = [doc for doc in docs if matches(doc, spec)]
+            elif op == "$group":
+                docs = _group(docs, spec)
+            elif op == "$sort":
+                docs = _apply_sort(docs, list(spec.items()))
+            elif op == "$skip":
+                docs = docs[spec:]
+            elif op == "$limit":
+                docs = docs[:spec]
+            elif op == "$project":
+                docs = [{key: _expression(doc, value) if isinstance(value, (str, dict)) else doc.get(key)
+                         for key, value in spec.items() if value} for doc in docs]
+            elif op == "$count":
+                docs = [{spec: len(docs)}] if docs else []
+            else:
+                raise NotImplementedError(f"MemoryCollection.aggregate does not support {op}")
+        cursor = MemoryCursor(self, None)
+        cursor._results = docs
+        return cursor
+
+    # -- writes --------------------------------------------------------------------
+
+    def _insert(self, document: Dict[str, Any]) -> Any:
+        doc = copy.deepcopy(document)
+        doc.setdefault("_id", ObjectId())
+        if doc["_id"] in self._docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_")
+        try:
+            self._index_add(doc)
+        except DuplicateKeyError:
+            # Undo the entries added to other indexes before the unique one failed
+            self._index_remove(doc)
+            raise
+        self._docs[doc["_id"]] = doc
+        document.setdefault("_id", doc["_id"])
+        return doc["_id"]
+
+    async def insert_one(self, document: Dict[str, Any], **kwargs) -> InsertOneResult:
+        return InsertOneResult(self._insert(document))
+
+    async def insert_many(self, documents: List[Dict[str, Any]], ordered: bool = True, **kwargs) -> InsertManyResult:
+        inserted_ids, write_errors = [], []
+        for index, document in enumerate(documents):
+            try:
+                inserted_ids.append(self._insert(document))
+            except DuplicateKeyError as e:
+                write_errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if write_errors:
+            raise BulkWriteError({"writeErrors": write_errors, "writeConcernErrors": [], "nInserted": len(inserted_ids)})
+        return InsertManyResult(inserted_ids)
+
+    def _replace_doc(self, doc: Dict[str, Any], update: Dict[str, Any], inserting: bool = False):
+        self._index_remove(doc)
+        apply_update(doc, update, inserting=inserting)
+        self._index_add(doc)
+
+    async def update_one(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False,
+                         **kwargs) -> UpdateResult:
+        for doc in self._candidates(filter):
+            before = copy.deepcopy(doc)
+            self._replace_doc(doc, update)
+            return UpdateResult(1, int(before != doc))
+        if upsert:
+            doc = _seed_from_query(filter)
+            apply_update(doc, update, inserting=True)
+            return UpdateResult(0, 0, self._insert(doc))
+        return UpdateResult(0, 0)
+
+    async def update_many(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False,
+                          **kwargs) -> UpdateResult:
+        matched = modified = 0
+        for doc in list(self._candidates(filter)):
+            before = copy.deepcopy(doc)
+            self._replace_doc(doc, update)
+            matched += 1
+            modified += int(before != doc)
+        if not matched and upsert:
+            doc = _seed_from_query(filter)
+            apply_update(doc, update, inserting=True)
+            return UpdateResult(0, 0, self._insert(doc))
+        return UpdateResult(matched, modified)
+
+    async def replace_one(self, filter: Dict[str, Any], replacement: Dict[str, Any], upsert: bool = False,
+                          **kwargs) -> UpdateResult:
+        return await self.update_one(filter, replacement, upsert=upsert)
+
+    async def find_one_and_update(self, filter: Dict[str, Any], update: Dict[str, Any],
+                                  projection: Optional[Any] = None, sort: Optional[List[Tuple[str, int]]] = None,
+                                  upsert: bool = False, return_document: bool = False,
+                                  **kwargs) -> Optional[Dict[str, Any]]:
+        docs = list(self._candidates(filter))
+        if sort:
+            docs = _apply_sort(docs, sort)
+        if docs:
+            doc = docs[0]
+            before = _project(doc, projection)
+            self._replace_doc(doc, update)
+            return _project(doc, projection) if return_document else before
+        if upsert:
+            doc = _seed_from_query(filter)
+            apply_update(doc, update, inserting=True)
+            self._insert(doc)
+            return _project(doc, projection) if return_document else None
+        return None
+
+    async def find_one_and_delete(self, filter: Dict[str, Any], **kwargs) -> Optional[Dict[str, Any]]:
+        for doc in self._candidates(filter):
+            self._index_remove(doc)
+            del self._docs[doc["_id"]]
+            return doc
+        return None
+
+    async def delete_one(self, filter: Dict[str, Any], **kwargs) -> DeleteResult:
+        for doc in self._candidates(filter):
+            self._index_remove(doc)
+            del self._docs[doc["_id"]]
+            return DeleteResult(1)
+        return DeleteResult(0)
+
+    async def delete_many(self, filter: Dict[str, Any], **kwargs) -> DeleteResult:
+        docs = list(self._candidates(filter))
+        for doc in docs:
+            self._index_remove(doc)
+            del self._docs[doc["_id"]]
+        return DeleteResult(len(docs))
+
+    async def bulk_write(self, requests: List[Any], ordered: bool = True, **kwargs) -> BulkWriteResult:
+        result = BulkWriteResult()
+        write_errors = []
+        for index, request in enumerate(requests):
+            try:
+                await self._bulk_operation(request, result)
+            except DuplicateKeyError as e:
+                write_errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if write_errors:
+            raise BulkWriteError({
+                "writeErrors": write_errors, "writeConcernErrors": [], "nInserted": result.inserted_count,
+                "nMatched": result.matched_count, "nModified": result.modified_count, "nUpserted": result.upserted_count,
+            })
+        return result
+
+    async def _bulk_operation(self, request: Any, result: BulkWriteResult):
+        kind = type(request).__name__
+        document = getattr(request, "_doc", None)
+        filter = getattr(request, "_filter", None)
+        upsert = bool(getattr(request, "_upsert", False))
+        if kind == "InsertOne":
+            self._insert(document)
+            result.inserted_count += 1
+        elif kind in ("UpdateOne", "ReplaceOne"):
+            outcome = await self.update_one(filter, document, upsert=upsert)
+            result.matched_count += outcome.matched_count
+            result.modified_count += outcome.modified_count
+            result.upserted_count += int(outcome.upserted_id is not None)
+        elif kind == "UpdateMany":
+            outcome = await self.update_many(filter, document, upsert=upsert)
+            result.matched_count += outcome.matched_count
+            result.modified_count += outcome.modified_count
+        elif kind == "DeleteOne":
+            result.deleted_count += (await self.delete_one(filter)).deleted_count
+        elif kind == "DeleteMany":
+            result.deleted_count += (await self.delete_many(filter)).deleted_count
+        else:
+            raise NotImplementedError(f"Unsupported bulk operation: {kind}")
+
+    async def drop(self):
+        self._docs.clear()
+        for index in self._indexes.values():
+            index.clear()
+
+
+class MemoryDatabase:
+    def __init__(self, name: str = "memory"):
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str, **kwargs) -> MemoryCollection:
+        return self[name]
+
+    async def create_collection(self, name: str, **kwargs) -> MemoryCollection:
+        """Options (time-series, capped) are accepted and ignored"""
+        if name in self._collections:
+            raise CollectionInvalid(f"collection {name} already exists")
+        return self[name]
+
+    async def list_collection_names(self, **kwargs) -> List[str]:
+        return list(self._collections)
+
+    async def command(self, command: Any, **kwargs) -> Dict[str, Any]:
+        return {"ok": 1.0}
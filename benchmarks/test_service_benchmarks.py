@@ -0,0 +1,240 @@
+"""
+Service-layer microbenchmarks
+Measure per-row cost of the ContentService/UserService hot paths and the TMDBService
+parsing helpers against the in-memory Mongo stand-in and a mocked TMDB transport
+"""
+
+import itertools
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+
+from benchmarks.conftest import BENCH_SIZES, size_id
+from benchmarks.memory_mongo import MemoryDatabase
+from models.content import Content
+from models.user import MyListItem, ViewingProgress
+from services.catalog_index import CatalogIndex, content_year
+from services.content_service import ContentService
+from services.tmdb_service import tmdb_service
+from services.user_service import UserService
+
+LIST_SIZE = 100
+GENRE_IDS = [28, 12, 35, 18, 27, 53, 878, 14, 80, 9648, 10749, 10751]
+
+
+def tmdb_item(tmdb_id: int, rng: random.Random) -> Dict[str, Any]:
+    is_movie = tmdb_id % 2 == 0
+    item = {
+        "id": tmdb_id,
+        "overview": f"Overview for {tmdb_id}",
+        "poster_path": f"/poster_{tmdb_id}.jpg",
+        "backdrop_path": f"/backdrop_{tmdb_id}.jpg",
+        "genre_ids": rng.sample(GENRE_IDS, 2),
+        "vote_average": round(rng.uniform(3, 9), 1),
+        "popularity": round(rng.uniform(1, 5000), 3),
+        "adult": False,
+        "original_language": "en",
+    }
+    date = f"{rng.randint(1980, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    if is_movie:
+        item.update({"title": f"Movie {tmdb_id}", "release_date": date})
+    else:
+        item.update({"name": f"Show {tmdb_id}", "first_air_date": date, "number_of_seasons": 3})
+    return item
+
+
+class Dataset:
+    def __init__(self, size: int):
+        rng = random.Random(size)
+        self.size = size
+        self.db = MemoryDatabase(f"bench_{size}")
+        self.tmdb_items = [tmdb_item(tmdb_id, rng) for tmdb_id in range(1, size + 1)]
+        self.content_docs: List[Dict[str, Any]] = []
+        self.profile_ids: List[str] = []
+
+    async def seed(self):
+        rng = random.Random(self.size + 1)
+        content = self.db.content
+        await content.create_index("id", unique=True)
+        await content.create_index([("tmdb_id", 1), ("content_type", 1)])
+        await self.db.my_list.create_index([("profile_id", 1), ("content_id", 1)])
+        await self.db.viewing_progress.create_index([("profile_id", 1), ("content_id", 1)])
+
+        for item in self.tmdb_items:
+            content_type = "movie" if "title" in item else "tv"
+            doc = Content(
+                title=item.get("title") or item.get("name"),
+                overview=item["overview"],
+                poster_path=item["poster_path"],
+                backdrop_path=item["backdrop_path"],
+                content_type=content_type,
+                tmdb_id=item["id"],
+                genre_ids=item["genre_ids"],
+                genre_names=["Drama"],
+                release_date=item.get("release_date"),
+                first_air_date=item.get("first_air_date"),
+                vote_average=item["vote_average"],
+                popularity=item["popularity"],
+                trailer_url=f"https://www.youtube.com/watch?v=k{item['id']}",
+                rating="PG-13",
+                seasons="3 Seasons" if content_type == "tv" else None,
+            ).dict()
+            self.content_docs.append(doc)
+        await content.insert_many(self.content_docs)
+
+        # One profile per LIST_SIZE titles, each with a full list and progress on every entry
+        now = datetime.utcnow()
+        my_list, progress = [], []
+        for offset in range(0, self.size, LIST_SIZE):
+            profile_id = f"profile-{offset // LIST_SIZE}"
+            self.profile_ids.append(profile_id)
+            for position, doc in enumerate(self.content_docs[offset:offset + LIST_SIZE]):
+                my_list.append(MyListItem(profile_id=profile_id, content_id=doc["id"],
+                                          tmdb_id=doc["tmdb_id"], content_type=doc["content_type"]).dict())
+                progress.append(ViewingProgress(profile_id=profile_id, content_id=doc["id"],
+                                                tmdb_id=doc["tmdb_id"], content_type=doc["content_type"],
+                                                progress=rng.uniform(1, 99),
+                                                last_watched=now - timedelta(minutes=position)).dict())
+        await self.db.my_list.insert_many(my_list)
+        await self.db.viewing_progress.insert_many(progress)
+
+
+_datasets: Dict[int, Dataset] = {}
+
+
+@pytest.fixture(params=BENCH_SIZES, ids=size_id)
+def dataset(request) -> Dataset:
+    size = request.param
+    if size not in _datasets:
+        import asyncio
+
+        data = Dataset(size)
+        asyncio.run(data.seed())
+        _datasets[size] = data
+    return _datasets[size]
+
+
+@pytest.fixture
+def mocked_tmdb():
+    """Route TMDBService through an in-process transport returning canned payloads"""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/videos"):
+            return httpx.Response(200, json={"results": [
+                {"type": "Teaser", "site": "YouTube", "key": "teaser"},
+                {"type": "Trailer", "site": "YouTube", "key": "trailer"},
+            ]})
+        if request.url.path.endswith("/release_dates"):
+            return httpx.Response(200, json={"results": [
+                {"iso_3166_1": "US", "release_dates": [{"certification": "PG", "type": 3}]},
+            ]})
+        return httpx.Response(200, json={"results": []})
+
+    previous = tmdb_service.transport
+    tmdb_service.transport = httpx.MockTransport(handler)
+    yield
+    tmdb_service.transport = previous
+
+
+def test_format_content_response(bench, dataset):
+    service = ContentService(dataset.db)
+    docs = dataset.content_docs
+
+    def run():
+        for doc in docs:
+            service._format_content_response(doc)
+
+    result = bench.run("ContentService._format_content_response", dataset.size, run, ops_per_call=len(docs))
+    assert result["ops"] > 0
+
+
+def test_get_or_create_content_existing(bench, dataset):
+    service = ContentService(dataset.db)
+    items = dataset.tmdb_items[:200]
+
+    async def run():
+        for item in items:
+            content_type = "movie" if "title" in item else "tv"
+            assert await service.get_or_create_content(item, content_type) is not None
+
+    bench.run("ContentService.get_or_create_content[hit]", dataset.size, run, ops_per_call=len(items))
+
+
+def test_get_or_create_content_new(bench, dataset, mocked_tmdb):
+    service = ContentService(dataset.db)
+    rng = random.Random(7)
+    ids = itertools.count(10_000_000 + dataset.size * 10)
+    batch = 50
+
+    async def run():
+        for _ in range(batch):
+            item = tmdb_item(next(ids), rng)
+            content_type = "movie" if "title" in item else "tv"
+            assert await service.get_or_create_content(item, content_type) is not None
+
+    bench.run("ContentService.get_or_create_content[miss]", dataset.size, run, ops_per_call=batch)
+
+
+def test_get_my_list(bench, dataset):
+    user_service = UserService(dataset.db, ContentService(dataset.db))
+    profile_id = dataset.profile_ids[len(dataset.profile_ids) // 2]
+
+    async def run():
+        items = await user_service.get_my_list(profile_id)
+        assert len(items) == LIST_SIZE
+
+    bench.run("UserService.get_my_list", dataset.size, run, ops_per_call=LIST_SIZE)
+
+
+def test_get_continue_watching(bench, dataset):
+    user_service = UserService(dataset.db, ContentService(dataset.db))
+    profile_id = dataset.profile_ids[-1]
+
+    async def run():
+        items = await user_service.get_continue_watching(profile_id)
+        assert items
+
+    bench.run("UserService.get_continue_watching", dataset.size, run, ops_per_call=20)
+
+
+def test_catalog_browse(bench, dataset):
+    index = CatalogIndex()
+    index.load(dataset.content_docs)
+    queries = [
+        ({}, lambda doc: True),
+        ({"content_type": "movie", "genres": [28, 12], "genre_mode": "any", "year_min": 2000, "sort": "rating"},
+         lambda doc: doc["content_type"] == "movie" and {28, 12} & set(doc["genre_ids"]) and content_year(doc) >= 2000),
+        ({"genres": [18], "exclude_genres": [27], "rating_min": 6.0, "sort": "year", "descending": False, "offset": 40},
+         lambda doc: 18 in doc["genre_ids"] and 27 not in doc["genre_ids"] and doc["vote_average"] >= 6.0),
+    ]
+    # Totals checked against a plain scan of the documents
+    expected = [sum(1 for doc in dataset.content_docs if matches(doc)) for _, matches in queries]
+    assert expected[0] == len(dataset.content_docs) and all(expected[1:])
+
+    def run():
+        for (query, _), total in zip(queries, expected):
+            assert index.browse(**query)["total"] == total
+
+    bench.run("CatalogIndex.browse", dataset.size, run, ops_per_call=len(queries))
+
+
+def test_tmdb_parsing_helpers(bench, dataset):
+    items = dataset.tmdb_items
+    videos = [
+        {"type": "Featurette", "site": "YouTube", "key": "a"},
+        {"type": "Teaser", "site": "Vimeo", "key": "b"},
+        {"type": "Trailer", "site": "YouTube", "key": "c"},
+    ]
+
+    def run():
+        for item in items:
+            content_type = "movie" if "title" in item else "tv"
+            trailer = tmdb_service.extract_youtube_trailer(videos)
+            tmdb_service.get_content_year(item)
+            tmdb_service.get_full_image_url(item["poster_path"])
+            tmdb_service.format_content_response(item, content_type, trailer)
+
+    bench.run("TMDBService parsing helpers", dataset.size, run, ops_per_call=len(items))
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Local TMDB stub server
+Serves deterministic TMDB-shaped payloads with configurable latency and error injection
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import struct
+import zlib
+from typing import Any, Dict, List
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+GENRE_IDS = [28, 12, 35, 18, 27, 53, 878, 14, 80, 9648, 10749, 10751]
+MOVIE_CERTIFICATIONS = ["G", "PG", "PG-13", "R", ""]
+TV_CERTIFICATIONS = ["TV-Y", "TV-G", "TV-PG", "TV-14", "TV-MA", ""]
+LANGUAGES = ["en", "en", "en", "es", "fr", "ja", "ko", "de"]
+PAGE_SIZE = 20
+# Size of the generated "original" images served by the image origin route
+IMAGE_WIDTH = 600
+IMAGE_HEIGHT = 900
+
+
+class StubConfig:
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 catalog_size: int = 500, seed: int = 42):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.catalog_size = catalog_size
+        self.seed = seed
+
+    @classmethod
+    def from_env(cls) -> "StubConfig":
+        return cls(
+            latency_ms=float(os.environ.get("TMDB_STUB_LATENCY_MS", 0)),
+            jitter_ms=float(os.environ.get("TMDB_STUB_JITTER_MS", 0)),
+            error_rate=float(os.environ.get("TMDB_STUB_ERROR_RATE", 0)),
+            rate_limit_rate=float(os.environ.get("TMDB_STUB_RATE_LIMIT_RATE", 0)),
+            catalog_size=int(os.environ.get("TMDB_STUB_CATALOG_SIZE", 500)),
+            seed=int(os.environ.get("TMDB_STUB_SEED", 42)),
+        )
+
+
+def build_catalog(size: int, seed: int) -> Dict[str, List[Dict[str, Any]]]:
+    """Build a deterministic set of movies and TV shows"""
+    rng = random.Random(seed)
+    catalog = {"movie": [], "tv": []}
+
+    for media_type in ("movie", "tv"):
+        for i in range(size):
+            tmdb_id = (100000 if media_type == "movie" else 200000) + i
+            genres = rng.sample(GENRE_IDS, rng.randint(1, 3))
+            date = f"{rng.randint(1980, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+            item = {
+                "id": tmdb_id,
+                "overview": f"Stub overview for {media_type} {tmdb_id}.",
+                "poster_path": f"/poster_{tmdb_id}.jpg",
+                "backdrop_path": f"/backdrop_{tmdb_id}.jpg",
+                "genre_ids": genres,
+                "vote_average": round(rng.uniform(3.0, 9.5), 1),
+                "popularity": round(rng.uniform(1.0, 5000.0), 3),
+                "adult": False,
+                "original_language": rng.choice(LANGUAGES),
+            }
+            if media_type == "movie":
+                item["title"] = f"Stub Movie {i}"
+                item["release_date"] = date
+            else:
+                item["name"] = f"Stub Show {i}"
+                item["first_air_date"] = date
+                item["number_of_seasons"] = rng.randint(1, 8)
+            catalog[media_type].append(item)
+
+    return catalog
+
+
+def solid_png(width: int, height: int, rgb: bytes) -> bytes:
+    """Single-colour PNG built with the standard library (no imaging dependency)"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    row = b"\x00" + rgb * width
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)),
+        chunk(b"IDAT", zlib.compress(row * height)),
+        chunk(b"IEND", b""),
+    ])
+
+
+def create_app(config: StubConfig = None) -> Starlette:
+    """Create the stub ASGI application"""
+    config = config or StubConfig.from_env()
+    catalog = build_catalog(config.catalog_size, config.seed)
+    by_id = {item["id"]: item for items in catalog.values() for item in items}
+    rng = random.Random(config.seed)
+    stats = {"requests": 0, "errors": 0, "rate_limited": 0}
+
+    def page_of(items: List[Dict[str, Any]], request: Request) -> Dict[str, Any]:
+        page = max(int(request.query_params.get("page", 1)), 1)
+        start = (page - 1) * PAGE_SIZE
+        return {
+            "page": page,
+            "results": items[start:start + PAGE_SIZE],
+            "total_results": len(items),
+            "total_pages": (len(items) + PAGE_SIZE - 1) // PAGE_SIZE,
+        }
+
+    def sorted_by_popularity(media_type: str) -> List[Dict[str, Any]]:
+        return sorted(catalog[media_type], key=lambda item: item["popularity"], reverse=True)
+
+    trending = {media_type: sorted_by_popularity(media_type) for media_type in catalog}
+    # Separate generator so certifications don't shift the rest of the seeded catalog
+    certification_rng = random.Random(config.seed + 1)
+    certifications = {
+        item["id"]: certification_rng.choice(MOVIE_CERTIFICATIONS if media_type == "movie" else TV_CERTIFICATIONS)
+        for media_type, items in catalog.items() for item in items
+    }
+
+    async def inject_faults():
+        stats["requests"] += 1
+        delay = config.latency_ms
+        if config.jitter_ms:
+            delay += rng.uniform(-config.jitter_ms, config.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+        roll = rng.random()
+        if roll < config.rate_limit_rate:
+            stats["rate_limited"] += 1
+            return JSONResponse({"status_message": "Request count over limit"}, status_code=429)
+        if roll < config.rate_limit_rate + config.error_rate:
+            stats["errors"] += 1
+            return JSONResponse({"status_message": "Injected failure"}, status_code=500)
+        return None
+
+    def endpoint(handler):
+        async def wrapped(request: Request):
+            fault = await inject_faults()
+            if fault is not None:
+                return fault
+            return await handler(request)
+        return wrapped
+
+    async def trending_list(request: Request):
+        return JSONResponse(page_of(trending[request.path_params["media_type"]], request))
+
+    async def popular_list(request: Request):
+        media_type = request.url.path.split("/")[1]
+        return JSONResponse(page_of(trending[media_type][5:], request))
+
+    async def discover(request: Request):
+        media_type = request.path_params["media_type"]
+        genre = request.query_params.get("with_genres")
+        items = trending[media_type]
+        if genre:
+            items = [item for item in items if int(genre) in item["genre_ids"]]
+        return JSONResponse(page_of(items, request))
+
+    async def search_multi(request: Request):
+        query = request.query_params.get("query", "").lower()
+        results = []
+        for media_type, items in catalog.items():
+            for item in items:
+                title = (item.get("title") or item.get("name", "")).lower()
+                if query and query in title:
+                    results.append({**item, "media_type": media_type})
+        return JSONResponse(page_of(results, request))
+
+    def videos_of(tmdb_id: int) -> Dict[str, Any]:
+        return {"id": tmdb_id, "results": [{"type": "Trailer", "site": "YouTube", "key": f"stub{tmdb_id}"}]}
+
+    def release_dates_of(tmdb_id: int) -> Dict[str, Any]:
+        certification = certifications.get(tmdb_id, "")
+        return {
+            "id": tmdb_id,
+            "results": [{"iso_3166_1": "US", "release_dates": [{"certification": certification, "type": 3}]}],
+        }
+
+    def content_ratings_of(tmdb_id: int) -> Dict[str, Any]:
+        certification = certifications.get(tmdb_id)
+        results = [{"iso_3166_1": "US", "rating": certification}] if certification else []
+        return {"id": tmdb_id, "results": results}
+
+    def images_of(tmdb_id: int) -> Dict[str, Any]:
+        return {"id": tmdb_id, "logos": [{"file_path": f"/logo_{tmdb_id}.png", "iso_639_1": "en", "vote_average": 5.0}]}
+
+    appendable = {
+        "videos": videos_of, "release_dates": release_dates_of,
+        "content_ratings": content_ratings_of, "images": images_of,
+    }
+
+    async def details(request: Request):
+        tmdb_id = request.path_params["tmdb_id"]
+        item = by_id.get(tmdb_id)
+        if not item:
+            return JSONResponse({"status_message": "Not found"}, status_code=404)
+        # Like TMDB, append_to_response nests sub-resources in the details response
+        appended = {}
+        for name in request.query_params.get("append_to_response", "").split(","):
+            if name in appendable:
+                appended[name] = appendable[name](tmdb_id)
+        return JSONResponse({**item, **appended})
+
+    async def videos(request: Request):
+        return JSONResponse(videos_of(request.path_params["tmdb_id"]))
+
+    async def release_dates(request: Request):
+        return JSONResponse(release_dates_of(request.path_params["tmdb_id"]))
+
+    async def content_ratings(request: Request):
+        return JSONResponse(content_ratings_of(request.path_params["tmdb_id"]))
+
+    async def image(request: Request):
+        # Served as PNG whatever the extension; the proxy re-encodes by file name
+        name = request.path_params["name"]
+        colour = zlib.crc32(name.encode()).to_bytes(4, "big")[:3]
+        return Response(solid_png(IMAGE_WIDTH, IMAGE_HEIGHT, colour), media_type="image/png")
+
+    async def genres(request: Request):
+        return JSONResponse({"genres": [{"id": genre_id, "name": str(genre_id)} for genre_id in GENRE_IDS]})
+
+    async def stub_stats(request: Request):
+        return JSONResponse(stats)
+
+    routes = [
+        Route("/__stats", stub_stats),
+        Route("/trending/{media_type:str}/{time_window:str}", endpoint(trending_list)),
+        Route("/movie/popular", endpoint(popular_list)),
+        Route("/tv/popular", endpoint(popular_list)),
+        Route("/discover/{media_type:str}", endpoint(discover)),
+        Route("/search/multi", endpoint(search_multi)),
+        Route("/movie/{tmdb_id:int}", endpoint(details)),
+        Route("/tv/{tmdb_id:int}", endpoint(details)),
+        Route("/movie/{tmdb_id:int}/videos", endpoint(videos)),
+        Route("/tv/{tmdb_id:int}/videos", endpoint(videos)),
+        Route("/movie/{tmdb_id:int}/release_dates", endpoint(release_dates)),
+        Route("/tv/{tmdb_id:int}/content_ratings", endpoint(content_ratings)),
+        Route("/genre/{media_type:str}/list", endpoint(genres)),
+        Route("/t/p/{size:str}/{name:str}", endpoint(image)),
+    ]
+    return Starlette(routes=routes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the local TMDB stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--catalog-size", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = StubConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        catalog_size=args.catalog_size,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+"""
+Shared setup for the backend unit tests
+
+Tests import backend modules the way the server does (flat `services.*`, `routes.*`
+imports) and run against the in-memory Mongo stand-in and in-process HTTP stubs, so
+no database or network is needed. Run with `python -m pytest tests`.
+"""
+
+import sys
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+BACKEND_DIR = REPO_DIR / "backend"
+for path in (str(BACKEND_DIR), str(REPO_DIR)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,164 @@
+"""
+Two-tier cache: coalesced loads, cancellation, the fleet-wide lease and namespace versions
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import services.cache as cache_module
+from benchmarks.memory_mongo import MemoryDatabase
+from services.cache import MISSING, TwoTierCache, bump_namespace_version, configure_l2_cache
+
+
+@pytest.fixture(autouse=True)
+def l2_state(monkeypatch):
+    """Start every test without a shared collection or namespace versions"""
+    monkeypatch.setattr(cache_module, "_l2_collection", None)
+    monkeypatch.setattr(cache_module, "_versions_collection", None)
+    monkeypatch.setattr(cache_module, "_namespace_versions", {})
+    monkeypatch.setattr(cache_module, "_caches", {})
+    monkeypatch.setattr(cache_module, "LEASE_POLL_SECONDS", 0.01)
+
+
+class Loader:
+    def __init__(self, value="loaded"):
+        self.value = value
+        self.calls = 0
+        self.cancelled = False
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return self.value
+
+
+def test_concurrent_misses_share_one_load():
+    async def run():
+        db = MemoryDatabase()
+        await configure_l2_cache(db)
+        cache = TwoTierCache("coalesce")
+        loader = Loader()
+        callers = [asyncio.ensure_future(cache.get_or_load("k", loader)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        loader.release.set()
+        assert await asyncio.gather(*callers) == ["loaded"] * 3
+        assert loader.calls == 1
+        assert not cache._inflight and not cache._waiters
+        assert db.cache_entries._docs[cache.l2_key("k")]["value"] == "loaded"
+
+        # Another worker finds the value in L2
+        other_worker = TwoTierCache("coalesce")
+        assert await other_worker.get_or_load("k", Loader("unused")) == "loaded"
+
+    asyncio.run(run())
+
+
+def test_cancelling_the_last_waiter_cancels_the_load():
+    async def run():
+        cache = TwoTierCache("cancel")
+        loader = Loader()
+        first = asyncio.ensure_future(cache.get_or_load("k", loader))
+        second = asyncio.ensure_future(cache.get_or_load("k", loader))
+        await asyncio.sleep(0.01)
+
+        first.cancel()
+        await asyncio.sleep(0.01)
+        assert not loader.cancelled
+        second.cancel()
+        await asyncio.sleep(0.01)
+        assert loader.cancelled
+        assert "k" not in cache._inflight
+
+        # A later caller starts a fresh load
+        retry = Loader("fresh")
+        retry.release.set()
+        assert await cache.get_or_load("k", retry) == "fresh"
+        assert retry.calls == 1
+
+    asyncio.run(run())
+
+
+def test_lease_holder_publishes_and_waiters_poll_l2():
+    async def run():
+        db = MemoryDatabase()
+        await configure_l2_cache(db)
+        cache = TwoTierCache("lease")
+        # Another worker holds the lease for this key
+        await db.cache_entries.insert_one(
+            {"_id": f"lease:{cache.l2_key('k')}", "expires_at": datetime.utcnow() + timedelta(seconds=10)}
+        )
+        loader = Loader()
+        loader.release.set()
+        waiter = asyncio.ensure_future(cache.get_or_load("k", loader))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+
+        await db.cache_entries.insert_one(
+            {"_id": cache.l2_key("k"), "value": "published", "expires_at": datetime.utcnow() + timedelta(seconds=60)}
+        )
+        assert await waiter == "published"
+        assert loader.calls == 0
+
+    asyncio.run(run())
+
+
+def test_waiters_load_themselves_when_the_lease_holder_never_publishes(monkeypatch):
+    monkeypatch.setattr(cache_module, "LEASE_WAIT_SECONDS", 0.05)
+
+    async def run():
+        db = MemoryDatabase()
+        await configure_l2_cache(db)
+        cache = TwoTierCache("stalled")
+        await db.cache_entries.insert_one(
+            {"_id": f"lease:{cache.l2_key('k')}", "expires_at": datetime.utcnow() + timedelta(seconds=10)}
+        )
+        loader = Loader()
+        loader.release.set()
+        assert await cache.get_or_load("k", loader) == "loaded"
+        assert loader.calls == 1
+
+    asyncio.run(run())
+
+
+def test_bump_namespace_version_orphans_entries():
+    async def run():
+        db = MemoryDatabase()
+        await configure_l2_cache(db)
+        cache = TwoTierCache("rows")
+        await cache.set("k", "old")
+        old_key = cache.l2_key("k")
+
+        await bump_namespace_version("rows", 5)
+        assert cache.version == 5
+        assert "k" not in cache.l1
+        assert cache.l2_key("k") != old_key
+        assert await cache.get("k") is MISSING
+        assert (await db.cache_versions.find_one({"_id": "rows"}))["version"] == 5
+
+        # Older or repeated versions are ignored
+        await bump_namespace_version("rows", 3)
+        assert cache.version == 5
+        assert (await db.cache_versions.find_one({"_id": "rows"}))["version"] == 5
+
+        # A load that straddles a bump is returned but not cached
+        loader = Loader("straddling")
+        pending = asyncio.ensure_future(cache.get_or_load("k", loader))
+        await asyncio.sleep(0.01)
+        await bump_namespace_version("rows", 6)
+        loader.release.set()
+        assert await pending == "straddling"
+        assert await cache.get("k") is MISSING
+
+        # Versions are loaded by workers starting later
+        cache_module._namespace_versions.clear()
+        await configure_l2_cache(db)
+        assert cache.version == 6
+
+    asyncio.run(run())
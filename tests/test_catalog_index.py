@@ -0,0 +1,199 @@
+"""
+Catalog index: browse filters, sort order, paging, facets, deletes and snapshot loading
+"""
+
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from pymongo.errors import OperationFailure
+
+import routes.content as content_routes
+import services.invalidation_service as invalidation_module
+from benchmarks.memory_mongo import MemoryDatabase
+from services.catalog_index import CatalogIndex
+from services.invalidation_service import InvalidationService
+from services.snapshot_service import CatalogSnapshot, build_sections, write_snapshot
+
+
+def content_doc(content_id, content_type="movie", genre_ids=(), date=None, vote_average=0.0,
+                popularity=0.0, language="en", kids_safe=False):
+    doc = {"_id": f"oid-{content_id}", "id": content_id, "title": content_id.upper(),
+           "poster_path": f"/{content_id}.jpg", "content_type": content_type, "tmdb_id": len(content_id),
+           "genre_ids": list(genre_ids), "vote_average": vote_average, "popularity": popularity,
+           "original_language": language, "kids_safe": kids_safe}
+    doc["first_air_date" if content_type == "tv" else "release_date"] = date
+    return doc
+
+
+DOCS = [
+    content_doc("a", genre_ids=[28, 12], date="2001-05-01", vote_average=7.5, popularity=50),
+    content_doc("b", "tv", genre_ids=[16, 10751], date="1995-09-10", vote_average=8.0, popularity=30,
+                language="ja", kids_safe=True),
+    content_doc("c", genre_ids=[28], date="2010-01-01", vote_average=6.0, popularity=80),
+    content_doc("d", genre_ids=[18, 27], date="1988-03-03", vote_average=5.5, popularity=10, language="fr"),
+    content_doc("e", genre_ids=[16], vote_average=7.0, popularity=20, kids_safe=True),
+]
+
+
+@pytest.fixture
+def index():
+    index = CatalogIndex()
+    index.load(dict(doc) for doc in DOCS)
+    return index
+
+
+def ids(result):
+    return [record.id for record in result["records"]]
+
+
+@pytest.mark.parametrize("filters, expected", [
+    ({}, ["c", "a", "b", "e", "d"]),
+    ({"genres": [28, 12]}, ["a"]),
+    ({"genres": [28, 12], "genre_mode": "any"}, ["c", "a"]),
+    ({"genres": [28, 99]}, []),
+    ({"genres": [28, 99], "genre_mode": "any"}, ["c", "a"]),
+    ({"exclude_genres": [28]}, ["b", "e", "d"]),
+    ({"exclude_genres": [16, 99]}, ["c", "a", "d"]),
+    ({"year_min": 2000}, ["c", "a"]),
+    ({"year_max": 2000}, ["b", "d"]),
+    ({"year_min": 1990, "year_max": 2005}, ["a", "b"]),
+    ({"rating_min": 7.0}, ["a", "b", "e"]),
+    ({"languages": ["en"]}, ["c", "a", "e"]),
+    ({"languages": ["ja", "xx"]}, ["b"]),
+    ({"kids_only": True}, ["b", "e"]),
+    ({"content_type": "tv"}, ["b"]),
+    ({"content_type": "movie", "genres": [16]}, ["e"]),
+])
+def test_filters(index, filters, expected):
+    result = index.browse(**filters)
+    assert ids(result) == expected
+    assert result["total"] == len(expected)
+
+
+@pytest.mark.parametrize("sort, descending, expected", [
+    ("popularity", True, ["c", "a", "b", "e", "d"]),
+    ("popularity", False, ["d", "e", "b", "a", "c"]),
+    ("rating", True, ["b", "a", "e", "c", "d"]),
+    ("year", True, ["c", "a", "b", "d", "e"]),
+    ("year", False, ["e", "d", "b", "a", "c"]),
+])
+def test_sort_order(index, sort, descending, expected):
+    assert ids(index.browse(sort=sort, descending=descending)) == expected
+
+
+@pytest.mark.parametrize("offset, limit, expected", [
+    (0, 2, ["c", "a"]),
+    (1, 2, ["a", "b"]),
+    (3, 2, ["e", "d"]),
+    (4, 2, ["d"]),
+    (0, 5, ["c", "a", "b", "e", "d"]),
+    (5, 2, []),
+    (9, 2, []),
+])
+def test_page_boundaries(index, offset, limit, expected):
+    result = index.browse(offset=offset, limit=limit)
+    assert ids(result) == expected
+    assert result["total"] == 5
+
+
+def test_facets_count_every_match(index):
+    facets = index.browse(limit=1)["facets"]
+    assert dict(facets["genres"]) == {28: 2, 12: 1, 16: 2, 10751: 1, 18: 1, 27: 1}
+    assert [count for _, count in facets["genres"]] == sorted((count for _, count in facets["genres"]), reverse=True)
+    assert facets["type"] == [("movie", 4), ("series", 1)]
+    assert facets["language"] == [("en", 3), ("ja", 1), ("fr", 1)]
+    assert facets["decade"] == [(1980, 1), (1990, 1), (2000, 1), (2010, 1)]
+
+    filtered = index.browse(genres=[28], facets=True)["facets"]
+    assert dict(filtered["genres"]) == {28: 2, 12: 1}
+    assert filtered["type"] == [("movie", 2)]
+    assert "facets" not in index.browse(facets=False)
+
+
+def test_upsert_replaces_a_title(index):
+    index.upsert(dict(DOCS[3], popularity=100, kids_safe=True))
+    assert ids(index.browse(limit=2)) == ["d", "c"]
+    assert ids(index.browse(kids_only=True)) == ["d", "b", "e"]
+    assert len(index) == 5
+
+
+def test_removed_titles_leave_results_and_facets(index):
+    assert index.remove("c")
+    assert not index.remove("c")
+    assert not index.remove("missing")
+    result = index.browse()
+    assert ids(result) == ["a", "b", "e", "d"]
+    assert dict(result["facets"]["genres"])[28] == 1
+    assert len(index) == 4
+
+    index.upsert(dict(DOCS[2]))
+    assert ids(index.browse(limit=1)) == ["c"]
+
+
+def test_delete_events_remove_titles(index, monkeypatch):
+    monkeypatch.setattr(invalidation_module, "catalog_index", index)
+    change = {"ns": {"coll": "content"}, "operationType": "delete", "documentKey": {"_id": "oid-a"}}
+    asyncio.run(InvalidationService().handle(change))
+    assert "a" not in ids(index.browse())
+
+
+def test_reconcile_removes_titles_deleted_without_events(index):
+    async def run():
+        db = MemoryDatabase()
+        await db.content.insert_many([dict(doc) for doc in DOCS if doc["id"] != "d"])
+
+        async def distinct(*args, **kwargs):
+            raise OperationFailure("distinct too big. 16mb cap", code=17217)
+
+        # Large catalogs can't return every id in one distinct() reply
+        db.content.distinct = distinct
+        assert await index.reconcile(db) == 1
+        assert await index.reconcile(db) == 0
+
+    asyncio.run(run())
+    assert ids(index.browse()) == ["c", "a", "b", "e"]
+
+
+def test_snapshot_columns_match_documents(index, tmp_path):
+    docs = DOCS + [content_doc("f", language="", genre_ids=[35]), content_doc("g", language="x-long-language")]
+    for doc in docs[5:]:
+        index.upsert(dict(doc))
+    path = str(tmp_path / "catalog.snapshot")
+    write_snapshot(path, build_sections([dict(doc) for doc in docs], {}, {}, 1), {"created_at": "now", "count": len(docs)})
+    snapshot = CatalogSnapshot()
+    snapshot.load(path)
+    try:
+        from_snapshot = CatalogIndex()
+        from_snapshot.load_snapshot(snapshot)
+        assert from_snapshot.loaded
+        assert not from_snapshot.records
+        # Only the returned page is decoded
+        assert from_snapshot.browse(limit=1)["records"][0].title == "C"
+        assert len(from_snapshot.records) == 1
+        for filters in [{}, {"genres": [28, 12], "genre_mode": "any"}, {"languages": ["unknown"]},
+                        {"languages": ["x-long-language"]}, {"year_max": 1999}, {"sort": "year", "descending": False}]:
+            expected, actual = index.browse(**filters), from_snapshot.browse(**filters)
+            assert ids(actual) == ids(expected)
+            assert actual["facets"] == expected["facets"]
+        assert from_snapshot.remove("a")
+        assert "a" not in ids(from_snapshot.browse())
+    finally:
+        snapshot.close()
+
+
+def test_browse_is_unavailable_until_the_index_loads(monkeypatch):
+    monkeypatch.setattr(content_routes, "catalog_index", CatalogIndex())
+    app = FastAPI()
+    app.include_router(content_routes.router)
+    app.dependency_overrides[content_routes.get_content_service] = lambda: None
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/content/browse")
+
+    response = asyncio.run(run())
+    assert response.status_code == 503
+    assert response.json()["detail"] == "Catalog index is still loading"
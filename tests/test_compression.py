@@ -0,0 +1,98 @@
+"""
+Response compression: Accept-Encoding negotiation, passthrough and the compressed body cache
+"""
+
+import asyncio
+import gzip
+import json
+
+import pytest
+
+import middleware.compression as compression_module
+from middleware.compression import CompressionMiddleware, compressed_bodies, negotiate_encoding
+
+BODY = json.dumps([{"id": str(n), "title": "Title"} for n in range(100)]).encode()
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    compressed_bodies.clear()
+    yield
+    compressed_bodies.clear()
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("GZIP, deflate", "gzip"),
+    ("gzip, br", "br"),
+    ("br;q=0.5, gzip;q=1", "br"),
+    ("gzip, br;q=0", "gzip"),
+    ("gzip;q=0.0, br;q=0", None),
+    ("gzip;q=abc", None),
+])
+def test_negotiate_encoding(header, expected, monkeypatch):
+    if compression_module.brotli is None:
+        monkeypatch.setattr(compression_module, "brotli", object())
+    assert negotiate_encoding(header) == expected
+
+
+def test_negotiate_encoding_without_brotli(monkeypatch):
+    monkeypatch.setattr(compression_module, "brotli", None)
+    assert negotiate_encoding("br, gzip") == "gzip"
+    assert negotiate_encoding("br") is None
+
+
+def respond(body, headers=(), more_body=False, accept_encoding="gzip", path="/api/content"):
+    """Run one response through the middleware and return the messages it sends"""
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": list(headers)})
+        await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "path": path, "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    asyncio.run(CompressionMiddleware(app)(scope, None, send))
+    start, message = sent[0], sent[1]
+    return dict(start["headers"]), message["body"]
+
+
+JSON = [(b"content-type", b"application/json")]
+
+
+def test_json_bodies_are_gzipped():
+    headers, body = respond(BODY, JSON + [(b"content-length", str(len(BODY)).encode()), (b"vary", b"Origin")])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"content-length"] == str(len(body)).encode()
+    assert headers[b"vary"] == b"Origin, Accept-Encoding"
+    assert gzip.decompress(body) == BODY
+
+
+@pytest.mark.parametrize("body, headers, more_body, accept_encoding", [
+    (BODY[:100], JSON, False, "gzip"),
+    (BODY, [(b"content-type", b"image/jpeg")], False, "gzip"),
+    (BODY, JSON + [(b"content-encoding", b"br")], False, "gzip"),
+    (BODY, JSON, True, "gzip"),
+    (BODY, JSON, False, "gzip;q=0"),
+])
+def test_passthrough(body, headers, more_body, accept_encoding):
+    sent_headers, sent_body = respond(body, headers, more_body, accept_encoding)
+    assert sent_body == body
+    assert sent_headers.get(b"content-encoding") == dict(headers).get(b"content-encoding")
+    assert b"vary" not in sent_headers
+
+
+def test_same_etag_on_different_paths_is_not_shared():
+    etag = [(b"etag", b'W/"rows-1"')]
+    other = BODY.replace(b"Title", b"Other")
+    _, first = respond(BODY, JSON + etag, path="/api/content/trending")
+    _, second = respond(other, JSON + etag, path="/api/content/popular")
+    assert gzip.decompress(first) == BODY
+    assert gzip.decompress(second) == other
+    # Identical bodies are compressed once
+    _, again = respond(BODY, JSON, path="/api/content/search")
+    assert again is first
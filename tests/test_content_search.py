@@ -0,0 +1,69 @@
+"""
+Content search: indexed title prefix matches and TMDB results that are not stored
+"""
+
+import asyncio
+
+from benchmarks.memory_mongo import MemoryDatabase
+from services.content_service import ContentService, content_id
+from services.tmdb_service import tmdb_service
+
+
+def stored_content(title: str, popularity: float, **fields):
+    doc = {"id": f"id-{title}", "title": title, "title_lower": title.lower(), "content_type": "movie",
+           "tmdb_id": sum(map(ord, title)), "popularity": popularity, "poster_path": "/poster.jpg",
+           "genre_names": ["Drama"]}
+    doc.update(fields)
+    return doc
+
+
+def test_search_local_matches_title_prefix_case_insensitively():
+    async def run():
+        db = MemoryDatabase()
+        await db.content.insert_many([
+            stored_content("The Dark Knight", 50),
+            stored_content("the darkest hour", 80),
+            stored_content("Knight and Day", 90),
+            stored_content("Dark Waters", 70),
+        ])
+        results = await ContentService(db).search_local("THE DARK")
+        assert [item.title for item in results] == ["the darkest hour", "The Dark Knight"]
+
+    asyncio.run(run())
+
+
+def test_ensure_indexes_backfills_title_lower():
+    async def run():
+        db = MemoryDatabase()
+        await db.content.insert_one({"id": "old", "title": "Old Title", "content_type": "movie", "tmdb_id": 1,
+                                      "poster_path": "/old.jpg"})
+        service = ContentService(db)
+        await service.ensure_indexes()
+        assert list(db.content._docs.values())[0]["title_lower"] == "old title"
+        assert [item.id for item in await service.search_local("old")] == ["old"]
+
+    asyncio.run(run())
+
+
+def test_search_tmdb_does_not_store_results(monkeypatch):
+    async def search_multi(query, page=1):
+        return [
+            {"id": 7, "media_type": "movie", "title": "Stored Movie", "popularity": 5},
+            {"id": 8, "media_type": "tv", "name": "New Show", "poster_path": "/new.jpg"},
+            {"id": 10, "media_type": "movie", "title": "No Poster"},
+            {"id": 9, "media_type": "person", "name": "Somebody"},
+        ]
+
+    monkeypatch.setattr(tmdb_service, "search_multi", search_multi)
+
+    async def run():
+        db = MemoryDatabase()
+        await db.content.insert_one(stored_content("Stored Movie", 5, id="stored", tmdb_id=7))
+        results = await ContentService(db).search_tmdb("s")
+        assert [(item.id, item.title, item.type) for item in results] == [
+            ("stored", "Stored Movie", "movie"),
+            (content_id("tv", 8), "New Show", "series"),
+        ]
+        assert len(db.content._docs) == 1
+
+    asyncio.run(run())
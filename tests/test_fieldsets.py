@@ -0,0 +1,63 @@
+"""
+Sparse fieldsets: parsing `fields=` and `view=`, Mongo projections and trimming responses
+"""
+
+import pytest
+
+from models.content import ContentResponse
+from services.fieldsets import CONTENT_FIELDS, CONTENT_VIEWS, mongo_projection, resolve_fields, select_fields
+
+
+@pytest.mark.parametrize("fields, view, expected", [
+    (None, None, None),
+    ("", None, None),
+    ("title,image", None, ["id", "title", "image"]),
+    ("id", None, ["id"]),
+    (" title , id,title,, year ", None, ["id", "title", "year"]),
+    # fields= wins over view=
+    ("title", "hero", ["id", "title"]),
+    (None, "card", CONTENT_VIEWS["card"]),
+    (None, "hero", CONTENT_VIEWS["hero"]),
+    (None, "full", None),
+])
+def test_resolve_fields(fields, view, expected):
+    assert resolve_fields(fields, view) == expected
+
+
+@pytest.mark.parametrize("fields, view, message", [
+    ("title,poster_path", None, "Unknown fields: poster_path"),
+    ("Title,bogus", None, "Unknown fields: Title, bogus"),
+    (None, "compact", "view must be one of ['card', 'full', 'hero']"),
+])
+def test_resolve_fields_rejects_unknown_names(fields, view, message):
+    with pytest.raises(ValueError, match=message.replace("[", r"\[")):
+        resolve_fields(fields, view)
+
+
+def test_every_view_names_known_fields():
+    assert all(field in CONTENT_FIELDS for fields in CONTENT_VIEWS.values() for field in fields)
+    assert all(fields[0] == "id" for fields in CONTENT_VIEWS.values())
+
+
+def test_mongo_projection_maps_to_stored_fields():
+    assert mongo_projection(["id", "image", "year"]) == {
+        "_id": 0, "id": 1, "poster_path": 1, "release_date": 1, "first_air_date": 1,
+        "content_type": 1, "tmdb_id": 1,
+    }
+    # Refs are matched on id, content_type and tmdb_id even when they aren't requested
+    assert mongo_projection(["title"]) == {"_id": 0, "title": 1, "id": 1, "content_type": 1, "tmdb_id": 1}
+
+
+CONTENT = ContentResponse(id="c1", title="Title", image="/i.jpg", type="movie", year="2001", genre=["Drama"],
+                          tmdb_id=1, vote_average=7.0, popularity=3.0)
+
+
+def test_select_fields_trims_models_dicts_and_lists():
+    fields = resolve_fields("title,backdrop", None)
+    assert select_fields(CONTENT, fields) == {"id": "c1", "title": "Title", "backdrop": None}
+    assert select_fields(CONTENT.dict(), fields) == {"id": "c1", "title": "Title", "backdrop": None}
+    assert select_fields({"id": "c2", "title": "Partial"}, fields) == {"id": "c2", "title": "Partial"}
+    assert select_fields([CONTENT, None], CONTENT_VIEWS["card"]) == [
+        {"id": "c1", "title": "Title", "image": "/i.jpg", "type": "movie"}, None,
+    ]
+    assert select_fields(None, fields) is None
@@ -0,0 +1,180 @@
+"""
+Image proxy: request validation, one origin fetch per original, cache headers and
+LRU pruning, against an in-process stub origin
+"""
+
+import asyncio
+import io
+import os
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import routes.images
+from services.image_service import ImageService
+
+
+class StubOrigin:
+    """Serves a generated image for any name except missing.jpg, counting fetches"""
+
+    def __init__(self):
+        self.fetches = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.fetches.append(request.url.path)
+        if request.url.path.endswith("/missing.jpg"):
+            return httpx.Response(404)
+        buffer = io.BytesIO()
+        Image.new("RGB", (800, 1200), (200, 30, 30)).save(buffer, "JPEG")
+        return httpx.Response(200, content=buffer.getvalue())
+
+
+@pytest.fixture
+def origin() -> StubOrigin:
+    return StubOrigin()
+
+
+@pytest.fixture
+def service(tmp_path, origin, monkeypatch) -> ImageService:
+    image_service = ImageService()
+    image_service.cache_dir = tmp_path
+    image_service.transport = httpx.MockTransport(origin)
+    monkeypatch.setattr(routes.images, "image_service", image_service)
+    yield image_service
+    image_service.shutdown()
+
+
+@pytest.fixture
+def client(service) -> TestClient:
+    app = FastAPI()
+    app.include_router(routes.images.router, prefix="/api")
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def test_rejects_unknown_size(client, origin):
+    response = client.get("/api/images/w9999/poster.jpg")
+    assert response.status_code == 400
+    assert origin.fetches == []
+
+
+@pytest.mark.parametrize("path", ["poster.gif", "..%2Fsecret.jpg", "has space.jpg", ".hidden.jpg"])
+def test_rejects_invalid_path(client, origin, path):
+    assert client.get(f"/api/images/card/{path}").status_code in (400, 404)
+    assert origin.fetches == []
+
+
+def test_missing_original_is_404(client):
+    assert client.get("/api/images/card/missing.jpg").status_code == 404
+
+
+def test_serves_variants_with_immutable_cache_headers(client, service):
+    original = client.get("/api/images/original/poster.jpg")
+    card = client.get("/api/images/card/poster.jpg")
+    assert original.status_code == card.status_code == 200
+    assert card.headers["cache-control"] == routes.images.IMMUTABLE_CACHE_CONTROL
+    assert card.headers["content-type"] == "image/jpeg"
+    with Image.open(io.BytesIO(card.content)) as image:
+        assert image.width == 342
+    with Image.open(io.BytesIO(original.content)) as image:
+        assert image.width == 800
+    assert (service.cache_dir / "card" / "poster.jpg").exists()
+
+
+def test_fetches_each_original_once(client, origin):
+    for size in ("thumbnail", "card", "hero", "original", "card", "thumbnail"):
+        assert client.get(f"/api/images/{size}/poster.jpg").status_code == 200
+    assert client.get("/api/images/card/backdrop.jpg").status_code == 200
+    assert origin.fetches == ["/t/p/original/poster.jpg", "/t/p/original/backdrop.jpg"]
+
+
+def test_prunes_least_recently_used_files(service):
+    service.max_bytes = 1000
+    old = service.variant_path("original", "old.jpg")
+    recent = service.variant_path("card", "recent.jpg")
+    for path, age in ((old, 600), (recent, 0)):
+        service._write(path, b"x" * 600)
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+
+    remaining = service._prune()
+
+    assert not old.exists()
+    assert recent.exists()
+    assert remaining == 600
+
+
+def test_never_prunes_files_just_written(service):
+    service.max_bytes = 1
+    path = service.variant_path("original", "fresh.jpg")
+    service._write(path, b"x" * 600)
+
+    assert service._prune() == 600
+    assert path.exists()
+
+
+def test_prunes_in_background_after_a_write_over_budget(client, service):
+    stale = service.variant_path("original", "stale.jpg")
+    service._write(stale, b"x" * 600)
+    stamp = time.time() - 3600
+    os.utime(stale, (stamp, stamp))
+    service.max_bytes = 600
+
+    assert client.get("/api/images/original/poster.jpg").status_code == 200
+    deadline = time.time() + 5
+    while service._cache_bytes is None and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert not stale.exists()
+    assert service.variant_path("original", "poster.jpg").exists()
+    assert service._cache_bytes == service.variant_path("original", "poster.jpg").stat().st_size
+
+
+def test_file_pruned_after_lookup_is_rebuilt(client, service, origin):
+    assert client.get("/api/images/card/poster.jpg").status_code == 200
+    get_variant = service.get_variant
+    calls = {"count": 0}
+
+    async def pruned_once(variant, name):
+        path = await get_variant(variant, name)
+        calls["count"] += 1
+        if calls["count"] == 1:
+            path.unlink()
+        return path
+
+    service.get_variant = pruned_once
+    response = client.get("/api/images/card/poster.jpg")
+    assert response.status_code == 200
+    assert response.headers["content-length"] == str(len(response.content))
+    with Image.open(io.BytesIO(response.content)) as image:
+        assert image.width == 342
+
+
+def test_original_pruned_before_resize_is_fetched_again(client, service, origin):
+    assert client.get("/api/images/original/poster.jpg").status_code == 200
+    resize = service._resize
+    calls = {"count": 0}
+
+    def pruned_once(source, *args):
+        calls["count"] += 1
+        if calls["count"] == 1:
+            source.unlink()
+        return resize(source, *args)
+
+    service._resize = pruned_once
+    assert client.get("/api/images/card/poster.jpg").status_code == 200
+    assert origin.fetches == ["/t/p/original/poster.jpg", "/t/p/original/poster.jpg"]
+
+
+def test_open_file_survives_pruning(service):
+    async def run():
+        file, stat_result = await service.open_variant("original", "poster.jpg")
+        with file:
+            service.variant_path("original", "poster.jpg").unlink()
+            assert len(file.read()) == stat_result.st_size
+
+    asyncio.run(run())
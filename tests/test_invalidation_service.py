@@ -0,0 +1,118 @@
+"""
+Change stream invalidation: which caches each synthetic change event clears
+"""
+
+import asyncio
+
+import pytest
+from bson import Timestamp
+
+import services.cache as cache_module
+import services.invalidation_service as invalidation_module
+from services.catalog_index import CatalogIndex
+from services.content_service import row_cache
+from services.invalidation_service import InvalidationService, cluster_version
+from services.kids_service import profile_flags
+from services.personalization_service import item_genres, profile_vectors
+
+
+@pytest.fixture
+def index(monkeypatch):
+    monkeypatch.setattr(cache_module, "_versions_collection", None)
+    monkeypatch.setattr(cache_module, "_namespace_versions", {})
+    monkeypatch.setattr(cache_module, "_caches", {})
+    index = CatalogIndex()
+    monkeypatch.setattr(invalidation_module, "catalog_index", index)
+    for cache in (item_genres, profile_vectors, profile_flags):
+        cache.clear()
+    yield index
+    for cache in (item_genres, profile_vectors, profile_flags):
+        cache.clear()
+
+
+def content_doc(content_id: str, **fields):
+    doc = {"_id": f"oid-{content_id}", "id": content_id, "title": content_id.upper(), "poster_path": "/p.jpg",
+           "content_type": "movie", "tmdb_id": 1, "genre_ids": [28], "popularity": 10.0}
+    doc.update(fields)
+    return doc
+
+
+def handle(change):
+    asyncio.run(InvalidationService().handle(change))
+
+
+def content_update(fields, removed=(), doc=None):
+    return {"ns": {"coll": "content"}, "operationType": "update", "clusterTime": Timestamp(1700000000, 3),
+            "fullDocument": doc or content_doc("a"), "documentKey": {"_id": "oid-a"},
+            "updateDescription": {"updatedFields": fields, "removedFields": list(removed)}}
+
+
+@pytest.mark.parametrize("fields, removed", [
+    ({"title": "New"}, ()),
+    ({"poster_path": "/new.jpg", "updated_at": 1}, ()),
+    ({"genre_ids.0": 12}, ()),
+    ({}, ("kids_safe",)),
+])
+def test_row_field_updates_bump_the_row_version(index, fields, removed):
+    item_genres.set("a", [28])
+    item_genres.set("b", [12])
+    change = content_update(fields, removed)
+    handle(change)
+    assert row_cache.version == cluster_version(change)
+    assert "a" not in item_genres
+    assert "b" in item_genres
+
+
+@pytest.mark.parametrize("fields", [{"updated_at": 1}, {"tmdb_fetched_at": 2, "cast.0": "x"}])
+def test_other_updates_keep_cached_rows(index, fields):
+    item_genres.set("a", [28])
+    handle(content_update(fields))
+    assert row_cache.version == 0
+    assert "a" in item_genres
+
+
+def test_content_inserts_and_updates_reach_the_catalog_index(index):
+    handle({"ns": {"coll": "content"}, "operationType": "insert", "fullDocument": content_doc("a")})
+    assert row_cache.version == 0
+    assert [record.id for record in index.browse()["records"]] == ["a"]
+
+    handle(content_update({"popularity": 5.0}, doc=content_doc("a", popularity=5.0, kids_safe=True)))
+    assert [record.id for record in index.browse(kids_only=True)["records"]] == ["a"]
+
+
+def test_content_deletes_remove_titles_and_clear_item_genres(index):
+    index.load([content_doc("a"), content_doc("b")])
+    item_genres.set("a", [28])
+    handle({"ns": {"coll": "content"}, "operationType": "delete", "documentKey": {"_id": "oid-a"},
+            "clusterTime": Timestamp(1700000001, 1)})
+    assert [record.id for record in index.browse()["records"]] == ["b"]
+    # Without a pre-image the deleted id is unknown
+    assert "a" not in item_genres
+    assert row_cache.version == cluster_version({"clusterTime": Timestamp(1700000001, 1)})
+
+
+@pytest.mark.parametrize("collection", ["my_list", "viewing_progress"])
+def test_interaction_changes_invalidate_the_profile_vector(index, collection):
+    profile_vectors.set("p1", {28: 1.0})
+    profile_vectors.set("p2", {12: 1.0})
+    handle({"ns": {"coll": collection}, "operationType": "insert",
+            "fullDocument": {"profile_id": "p1", "content_id": "a"}})
+    assert "p1" not in profile_vectors
+    assert "p2" in profile_vectors
+
+    # A delete without a pre-image can't name the profile
+    handle({"ns": {"coll": collection}, "operationType": "delete", "documentKey": {"_id": "x"}})
+    assert "p2" not in profile_vectors
+
+
+def test_profile_changes_invalidate_the_kids_flag(index):
+    profile_flags.set("kid", True)
+    profile_flags.set("parent", False)
+    handle({"ns": {"coll": "user_profiles"}, "operationType": "update",
+            "fullDocument": {"id": "kid", "is_kids": False}})
+    assert "kid" not in profile_flags
+    assert "parent" in profile_flags
+
+    handle({"ns": {"coll": "user_profiles"}, "operationType": "delete",
+            "fullDocumentBeforeChange": {"id": "parent"}})
+    assert "parent" not in profile_flags
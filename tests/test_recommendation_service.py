@@ -0,0 +1,173 @@
+"""
+Item-to-item recommendations: the sparse build against dense matrices, incremental runs and the build task
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import services.recommendation_service as recommendation_module
+from benchmarks.memory_mongo import MemoryDatabase
+from services.recommendation_service import (
+    RecommendationService, LEASE_ID, build_item_neighbours, build_profile_recommendations
+)
+from services.task_queue import TaskQueue
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(recommendation_module, "RECOMMENDATIONS_ENABLED", True)
+    service = RecommendationService()
+    # Build in a thread instead of the spawned process pool
+    monkeypatch.setattr(service, "_executor", lambda: None)
+    return service
+
+
+def test_registered_task_creates_indexes_and_builds(service, monkeypatch):
+    queue = TaskQueue()
+    monkeypatch.setattr(recommendation_module, "task_queue", queue)
+    service.start(None)
+    _, handler = queue._handlers["recommendations.build"]
+
+    async def run():
+        db = MemoryDatabase()
+        now = datetime.utcnow()
+        await db.my_list.insert_many([
+            {"profile_id": "p1", "content_id": "a", "added_at": now},
+            {"profile_id": "p1", "content_id": "b", "added_at": now},
+            {"profile_id": "p2", "content_id": "a", "added_at": now},
+        ])
+        await handler(db, {})
+        assert {"added_at", "content_id"} <= set(db.my_list._indexes)
+        assert {"last_watched", "content_id"} <= set(db.viewing_progress._indexes)
+        assert await db.recommendation_state.find_one({"_id": LEASE_ID}) is None
+        return await service.get_profile_recommendations(db, "p2")
+
+    assert [item["content_id"] for item in asyncio.run(run())] == ["b"]
+    assert service.last_run["mode"] == "full"
+
+
+def test_registered_task_respects_the_build_lease(service, monkeypatch):
+    queue = TaskQueue()
+    monkeypatch.setattr(recommendation_module, "task_queue", queue)
+    service.start(None)
+    _, handler = queue._handlers["recommendations.build"]
+
+    async def run():
+        db = MemoryDatabase()
+        await db.recommendation_state.insert_one({"_id": LEASE_ID, "expires_at": datetime.utcnow() + timedelta(minutes=5)})
+        await handler(db, {})
+
+    asyncio.run(run())
+    assert service.last_run is None
+
+
+def dense_fixture():
+    """A small profile x item matrix with distinct weights, so no scores tie"""
+    rng = np.random.default_rng(7)
+    dense = np.where(rng.random((12, 9)) < 0.45, rng.uniform(0.5, 1.0, (12, 9)), 0.0)
+    profile_idx, item_idx = np.nonzero(dense)
+    return dense, profile_idx.astype(np.int64), item_idx.astype(np.int64), dense[profile_idx, item_idx]
+
+
+def dense_neighbours(dense, top_k):
+    co_occurrence = dense.T @ dense
+    norms = np.diag(co_occurrence).copy()
+    similarity = co_occurrence / np.sqrt(np.outer(norms, norms))
+    np.fill_diagonal(similarity, 0)
+    expected = {}
+    for source in range(dense.shape[1]):
+        ranked = [int(item) for item in np.argsort(-similarity[source]) if similarity[source, item] > 0]
+        expected[source] = [(item, similarity[source, item]) for item in ranked[:top_k]]
+    return expected, norms
+
+
+@pytest.mark.parametrize("top_k", [3, 100])
+def test_item_neighbours_match_dense_cosine(top_k):
+    dense, profile_idx, item_idx, weights = dense_fixture()
+    expected, norms = dense_neighbours(dense, top_k)
+    source_mask = np.ones(dense.shape[1], dtype=bool)
+    source_mask[4] = False
+
+    sources, neighbours, scores = build_item_neighbours(profile_idx, item_idx, weights, norms, source_mask, top_k)
+    actual = {}
+    for source, neighbour, score in zip(sources.tolist(), neighbours.tolist(), scores.tolist()):
+        actual.setdefault(source, []).append((neighbour, score))
+    assert set(actual) == {source for source in expected if source != 4 and expected[source]}
+    for source, items in actual.items():
+        assert [item for item, _ in items] == [item for item, _ in expected[source]]
+        assert np.allclose([score for _, score in items], [score for _, score in expected[source]])
+
+
+def test_profile_recommendations_match_dense_scores():
+    dense, profile_idx, item_idx, weights = dense_fixture()
+    expected_neighbours, norms = dense_neighbours(dense, 3)
+    nb_source, nb_neighbour, nb_score = build_item_neighbours(
+        profile_idx, item_idx, weights, norms, np.ones(dense.shape[1], dtype=bool), 3)
+    similarity = np.zeros((dense.shape[1], dense.shape[1]))
+    similarity[nb_source, nb_neighbour] = nb_score
+
+    profiles, items, scores, because = build_profile_recommendations(
+        profile_idx, item_idx, weights, nb_source, nb_neighbour, nb_score, dense.shape[1], 4)
+    expected_scores = dense @ similarity
+    for profile in range(dense.shape[0]):
+        candidates = [item for item in np.argsort(-expected_scores[profile])
+                      if expected_scores[profile, item] > 0 and dense[profile, item] == 0][:4]
+        rows = profiles == profile
+        assert items[rows].tolist() == candidates
+        assert np.allclose(scores[rows], expected_scores[profile, candidates])
+        contributions = dense[profile][:, None] * similarity
+        assert because[rows].tolist() == [int(np.argmax(contributions[:, item])) for item in candidates]
+
+
+def my_list_docs(pairs, added_at):
+    return [{"profile_id": profile_id, "content_id": content_id, "added_at": added_at}
+            for profile_id, content_id in pairs]
+
+
+HISTORY = [("p1", "a"), ("p1", "b"), ("p2", "a"), ("p2", "c"), ("p3", "c"), ("p3", "d"), ("p4", "e"), ("p4", "d")]
+
+
+def test_incremental_build_merges_with_stored_lists(service):
+    async def build(pairs, extra=()):
+        db = MemoryDatabase()
+        await db.my_list.insert_many(my_list_docs(pairs, datetime.utcnow() - timedelta(hours=1)))
+        await service.run(db)
+        if extra:
+            await db.my_list.insert_many(my_list_docs(extra, datetime.utcnow()))
+            await service.run(db)
+        return {doc["_id"]: doc for doc in db.recommendations._docs.values()}
+
+    async def run():
+        incremental = await build(HISTORY, [("p1", "c")])
+        assert service.last_run["mode"] == "incremental"
+        full = await build(HISTORY + [("p1", "c")])
+        # p1's items are rebuilt exactly; "e" kept its stored list
+        for key in ["item:a", "item:b", "item:c", "profile:p1"]:
+            assert incremental[key].get("neighbours", incremental[key].get("items")) == \
+                full[key].get("neighbours", full[key].get("items"))
+        assert incremental["item:e"]["built_at"] < incremental["item:a"]["built_at"]
+        # p3 touches "c", so it is rescored using the stored list of "d"
+        assert [item["content_id"] for item in incremental["profile:p3"]["items"]] == \
+            [item["content_id"] for item in full["profile:p3"]["items"]]
+
+    asyncio.run(run())
+
+
+def test_my_list_removal_triggers_an_incremental_rebuild(service):
+    async def run():
+        db = MemoryDatabase()
+        await db.my_list.insert_many(my_list_docs(HISTORY, datetime.utcnow() - timedelta(hours=1)))
+        await service.run(db)
+        assert "b" in [item["content_id"] for item in await service.get_profile_recommendations(db, "p2")]
+
+        await db.my_list.delete_one({"profile_id": "p1", "content_id": "b"})
+        await service.record_removal(db, "p1", "b")
+        await service.run(db)
+        assert service.last_run["mode"] == "incremental"
+        assert "b" not in [item["content_id"] for item in await service.get_profile_recommendations(db, "p2")]
+        assert await db.recommendations.find_one({"_id": "item:b"}) is None
+
+    asyncio.run(run())
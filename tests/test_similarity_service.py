@@ -0,0 +1,34 @@
+"""
+Content similarity: incremental runs pick up inserts that commit behind the watermark
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from benchmarks.memory_mongo import MemoryDatabase
+from services.similarity_service import SimilarityService
+
+
+def content_doc(content_id: str, created_at: datetime):
+    return {"id": content_id, "genre_ids": [28], "original_language": "en", "vote_average": 7.0,
+            "popularity": 10.0, "release_date": "2001-01-01", "created_at": created_at}
+
+
+def test_incremental_run_rereads_the_overlap_window():
+    async def run():
+        db = MemoryDatabase()
+        service = SimilarityService()
+        start = datetime.utcnow() - timedelta(minutes=5)
+        await db.content.insert_many([content_doc("a", start), content_doc("b", start)])
+        await service.run(db)
+        assert service.last_run["mode"] == "full"
+
+        # Stamped by the writer before the last run started, committed after it finished
+        watermark = (await db.similarity_state.find_one({}))["watermark"]
+        await db.content.insert_one(content_doc("late", watermark - timedelta(seconds=5)))
+        await service.run(db)
+        assert service.last_run["mode"] == "incremental"
+        assert [item["content_id"] for item in await service.get_similar(db, "late")] == ["a", "b"]
+        assert "late" in [item["content_id"] for item in await service.get_similar(db, "a")]
+
+    asyncio.run(run())
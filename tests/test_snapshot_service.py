@@ -0,0 +1,86 @@
+"""
+Snapshot mode: kids filtering from the profiles exported with the snapshot
+"""
+
+import asyncio
+
+import pytest
+
+import services.content_service as content_service_module
+from services.catalog_index import CatalogIndex
+from services.snapshot_service import CatalogSnapshot, SnapshotContentService, build_sections, write_snapshot
+
+
+def content_doc(content_id: str, popularity: float, kids_safe: bool):
+    return {"id": content_id, "title": content_id.title(), "poster_path": f"/{content_id}.jpg",
+            "content_type": "movie", "tmdb_id": popularity, "popularity": popularity, "vote_average": 7.0,
+            "kids_safe": kids_safe, "genre_ids": [16], "genre_names": ["Animation"]}
+
+
+DOCS = [content_doc("cartoon", 10, True), content_doc("thriller", 30, False), content_doc("fable", 20, True)]
+
+
+def load_snapshot(tmp_path, adult_profiles):
+    path = str(tmp_path / "catalog.snapshot")
+    rows = {"trending": ["thriller", "cartoon"]}
+    similar = {"cartoon": ["thriller", "fable"]}
+    write_snapshot(path, build_sections(DOCS, rows, similar, 5, adult_profiles), {"created_at": "now", "count": len(DOCS)})
+    snapshot = CatalogSnapshot()
+    snapshot.load(path)
+    return snapshot
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    index = CatalogIndex()
+    index.load(DOCS)
+    monkeypatch.setattr(content_service_module, "catalog_index", index)
+    snapshot = load_snapshot(tmp_path, ["parent"])
+    yield SnapshotContentService(snapshot)
+    snapshot.close()
+
+
+def ids(items):
+    return [item.id if hasattr(item, "id") else item["id"] for item in items]
+
+
+def test_exported_adult_profiles_see_everything(service):
+    async def run():
+        row = await service.apply_profile_row("parent", await service.get_trending_content())
+        assert ids(row) == ["thriller", "cartoon"]
+        assert ids(await service.get_similar_content("cartoon", profile_id="parent")) == ["thriller", "fable"]
+        assert (await service.browse(profile_id="parent"))["total"] == 3
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("profile_id", ["kid", "created-after-export"])
+def test_other_profiles_only_see_kids_safe_titles(service, profile_id):
+    async def run():
+        row = await service.apply_profile_row(profile_id, await service.get_trending_content(), fill=False)
+        assert ids(row) == ["cartoon"]
+        assert ids(await service.get_similar_content("cartoon", profile_id=profile_id)) == ["fable"]
+        browsed = await service.browse(profile_id=profile_id)
+        assert browsed["total"] == 2
+        assert ids(browsed["results"]) == ["fable", "cartoon"]
+
+    asyncio.run(run())
+
+
+def test_kids_rows_are_topped_up_from_kids_safe_titles(service, monkeypatch):
+    monkeypatch.setattr(content_service_module, "KIDS_MIN_ROW_SIZE", 2)
+
+    async def run():
+        row = await service.apply_profile_row("kid", await service.get_trending_content())
+        assert ids(row) == ["cartoon", "fable"]
+
+    asyncio.run(run())
+
+
+def test_snapshot_without_profiles_treats_every_profile_as_kids(tmp_path):
+    snapshot = load_snapshot(tmp_path, [])
+    try:
+        assert not snapshot.is_adult_profile("parent")
+        assert not SnapshotContentService(snapshot)._kids_only(None)
+    finally:
+        snapshot.close()
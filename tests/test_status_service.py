@@ -0,0 +1,78 @@
+"""
+Status checks: failed batch inserts are retried, and existing collections get their indexes
+"""
+
+import asyncio
+
+from pymongo.errors import AutoReconnect
+
+import services.status_service as status_module
+from benchmarks.memory_mongo import MemoryDatabase
+from models.status import StatusCheck
+from services.status_service import StatusService
+from tests.test_watch_event_service import fail_once
+
+
+def record_checks(service: StatusService, db: MemoryDatabase, count: int):
+    for n in range(count):
+        service._buffer.append(StatusCheck(client_name=f"client-{n}").dict())
+    service._db = db
+
+
+def test_failed_flush_keeps_the_batch_for_the_next_flush():
+    async def run():
+        db = MemoryDatabase()
+        service = StatusService()
+        record_checks(service, db, 3)
+        fail_once(db.status_checks, "insert_many")
+        await service.flush()
+        assert not db.status_checks._docs
+        assert service.flushed == 0
+        await service.flush()
+        assert len(db.status_checks._docs) == 3
+        assert service.flushed == 3
+        assert not service._failed
+
+    asyncio.run(run())
+
+
+def test_retry_buffer_drops_the_oldest_batches_beyond_the_cap(monkeypatch):
+    monkeypatch.setattr(status_module, "STATUS_BATCH_SIZE", 2)
+    monkeypatch.setattr(status_module, "STATUS_RETRY_MAX", 4)
+
+    async def run():
+        db = MemoryDatabase()
+        service = StatusService()
+
+        async def down(*args, **kwargs):
+            raise AutoReconnect("connection refused")
+
+        db.status_checks.insert_many = down
+        record_checks(service, db, 6)
+        await service.flush()
+        assert service.dropped == 2
+        assert [[check["client_name"] for check in batch] for batch in service._failed] == [
+            ["client-2", "client-3"], ["client-4", "client-5"]]
+
+    asyncio.run(run())
+
+
+def test_existing_collection_still_gets_indexes_and_retention():
+    async def run():
+        db = MemoryDatabase()
+        await db.create_collection("status_checks")
+        created = []
+        original = db.status_checks.create_index
+
+        async def create_index(keys, **kwargs):
+            created.append((keys, kwargs))
+            return await original(keys, **kwargs)
+
+        db.status_checks.create_index = create_index
+        await StatusService().ensure_collection(db)
+        return created
+
+    created = asyncio.run(run())
+    assert ([("client_name", 1), ("timestamp", -1)], {}) in created
+    assert ([("timestamp", -1), ("id", -1)], {}) in created
+    assert ([("timestamp", 1)], {"expireAfterSeconds": int(status_module.STATUS_RETENTION_DAYS * 86400)}) in created
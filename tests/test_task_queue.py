@@ -0,0 +1,186 @@
+"""
+Durable task queue: deduplication, retries, lapsed leases and fleet-wide periodic runs
+"""
+
+import asyncio
+import inspect
+from datetime import datetime, timedelta
+
+import pytest
+
+import services.task_queue as task_queue_module
+from benchmarks.memory_mongo import MemoryDatabase
+from services.task_queue import TaskQueue, DONE, FAILED, QUEUED, RUNNING
+
+
+@pytest.fixture(autouse=True)
+def fast_queue(monkeypatch):
+    monkeypatch.setattr(task_queue_module, "TASK_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(task_queue_module, "TASK_QUEUE_ENABLED", True)
+    monkeypatch.setattr(task_queue_module, "backoff_seconds", lambda attempts: 0)
+
+
+async def wait_until(predicate, timeout: float = 2):
+    """Poll a sync or async predicate until it is truthy"""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        result = predicate()
+        if inspect.isawaitable(result):
+            result = await result
+        if result:
+            return
+        assert asyncio.get_running_loop().time() < deadline, "condition not reached"
+        await asyncio.sleep(0.01)
+
+
+def stored_task(name: str, **fields):
+    now = datetime.utcnow()
+    task = {"_id": f"{name}-task", "name": name, "queue": "default", "payload": {}, "priority": 0,
+            "status": QUEUED, "attempts": 0, "max_attempts": 3, "created_at": now, "run_at": now}
+    task.update(fields)
+    return task
+
+
+def test_dedup_key_allows_one_pending_task():
+    db = MemoryDatabase()
+    queue = TaskQueue()
+    runs = []
+
+    async def handler(db, payload):
+        runs.append(payload)
+
+    async def run():
+        queue.register("job", handler)
+        # Enqueue before any worker runs, so the second call sees the first still queued
+        queue._db = db
+        queue._indexes = asyncio.ensure_future(queue.ensure_indexes(db))
+        assert await queue.enqueue("job", {"n": 1}, dedup_key="k")
+        assert await queue.enqueue("job", {"n": 2}, dedup_key="k") is None
+        queue.start(db)
+        await wait_until(lambda: len(runs) == 1)
+        await wait_until(lambda: db.tasks.find_one({"status": DONE}))
+        assert await queue.enqueue("job", {"n": 3}, dedup_key="k")
+        await wait_until(lambda: len(runs) == 2)
+        await queue.stop()
+
+    asyncio.run(run())
+    assert runs == [{"n": 1}, {"n": 3}]
+
+
+def test_failures_are_retried_up_to_max_attempts():
+    db = MemoryDatabase()
+    queue = TaskQueue()
+    calls = []
+
+    async def handler(db, payload):
+        calls.append(1)
+        raise ValueError("boom")
+
+    async def run():
+        queue.register("job", handler)
+        queue.start(db)
+        task_id = await queue.enqueue("job", dedup_key="job", max_attempts=3)
+        await wait_until(lambda: db.tasks.find_one({"_id": task_id, "status": FAILED}))
+        await queue.stop()
+        return await db.tasks.find_one({"_id": task_id})
+
+    task = asyncio.run(run())
+    assert len(calls) == 3
+    assert task["attempts"] == 3
+    assert task["error"] == "ValueError: boom"
+    assert "active_key" not in task
+
+
+def test_lapsed_lease_is_claimed_again():
+    db = MemoryDatabase()
+    queue = TaskQueue()
+    calls = []
+
+    async def handler(db, payload):
+        calls.append(1)
+
+    async def run():
+        queue.register("job", handler)
+        await db.tasks.insert_one(stored_task(
+            "job", status=RUNNING, attempts=1, worker="gone", leased_until=datetime.utcnow() - timedelta(seconds=1)
+        ))
+        queue.start(db)
+        await wait_until(lambda: db.tasks.find_one({"status": DONE}))
+        await queue.stop()
+        return await db.tasks.find_one({})
+
+    task = asyncio.run(run())
+    assert calls == [1]
+    assert task["attempts"] == 2
+    assert task["worker"] == queue.worker_id
+
+
+def test_lapsed_lease_after_the_last_attempt_fails_the_task():
+    db = MemoryDatabase()
+    queue = TaskQueue()
+    calls = []
+
+    async def handler(db, payload):
+        calls.append(1)
+
+    async def run():
+        queue.register("job", handler)
+        await db.tasks.insert_one(stored_task(
+            "job", status=RUNNING, attempts=3, worker="gone", active_key="job",
+            leased_until=datetime.utcnow() - timedelta(seconds=1)
+        ))
+        queue.start(db)
+        await wait_until(lambda: db.tasks.find_one({"status": FAILED}))
+        await queue.stop()
+        return await db.tasks.find_one({})
+
+    task = asyncio.run(run())
+    assert calls == []
+    assert "lease expired" in task["error"]
+    assert "active_key" not in task
+
+
+def test_periodic_task_runs_once_per_interval_across_processes():
+    db = MemoryDatabase()
+    queues = [TaskQueue() for _ in range(3)]
+    calls = []
+
+    async def handler(db, payload):
+        calls.append(1)
+
+    async def run():
+        for queue in queues:
+            queue.register("job", handler, every=60)
+            queue.start(db)
+        await wait_until(lambda: len(calls) >= 1)
+        # Several polls of every process after the run finished
+        await asyncio.sleep(0.2)
+        for queue in queues:
+            await queue.stop()
+
+    asyncio.run(run())
+    assert calls == [1]
+    assert len(db.tasks._docs) == 1
+    (entry,) = db.task_schedule._docs.values()
+    assert entry["next_run"] > datetime.utcnow() + timedelta(seconds=50)
+
+
+def test_interrupted_task_is_handed_back(monkeypatch):
+    monkeypatch.setattr(task_queue_module, "TASK_DRAIN_SECONDS", 0.05)
+    db = MemoryDatabase()
+    queue = TaskQueue()
+
+    async def handler(db, payload):
+        await asyncio.sleep(10)
+
+    async def run():
+        queue.register("job", handler)
+        queue.start(db)
+        await queue.enqueue("job")
+        await wait_until(lambda: db.tasks.find_one({"status": RUNNING}))
+        await queue.stop()
+        return await db.tasks.find_one({})
+
+    task = asyncio.run(run())
+    assert task["status"] == QUEUED
+    assert task["attempts"] == 0
@@ -0,0 +1,209 @@
+"""
+Watch event buffering: failed flushes are retried without losing or double-counting events
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from benchmarks.memory_mongo import MemoryDatabase
+from services.personalization_service import profile_vectors
+from services.watch_event_service import WatchEventService
+
+
+def fail_once(collection, method: str):
+    """Make the next call of a collection method fail as if the connection dropped"""
+    original = getattr(collection, method)
+    calls = {"count": 0}
+
+    async def flaky(*args, **kwargs):
+        calls["count"] += 1
+        if calls["count"] == 1:
+            raise AutoReconnect("connection reset")
+        return await original(*args, **kwargs)
+
+    setattr(collection, method, flaky)
+
+
+async def record(service: WatchEventService, db: MemoryDatabase, progress: float, content_id: str = "c1"):
+    await service.record(db, "p1", content_id, 1, "movie", {"progress": progress})
+
+
+@pytest.fixture
+def db() -> MemoryDatabase:
+    return MemoryDatabase()
+
+
+@pytest.mark.parametrize("collection,method", [
+    ("watch_events", "insert_many"),
+    ("viewing_progress", "bulk_write"),
+    ("watch_daily", "bulk_write"),
+])
+def test_failed_flush_is_retried_once_without_loss(db, collection, method):
+    service = WatchEventService()
+
+    async def run():
+        await record(service, db, 10)
+        await record(service, db, 20, "c2")
+        fail_once(db[collection], method)
+        await service.flush()
+        assert service.has_pending("p1")
+        assert service.flushed == 0
+        await service.flush()
+        assert not service.has_pending("p1")
+
+    asyncio.run(run())
+    assert service.flushed == 2
+    assert len(db.watch_events._docs) == 2
+    progress = {doc["content_id"]: doc["progress"] for doc in db.viewing_progress._docs.values()}
+    assert progress == {"c1": 10, "c2": 20}
+    (daily,) = db.watch_daily._docs.values()
+    assert daily["events"] == 2
+
+
+def test_later_writes_apply_after_the_failed_batch(db):
+    service = WatchEventService()
+
+    async def run():
+        await record(service, db, 10)
+        fail_once(db.viewing_progress, "bulk_write")
+        await service.flush()
+        await record(service, db, 50)
+        assert (await service.get_latest(db, "p1", "c1"))["progress"] == 50
+        await service.flush()
+
+    asyncio.run(run())
+    (view,) = db.viewing_progress._docs.values()
+    assert view["progress"] == 50
+    (daily,) = db.watch_daily._docs.values()
+    assert daily["events"] == 2
+
+
+def test_daily_rollup_counts_a_batch_once(db):
+    service = WatchEventService()
+
+    async def run():
+        await record(service, db, 10)
+        await service.flush()
+        # Replay the rollup step, as if the acknowledgement of the first write had been lost
+        (daily,) = db.watch_daily._docs.values()
+        batch = {"id": daily["batches"][0], "events": [], "views": {}, "daily": {("p1", daily["date"]): [0, 1]},
+                 "count": 1, "written": {"events", "views"}}
+        await service._write_batch(db, batch)
+
+    asyncio.run(run())
+    (daily,) = db.watch_daily._docs.values()
+    assert daily["events"] == 1
+
+
+def test_retry_buffer_drops_oldest_batches_beyond_the_limit(db, monkeypatch):
+    monkeypatch.setattr("services.watch_event_service.WATCH_EVENT_BUFFER_MAX", 2)
+    service = WatchEventService()
+
+    async def failing(*args, **kwargs):
+        raise AutoReconnect("down")
+
+    db.watch_events.insert_many = failing
+
+    async def run():
+        for progress in (10, 20, 30):
+            await record(service, db, progress)
+            await service.flush()
+
+    asyncio.run(run())
+    assert service.dropped == 1
+    assert [batch["count"] for batch in service._pending] == [1, 1]
+
+
+def test_retried_event_insert_does_not_duplicate_events(db):
+    service = WatchEventService()
+    original = db.watch_events.insert_many
+
+    async def partial(documents, **kwargs):
+        # The first event lands, then the connection drops
+        await original(documents[:1], **kwargs)
+        db.watch_events.insert_many = original
+        raise AutoReconnect("connection reset")
+
+    async def run():
+        await service.ensure_collections(db)
+        await record(service, db, 10)
+        await record(service, db, 20, "c2")
+        db.watch_events.insert_many = partial
+        await service.flush()
+        await service.flush()
+
+    asyncio.run(run())
+    assert len(db.watch_events._docs) == 2
+    assert service.flushed == 2
+
+
+def test_daily_upsert_race_still_counts_the_batch(db):
+    service = WatchEventService()
+    original = db.watch_daily.bulk_write
+    raced = []
+
+    async def racing(requests, **kwargs):
+        if not raced:
+            # Another worker creates the same profile-day between our match and insert
+            raced.append(True)
+            (request,) = requests
+            await db.watch_daily.insert_one({"_id": request._filter["_id"], "watch_seconds": 30, "events": 3,
+                                             "batches": ["other-worker"]})
+            raise BulkWriteError({"writeErrors": [{"index": 0, "code": 11000, "errmsg": "E11000"}],
+                                  "writeConcernErrors": []})
+        return await original(requests, **kwargs)
+
+    async def run():
+        await record(service, db, 10)
+        db.watch_daily.bulk_write = racing
+        await service.flush()
+
+    asyncio.run(run())
+    (daily,) = db.watch_daily._docs.values()
+    assert daily["events"] == 4
+    assert len(daily["batches"]) == 2
+    assert not service.has_pending("p1")
+
+
+def test_ensure_collections_dedupes_viewing_progress(db):
+    service = WatchEventService()
+    now = datetime.utcnow()
+
+    async def run():
+        await db.viewing_progress.insert_many([
+            {"profile_id": "p1", "content_id": "c1", "progress": 10, "last_watched": now - timedelta(days=1)},
+            {"profile_id": "p1", "content_id": "c1", "progress": 40, "last_watched": now},
+            {"profile_id": "p1", "content_id": "c2", "progress": 5, "last_watched": now},
+        ])
+        await service.ensure_collections(db)
+        await record(service, db, 60)
+        await service.flush()
+
+    asyncio.run(run())
+    progress = sorted((doc["content_id"], doc["progress"]) for doc in db.viewing_progress._docs.values())
+    assert progress == [("c1", 60), ("c2", 5)]
+    assert "profile_id" in db.watch_daily._indexes
+
+
+def test_profile_vector_is_invalidated_once_progress_is_written(db):
+    service = WatchEventService()
+
+    async def run():
+        await record(service, db, 10)
+        # A rerank before the flush caches a vector built without this event
+        profile_vectors.set("p1", "stale")
+        profile_vectors.set("p2", "other")
+        fail_once(db.viewing_progress, "bulk_write")
+        await service.flush()
+        assert "p1" in profile_vectors
+        await service.flush()
+        assert "p1" not in profile_vectors
+        assert "p2" in profile_vectors
+
+    try:
+        asyncio.run(run())
+    finally:
+        profile_vectors.clear()